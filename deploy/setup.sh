@@ -21,6 +21,8 @@ python3 -m venv $PROJECT_BASE_PATH/env
 # Install python packages
 $PROJECT_BASE_PATH/env/bin/pip install -r $PROJECT_BASE_PATH/requirements.txt
 $PROJECT_BASE_PATH/env/bin/pip install uwsgi==2.0.18
+# ASGI server for deploy/supervisor_users_asgi.conf
+$PROJECT_BASE_PATH/env/bin/pip install uvicorn==0.11.3
 
 # Run migrations and collectstatic
 cd $PROJECT_BASE_PATH
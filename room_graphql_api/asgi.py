@@ -0,0 +1,25 @@
+"""
+ASGI config for room_graphql_api project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.1 (pinned in requirements.txt) handles requests synchronously, so
+the WSGI application is run by asgiref in its thread pool: an ASGI server
+such as uvicorn (``uvicorn room_graphql_api.asgi:application``) serves
+several requests at once from each process. The household change feed at /events/ is served
+from the event loop itself (see users.events.events_application), so open
+feeds do not hold threads.
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'room_graphql_api.settings')
+
+wsgi_application = get_wsgi_application()
+
+from users.events import events_application  # noqa: E402 (needs the apps loaded)
+
+application = events_application(WsgiToAsgi(wsgi_application))
@@ -2,6 +2,7 @@ import graphene
 import graphql_jwt
 
 import users.schema
+from users.auth import ObtainJSONWebToken, Refresh
 
 
 
@@ -10,9 +11,9 @@ class Query(users.schema.Query, graphene.ObjectType):
 
 
 class Mutation(users.schema.Mutation, graphene.ObjectType):
-    token_auth = graphql_jwt.ObtainJSONWebToken.Field()
+    token_auth = ObtainJSONWebToken.Field()
     verify_token = graphql_jwt.Verify.Field()
-    refresh_token = graphql_jwt.Refresh.Field()
+    refresh_token = Refresh.Field()
 
 
 schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
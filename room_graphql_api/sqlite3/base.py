@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''SQLite backend whose transactions take the write lock when they begin.
+
+    Django opens transactions with a deferred BEGIN: two of them that read and
+    then write can deadlock on the lock upgrade, which SQLite resolves by
+    failing one with "database is locked" at once, without waiting for
+    busy_timeout. BEGIN IMMEDIATE makes concurrent writers queue instead.
+    '''
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -1,10 +1,14 @@
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from users.views import RoomGraphQLView, export_view, events_view, metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(RoomGraphQLView.as_view(graphiql=True))),
+    path('export/<str:kind>/', export_view),
+    path('events/', events_view),
+    path('metrics/', metrics_view),
 ]
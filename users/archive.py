@@ -0,0 +1,117 @@
+import threading
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.deletion import Collector
+
+from .models import CompleteTask, BillCycle, ArchivedCompleteTask, ArchivedBillCycle
+
+
+# rows moved per transaction by the archive_history command
+BATCH_SIZE = 500
+
+
+def archive_horizon(today=None):
+    '''Rows dated before this day are archived (ARCHIVE_AFTER_DAYS before `today`).'''
+    return (today or date.today()) - timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365))
+
+
+
+'''----------------------------MOVING----------------------------'''
+
+_state = threading.local()
+
+
+def archiving():
+    '''Whether the current thread is deleting rows it has just copied to the archive.
+
+    Such rows are still part of the history, so their deletes are not sent to
+    the household's change feed (see users.signals.row_deleted).
+    '''
+    return getattr(_state, 'archiving', False)
+
+
+def delete_rows(rows):
+    '''Deletes loaded `rows`, sending the post_delete signals with the instances as loaded.
+
+    QuerySet.delete() would fetch the rows again without their select_related
+    relations, and the BillCycle signals would then query each bill.
+    '''
+    collector = Collector(using=router.db_for_write(type(rows[0])))
+    collector.collect(rows)
+    _state.archiving = True
+    try:
+        collector.delete()
+    finally:
+        _state.archiving = False
+
+
+def archive_complete_tasks(before, batch_size=BATCH_SIZE):
+    '''Moves completed tasks dated before `before` to the archive. Returns the number moved.'''
+    count = 0
+    while True:
+        with transaction.atomic():
+            rows = list(CompleteTask.objects.filter(date__lt=before).order_by('date', 'id')[:batch_size])
+            if not rows:
+                return count
+            ArchivedCompleteTask.objects.bulk_create(
+                ArchivedCompleteTask(id=t.id, name=t.name, roommate_id=t.roommate_id, date=t.date,
+                                     household_id=t.household_id)
+                for t in rows
+            )
+            delete_rows(rows)
+        count += len(rows)
+
+
+def archive_bill_cycles(before, batch_size=BATCH_SIZE):
+    '''Moves cycles paid before `before` to the archive. Returns the number moved.'''
+    count = 0
+    while True:
+        with transaction.atomic():
+            rows = list(BillCycle.objects
+                        .filter(is_paid=True, date_paid__lt=before)
+                        .select_related('bill')
+                        .order_by('date_paid', 'id')[:batch_size])
+            if not rows:
+                return count
+            ArchivedBillCycle.objects.bulk_create(
+                ArchivedBillCycle(id=c.id, bill_id=c.bill_id, recipient_id=c.recipient_id, amount=c.amount,
+                                  date_paid=c.date_paid)
+                for c in rows
+            )
+            delete_rows(rows)
+        count += len(rows)
+
+
+def archive_history(before=None, batch_size=BATCH_SIZE):
+    '''Archives the history older than `before` (default: archive_horizon()).
+
+    Each batch is moved in its own transaction, oldest rows first, so an
+    interrupted run leaves every archived row older than the live ones and
+    can simply be run again.
+    '''
+    before = before or archive_horizon()
+    return {
+        'complete tasks': archive_complete_tasks(before, batch_size),
+        'paid cycles': archive_bill_cycles(before, batch_size),
+    }
+
+
+
+'''----------------------------READING----------------------------'''
+
+def complete_task_history(household_id):
+    '''(live, archived) completed tasks of a household.
+
+    Archived rows are older than every live row, so a history sorted by date
+    continues from one queryset into the other.
+    '''
+    return (CompleteTask.objects.filter(household_id=household_id),
+            ArchivedCompleteTask.objects.filter(household_id=household_id))
+
+
+def paid_cycle_history(household_id):
+    '''(live, archived) paid cycles of a household's bills.'''
+    return (BillCycle.objects.filter(bill__household_id=household_id, is_paid=True, date_paid__isnull=False),
+            ArchivedBillCycle.objects.filter(bill__household_id=household_id))
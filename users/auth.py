@@ -0,0 +1,192 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import graphql_jwt
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from graphql_jwt import backends, settings as jwt_settings
+from graphql_jwt.shortcuts import get_token
+from graphql_jwt.utils import get_authorization_header, get_payload, get_user_by_payload
+
+from .cache import get_cache
+from .models import User
+
+
+# User fields kept in a snapshot
+SNAPSHOT_FIELDS = [f.attname for f in User._meta.concrete_fields]
+
+
+'''----------------------------STAMPS----------------------------'''
+
+def stamp_key(user_id):
+    return 'user:{}:auth'.format(user_id)
+
+
+def user_stamp(user):
+    '''The current stamp of `user` in the shared cache, set from `user` when missing.
+
+    Snapshots remember the stamp they were taken under and are only used while
+    it is still current; changing the user deletes it (see forget_user). The
+    stamp carries a snapshot of its own, for processes that have not loaded
+    the user yet.
+    '''
+    key = stamp_key(user.id)
+    stamp = {'stamp': uuid.uuid4().hex, 'email': user.email, 'household_id': user.household_id,
+             'snapshot': snapshot(user)}
+    get_cache().add(key, stamp, None)
+    return get_cache().get(key) or stamp
+
+
+def forget_user(user_id):
+    '''Makes every process load `user_id` again on its next request.
+
+    Deleted again once the surrounding transaction commits, so a request
+    loading the user concurrently cannot keep the old row under a new stamp.
+    '''
+    get_cache().delete(stamp_key(user_id))
+    transaction.on_commit(lambda: get_cache().delete(stamp_key(user_id)))
+
+
+
+'''----------------------------SNAPSHOTS----------------------------'''
+
+class TokenCache(object):
+    '''Verified tokens of this process and a snapshot of their user, for up to `ttl` seconds.
+
+    Entries never outlive the token's expiry, and the least recently used are
+    dropped past `max_size`.
+    '''
+
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return entry[1:]
+
+    def set(self, token, payload, stamp, snapshot):
+        expires = time.time() + self.ttl
+        if jwt_settings.JWT_VERIFY_EXPIRATION and 'exp' in payload:
+            expires = min(expires, payload['exp'])
+        with self.lock:
+            self.entries[token] = (expires, stamp, snapshot)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    with _token_cache_lock:
+        if _token_cache is None:
+            _token_cache = TokenCache(getattr(settings, 'JWT_USER_CACHE_SECONDS', 60),
+                                      getattr(settings, 'JWT_USER_CACHE_SIZE', 10000))
+        return _token_cache
+
+
+def snapshot(user):
+    return tuple(getattr(user, name) for name in SNAPSHOT_FIELDS)
+
+
+def hydrate(names, values):
+    '''A User built from loaded values, without a query. Fields not in `names` load when first read.'''
+    return User.from_db(DEFAULT_DB_ALIAS, names, values)
+
+
+
+'''----------------------------AUTHENTICATION----------------------------'''
+
+def get_user_by_token(token):
+    '''graphql_jwt.shortcuts.get_user_by_token, skipping what an earlier request already did.
+
+    A token seen in the last JWT_USER_CACHE_SECONDS is not decoded again and
+    its user is rebuilt from a snapshot; one shared cache read checks that the
+    user has not changed since. A first seen token carrying the household claim
+    (see JWT_HOUSEHOLD_CLAIM) gives the user of the stamp's snapshot, when its
+    email and household still match the claim.
+    '''
+    cache = get_token_cache() if getattr(settings, 'JWT_USER_CACHE_SECONDS', 60) else None
+    entry = cache.get(token) if cache is not None else None
+    if entry is not None:
+        stamp, values = entry
+        if get_cache().get(stamp_key(values[0])) == stamp:
+            return hydrate(SNAPSHOT_FIELDS, values)
+
+    payload = get_payload(token)
+    user_id, household_id = payload.get('user_id'), payload.get('household_id', False)
+    if user_id is not None and household_id is not False:
+        stamp = get_cache().get(stamp_key(user_id))
+        if (stamp and stamp['email'] == payload.get(User.USERNAME_FIELD) and stamp['household_id'] == household_id
+                and 'snapshot' in stamp):
+            user = hydrate(SNAPSHOT_FIELDS, stamp['snapshot'])
+            if user.is_active:
+                if cache is not None:
+                    cache.set(token, payload, stamp, stamp['snapshot'])
+                return user
+
+    user = get_user_by_payload(payload)
+    if user is not None and cache is not None:
+        cache.set(token, payload, user_stamp(user), snapshot(user))
+    return user
+
+
+class JSONWebTokenBackend(backends.JSONWebTokenBackend):
+    '''graphql_jwt's backend using the token cache of this module.'''
+
+    def authenticate(self, request=None, **credentials):
+        if request is None:
+            return None
+        token = get_authorization_header(request)
+        if token is None:
+            return None
+        return get_user_by_token(token)
+
+
+
+'''----------------------------TOKENS----------------------------'''
+
+def issue_token(user, **extra):
+    '''A token for `user`, with its id and household id as claims when JWT_HOUSEHOLD_CLAIM is on.'''
+    if getattr(settings, 'JWT_HOUSEHOLD_CLAIM', False):
+        extra.update(user_id=user.id, household_id=user.household_id)
+        # valid until the user changes household or is deleted
+        user_stamp(user)
+    return get_token(user, **extra)
+
+
+class ObtainJSONWebToken(graphql_jwt.ObtainJSONWebToken):
+    @classmethod
+    def mutate(cls, root, info, **kwargs):
+        result = super(ObtainJSONWebToken, cls).mutate(root, info, **kwargs)
+        # the decorator signs in info.context.user
+        result.token = issue_token(info.context.user)
+        return result
+
+
+class Refresh(graphql_jwt.Refresh):
+    @classmethod
+    def refresh(cls, root, info, token, **kwargs):
+        result = super(Refresh, cls).refresh(root, info, token, **kwargs)
+        user = get_user_by_payload(result.payload)
+        result.token = issue_token(user, orig_iat=result.payload['orig_iat'])
+        return result
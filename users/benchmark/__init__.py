@@ -0,0 +1 @@
+'''Reproducible benchmarks of the client's GraphQL operations (see manage.py benchmark).'''
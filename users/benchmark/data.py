@@ -0,0 +1,31 @@
+from users.billing import activate_bills
+from users.models import Household, User
+from users.seed import seed_users, seed_tasks, seed_bills, seed_history
+
+
+'''----------------------------GENERATOR----------------------------'''
+
+def generate_household(roommates=6, tasks=20, bills=12, history=1000, name='Benchmark'):
+    '''Builds a household the size of a busy one, always with the same rows.
+
+    Every roommate is in the rotation of every task, each roommate manages an
+    equal share of the active bills split with everyone else (so each has
+    unpaid cycles), and the household has `history` completed tasks and as
+    many paid cycles.
+    '''
+    household = Household.objects.create(name=name)
+    users = seed_users(household, roommates, name=name.lower())
+    seed_tasks(household, users, tasks)
+    created = []
+    for i, manager in enumerate(users):
+        count = bills // roommates + (1 if i < bills % roommates else 0)
+        if count:
+            created.extend(seed_bills(household, manager, [u for u in users if u != manager], count))
+    activate_bills(created)
+    seed_history(household, users, history)
+    return household, users
+
+
+def delete_household(household):
+    User.objects.filter(household=household).delete()
+    household.delete()
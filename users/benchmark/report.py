@@ -0,0 +1,65 @@
+import json
+import platform
+
+
+def percentile(values, p):
+    '''Nearest-rank percentile of sorted `values`.'''
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def summarize(latencies, elapsed, errors, queries):
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'queries': queries,
+        'errors': errors,
+    }
+
+
+
+'''----------------------------BASELINE----------------------------'''
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine()}
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, baseline, mode, options, results):
+    baseline[mode] = {'environment': environment(), 'options': options, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, tolerance):
+    '''Differences from `baseline` (results of the same mode) that count as regressions.
+
+    Query counts do not depend on the machine, so any increase is one; p95
+    latency and throughput only when worse than `tolerance` (0.25 = 25%).
+    '''
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] is not None and before['queries'] is not None and result['queries'] > before['queries']:
+            found.append('{}: {} queries, baseline {}'.format(name, result['queries'], before['queries']))
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append('{}: p95 {} ms, baseline {} ms'.format(name, result['p95_ms'], before['p95_ms']))
+        if result['throughput'] < before['throughput'] * (1 - tolerance):
+            found.append('{}: {} ops/s, baseline {} ops/s'.format(name, result['throughput'], before['throughput']))
+        if result['errors'] > before['errors']:
+            found.append('{}: {} errors, baseline {}'.format(name, result['errors'], before['errors']))
+    return found
@@ -0,0 +1,105 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import Client
+
+from users.metrics import render_metrics
+
+
+OPERATION_QUERIES = re.compile(r'^graphql_operation_sql_queries_(sum|count)\{type="[^"]*",operation="([^"]*)"\} (\S+)$')
+
+
+def operation_queries(metrics):
+    '''{operation name: [SQL queries, operations]} summed from the text of /metrics/.'''
+    totals = {}
+    for line in metrics.splitlines():
+        match = OPERATION_QUERIES.match(line)
+        if match:
+            kind, operation, value = match.groups()
+            totals.setdefault(operation, [0, 0])[kind == 'count'] += float(value)
+    return totals
+
+
+
+'''----------------------------RUNNERS----------------------------'''
+
+class ClientRunner(object):
+    '''Sends operations through Django's test client, in this process.'''
+    mode = 'client'
+
+    def __init__(self, token):
+        self.headers = {'HTTP_AUTHORIZATION': 'JWT ' + token}
+
+    def post(self, body):
+        # a client per call: the test client is not thread safe
+        response = Client(HTTP_HOST='127.0.0.1').post(
+            '/graphql/', json.dumps(body), content_type='application/json', **self.headers)
+        return response.status_code == 200 and 'errors' not in response.json()
+
+    def metrics(self):
+        return render_metrics()
+
+
+class HTTPRunner(object):
+    '''Sends operations to a running server over HTTP.'''
+    mode = 'server'
+
+    def __init__(self, token, url):
+        self.url = url.rstrip('/')
+        self.headers = {'Content-Type': 'application/json', 'Authorization': 'JWT ' + token}
+
+    def post(self, body):
+        request = urllib.request.Request(self.url + '/graphql/', json.dumps(body).encode(), self.headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return 'errors' not in json.loads(response.read().decode())
+        except OSError:
+            return False
+
+    def metrics(self):
+        with urllib.request.urlopen(self.url + '/metrics/') as response:
+            return response.read().decode()
+
+
+
+'''----------------------------SERVERS----------------------------'''
+
+def server_command(server, port, workers):
+    executable = shutil.which(server) or os.path.join(os.path.dirname(sys.executable), server)
+    if not os.path.exists(executable):
+        raise Exception('{} is not installed'.format(server))
+    if server == 'gunicorn':
+        return [executable, 'room_graphql_api.wsgi:application',
+                '--bind', '127.0.0.1:{}'.format(port), '--workers', str(workers)]
+    return [executable, '--http', '127.0.0.1:{}'.format(port), '--wsgi-file', 'room_graphql_api/wsgi.py',
+            '--processes', str(workers), '--master', '--need-app']
+
+
+@contextmanager
+def serve(server, port=8765, workers=1, timeout=30):
+    '''Runs the app in a local gunicorn or uWSGI process and yields its URL once it answers.'''
+    process = subprocess.Popen(server_command(server, port, workers), cwd=settings.BASE_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:{}'.format(port)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                urllib.request.urlopen(url + '/metrics/').close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise Exception('{} did not start on port {}'.format(server, port))
+                time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
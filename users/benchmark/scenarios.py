@@ -0,0 +1,56 @@
+import os
+from itertools import count
+
+from django.conf import settings
+
+from users.models import Task, BillCycle
+
+
+class Scenario(object):
+    '''One client operation: a query of GRAPHQL_PERSISTED_QUERIES_DIR and the variables of each run.'''
+
+    def __init__(self, name, query_file, variables=None):
+        self.name = name
+        self.query_file = query_file
+        self.variables = variables or (lambda household, user: lambda: None)
+
+    @property
+    def query(self):
+        with open(os.path.join(settings.GRAPHQL_PERSISTED_QUERIES_DIR, self.query_file)) as f:
+            return f.read()
+
+    def runs(self, household, user):
+        '''Returns a function giving the variables of the next run.'''
+        return self.variables(household, user)
+
+
+def task_ids(household, user):
+    '''Completes the household's tasks in turn; weekly tasks are never deleted.'''
+    ids = list(Task.objects.filter(household=household).order_by('id').values_list('id', flat=True))
+    runs = count()
+    return lambda: {'taskId': ids[next(runs) % len(ids)]}
+
+
+def bill_ids(household, user):
+    '''Pays the user's unpaid cycles in turn, marking them unpaid again after each round.'''
+    unpaid = BillCycle.objects.filter(bill__household=household, recipient=user, is_paid=False)
+    cycles = BillCycle.objects.filter(id__in=list(unpaid.values_list('id', flat=True)))
+    ids = sorted(set(cycles.values_list('bill_id', flat=True)))
+    runs = count()
+
+    def variables():
+        run = next(runs)
+        if run and run % len(ids) == 0:
+            cycles.update(is_paid=False, date_paid=None)
+        return {'billId': ids[run % len(ids)]}
+    return variables
+
+
+SCENARIOS = [
+    Scenario('homepage', 'homepage.graphql'),
+    Scenario('tasks', 'tasks.graphql'),
+    Scenario('bills', 'bills.graphql'),
+    Scenario('completeBills', 'complete_bills.graphql'),
+    Scenario('updateTask complete', 'complete_task.graphql', task_ids),
+    Scenario('payBillCycle', 'pay_bill_cycle.graphql', bill_ids),
+]
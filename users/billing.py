@@ -0,0 +1,99 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, ROUND_UP
+
+from django.db import transaction
+
+from .models import Bill, BillCycle
+from .cache import invalidate_household
+from .events import change, row_change, record_changes
+from .ledger import shift_balances, cycle_shares
+
+
+# cycles inserted per INSERT statement
+CYCLE_BATCH_SIZE = 500
+
+
+'''----------------------------ACTIVATION----------------------------'''
+
+def cycle_amount(bill):
+    '''Share of the bill owed by each participant, rounded up to the cent.'''
+    cents = Decimal('.01')
+    return Decimal((bill.total_balance / bill.num_split).quantize(cents, rounding=ROUND_UP))
+
+
+def activate_bills(bills):
+    '''Activates `bills`, creating one unpaid cycle per participant.
+
+    Participants of every bill are read in one query and the cycles are
+    inserted with bulk_create, all in one transaction: either every bill is
+    activated or none is. Bills that are already active are skipped. Returns
+    the created cycles.
+    '''
+    bills = [bill for bill in bills if not bill.is_active]
+    if not bills:
+        return []
+
+    with transaction.atomic():
+        Through = Bill.participants.through
+        participants = defaultdict(list)
+        rows = Through.objects.filter(bill_id__in=[bill.id for bill in bills]).values_list('bill_id', 'user_id')
+        for bill_id, user_id in rows:
+            participants[bill_id].append(user_id)
+
+        cycles = []
+        for bill in bills:
+            if not participants[bill.id]:
+                raise Exception('No roommates splitting bill')
+            amount = cycle_amount(bill)
+            # recipients come from the participants table, only the amount needs checking
+            BillCycle(bill=bill, amount=amount).clean_fields(exclude=['bill', 'recipient'])
+            cycles.extend(
+                BillCycle(bill=bill, recipient_id=user_id, amount=amount)
+                for user_id in participants[bill.id]
+            )
+
+        # only flips bills still inactive, so a concurrent activation cannot duplicate cycles
+        activated = Bill.objects.filter(id__in=[bill.id for bill in bills], is_active=False).update(is_active=True)
+        if activated != len(bills):
+            raise Exception('Bill is already active')
+        BillCycle.objects.bulk_create(cycles, batch_size=CYCLE_BATCH_SIZE)
+        shift_balances(cycle_shares(cycles), 1)
+        for bill in bills:
+            bill.is_active = True
+
+        # bulk writes bypass the post_save signals
+        for household_id in {bill.household_id for bill in bills}:
+            invalidate_household(household_id)
+        # cycle ids are only known on PostgreSQL, so clients refetch the cycles of each bill
+        for bill in bills:
+            record_changes(bill.household_id, [row_change(bill, 'update', ['is_active']),
+                                               change('cycles', 'update', bill.id)])
+    return cycles
+
+
+def activate_bill(bill):
+    return activate_bills([bill])
+
+
+def due_bills(today=None):
+    '''Inactive bills with participants and a balance whose due date has arrived.
+
+    A closed bill has no balance until its manager enters the next amount, so
+    it is not activated before then.
+    '''
+    bills = Bill.objects.filter(is_active=False, due_date__lte=today or date.today(), total_balance__gt=0)
+    return bills.filter(participants__isnull=False).distinct()
+
+
+def activate_due_bills(household=None, today=None):
+    '''Activates every due bill (see due_bills), of one household if given.
+
+    Returns the number of bills activated.
+    '''
+    bills = due_bills(today)
+    if household is not None:
+        bills = bills.filter(household=household)
+    bills = list(bills)
+    activate_bills(bills)
+    return len(bills)
@@ -0,0 +1,250 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, When, Value
+
+from .models import User, Task, RotationMember, CompleteTask, BillCycle
+from .cache import invalidate_household
+from .events import change, row_change, record_changes
+from .ledger import shift_balances, cycle_shares
+from .recurrence import next_due_date, next_in_rotation
+from .rotation import unique, update_rotation, reorder_rotation
+
+
+def update_rows(model, rows, fields, batch_size=500):
+    '''Saves `fields` of `rows` with one UPDATE per batch.
+
+    Each field is set with a CASE on the primary key, like QuerySet.bulk_update
+    (which only arrives in Django 2.2).
+    '''
+    fields = [model._meta.get_field(name) for name in fields]
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        model.objects.filter(pk__in=[row.pk for row in batch]).update(**{
+            field.attname: Case(
+                *[When(pk=row.pk, then=Value(getattr(row, field.attname), output_field=field)) for row in batch],
+                output_field=field
+            )
+            for field in fields
+        })
+
+
+def error_message(error):
+    if isinstance(error, ValidationError):
+        return '; '.join(error.messages)
+    return str(error)
+
+
+def rotations_of(task_ids):
+    '''(position, user id) members of each task's rotation, in order, in one query.'''
+    rotations = defaultdict(list)
+    rows = RotationMember.objects.filter(task_id__in=task_ids).order_by('task_id', 'position')
+    for task_id, position, user_id in rows.values_list('task_id', 'position', 'user_id'):
+        rotations[task_id].append((position, user_id))
+    return rotations
+
+
+def position_of(members, user_id):
+    return next((position for position, member in members if member == user_id), None)
+
+
+
+'''----------------------------TASKS----------------------------'''
+
+def create_tasks(user, items):
+    '''Creates a task of the user's household for each item of CreateTask arguments.
+
+    Returns a (task, error) pair per item; items with errors are not created.
+    '''
+    results = []
+    with transaction.atomic():
+        user_ids = {item['current'] for item in items if item.get('current')}
+        user_ids.update(i for item in items for i in item.get('rotation') or [])
+        users = User.objects.in_bulk(user_ids)
+
+        created, members = [], []
+        for item in items:
+            try:
+                unknown = sorted(i for i in [item.get('current')] + list(item.get('rotation') or []) if i and i not in users)
+                if unknown:
+                    raise Exception('Unknown user ids: {}'.format(', '.join(str(i) for i in unknown)))
+                next_due_date(date.today(), item['frequency'])  # rejects invalid frequencies
+                task = Task(
+                    name=item['name'],
+                    description=item['description'],
+                    due_date=datetime.strptime(item['due_date'], '%d%m%Y').date(),
+                    frequency=item['frequency'],
+                    current=users.get(item.get('current')),
+                    household_id=user.household_id,
+                )
+                task.clean_fields(exclude=['current', 'household'])
+            except Exception as e:
+                results.append((None, error_message(e)))
+                continue
+
+            rotation = unique(item.get('rotation') or [])
+            if task.current_id in rotation:
+                task.rotation_position = rotation.index(task.current_id)
+            # bulk_create only returns primary keys on PostgreSQL, and members need them
+            task.save()
+            members.extend(
+                RotationMember(task=task, user_id=user_id, position=position)
+                for position, user_id in enumerate(rotation)
+            )
+            created.append(task)
+            results.append((task, None))
+
+        RotationMember.objects.bulk_create(members)
+        if created:
+            invalidate_household(user.household_id)
+            # the tasks themselves are sent by their post_save signal
+            record_changes(user.household_id, [
+                change('rotation', 'update', task_id) for task_id in unique(m.task_id for m in members)
+            ])
+    return results
+
+
+def update_tasks(user, items):
+    '''Applies UpdateTask inputs to tasks of the user's household.
+
+    Fields are applied in memory and saved with one UPDATE per batch; completed
+    tasks are logged with one bulk insert and handed over to the next roommate
+    of their rotation. Returns a (task, error) pair per item; items with errors
+    are left untouched.
+    '''
+    results = [None] * len(items)
+    with transaction.atomic():
+        tasks = Task.objects.filter(
+            id__in=[item['task_id'] for item in items], household_id=user.household_id
+        ).select_related('current').in_bulk()
+        users = User.objects.in_bulk({item['current'] for item in items if item.get('current')})
+
+        accepted, seen = [], set()
+        for i, item in enumerate(items):
+            task = tasks.get(item['task_id'])
+            if task is None:
+                results[i] = (None, 'Task {} does not exist'.format(item['task_id']))
+                continue
+            if task.id in seen:
+                results[i] = (None, 'Task {} is listed more than once'.format(task.id))
+                continue
+            seen.add(task.id)
+
+            try:
+                for k, v in item.items():
+                    if v is None or k in ('task_id', 'complete', 'add_rotation', 'remove_rotation', 'rotation_order'):
+                        continue
+                    elif k == 'due_date':
+                        task.due_date = datetime.strptime(v, '%d%m%Y').date()
+                    elif k == 'current':
+                        if v not in users:
+                            raise Exception('Unknown user ids: {}'.format(v))
+                        task.current = users[v]
+                    else:
+                        setattr(task, k, v)
+                next_due_date(task.due_date, task.frequency)
+                task.clean_fields(exclude=['current', 'household'])
+                if item.get('complete') and task.current_id is None:
+                    # the completion is logged under the current roommate
+                    raise Exception('Task {} has no current roommate'.format(task.id))
+
+                # rotation edits are set based per task; a failing one only rolls back its task
+                if any(item.get(k) is not None for k in ('add_rotation', 'remove_rotation', 'rotation_order')):
+                    with transaction.atomic():
+                        update_rotation(task, item.get('add_rotation'), item.get('remove_rotation'))
+                        if item.get('rotation_order') is not None:
+                            reorder_rotation(task, item['rotation_order'])
+            except Exception as e:
+                results[i] = (None, error_message(e))
+                task.refresh_from_db()  # drop the changes made before the error
+                continue
+            accepted.append((i, task, item))
+
+        rotations = rotations_of([task.id for _, task, _ in accepted])
+        done, deleted, changed = [], [], []
+        for i, task, item in accepted:
+            members = rotations[task.id]
+            if item.get('current') is not None:
+                task.rotation_position = position_of(members, task.current_id)
+            if item.get('complete'):
+                done.append(CompleteTask(
+                    name=task.name,
+                    roommate=task.current,
+                    date=date.today(),
+                    household_id=task.household_id,
+                ))
+                next_date = next_due_date(task.due_date, task.frequency)
+                if next_date is None:
+                    deleted.append(task.id)
+                    task.name = 'deleted'
+                    results[i] = (task, None)
+                    continue
+                task.due_date = next_date
+                member = next_in_rotation(members, task.rotation_position)
+                if member is not None:
+                    task.rotation_position, task.current_id = member
+                    Task.current.field.delete_cached_value(task)
+            if item.get('complete') is not None:
+                task.complete = False
+            changed.append(task)
+            results[i] = (task, None)
+
+        CompleteTask.objects.bulk_create(done)
+        update_rows(Task, changed, ['name', 'description', 'due_date', 'frequency', 'complete',
+                                    'current', 'rotation_position'])
+        if deleted:
+            Task.objects.filter(id__in=deleted).delete()
+        if accepted:
+            invalidate_household(user.household_id)
+            # ids of the logged completions are only known on PostgreSQL
+            record_changes(user.household_id, [row_change(task, 'update') for task in changed] +
+                                              [row_change(task, 'create') for task in done])
+    return results
+
+
+def delete_tasks(user, task_ids):
+    '''Deletes tasks of the user's household. Returns an error (or None) per id.'''
+    with transaction.atomic():
+        found = set(Task.objects.filter(id__in=task_ids, household_id=user.household_id).values_list('id', flat=True))
+        if found:
+            Task.objects.filter(id__in=found).delete()
+    return [None if task_id in found else 'Task {} does not exist'.format(task_id) for task_id in task_ids]
+
+
+
+'''----------------------------BILLS----------------------------'''
+
+def pay_bill_cycles(user, bill_ids):
+    '''Pays the user's unpaid cycle of each bill with one UPDATE.
+
+    Returns a (cycle, error) pair per bill id.
+    '''
+    with transaction.atomic():
+        cycles = {}
+        for cycle in (BillCycle.objects
+                      .select_for_update()
+                      .filter(bill_id__in=bill_ids, recipient=user, is_paid=False)
+                      .select_related('bill')
+                      .order_by('id')):
+            cycles.setdefault(cycle.bill_id, cycle)
+
+        today = date.today()
+        BillCycle.objects.filter(id__in=[c.id for c in cycles.values()]).update(is_paid=True, date_paid=today)
+        for cycle in cycles.values():
+            cycle.is_paid, cycle.date_paid = True, today
+        shift_balances(cycle_shares(cycles.values()), -1)
+        for household_id in {c.bill.household_id for c in cycles.values()}:
+            invalidate_household(household_id)
+        for cycle in cycles.values():
+            record_changes(cycle.bill.household_id, [row_change(cycle, 'update', ['is_paid', 'date_paid'])])
+
+    results, paid = [], set()
+    for bill_id in bill_ids:
+        if bill_id in cycles and bill_id not in paid:
+            paid.add(bill_id)
+            results.append((cycles[bill_id], None))
+        else:
+            results.append((None, 'No unpaid cycle of bill {}'.format(bill_id)))
+    return results
@@ -0,0 +1,107 @@
+import json
+import threading
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+# root fields whose result only depends on the user and their household
+HOUSEHOLD_FIELDS = {
+    'me',
+    'homepage',
+    'tasks',
+    'bills',
+    'completeTasks',
+    'completeTasksConnection',
+    'completeBills',
+    'completeBillsConnection',
+    'balances',
+}
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'GRAPHQL_CACHE_ALIAS', 'default')]
+
+
+'''----------------------------VERSIONS----------------------------'''
+
+def version_key(household_id):
+    return 'household:{}:version'.format(household_id)
+
+
+def household_version(household_id):
+    return get_cache().get_or_set(version_key(household_id), 1, None)
+
+
+def bump_household_version(household_id):
+    cache = get_cache()
+    key = version_key(household_id)
+    try:
+        cache.incr(key)
+    except ValueError:  # not cached yet (or evicted)
+        cache.set(key, 2, None)
+
+
+def invalidate_household(household_id):
+    '''Drops every cached response of a household.
+
+    The version is bumped right away and again once the surrounding
+    transaction commits, so a read that races the transaction cannot leave
+    pre-commit data cached under the new version.
+    '''
+    if household_id is None:
+        return
+    bump_household_version(household_id)
+    pin_household(household_id)
+    transaction.on_commit(lambda: bump_household_version(household_id))
+    transaction.on_commit(lambda: pin_household(household_id))
+
+
+
+'''----------------------------READ YOUR WRITES----------------------------'''
+
+def pinned_key(household_id):
+    return 'household:{}:pinned'.format(household_id)
+
+
+def pin_household(household_id):
+    '''Keeps the reads of a household on the primary for READ_YOUR_WRITES_SECONDS (see users.routers).'''
+    get_cache().set(pinned_key(household_id), True, getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5))
+
+
+def is_pinned(household_id):
+    return bool(get_cache().get(pinned_key(household_id)))
+
+
+
+'''----------------------------RESPONSES----------------------------'''
+
+def response_key(household_id, user_id, query, variables, operation_name):
+    digest = sha256(json.dumps([query, variables, operation_name], sort_keys=True).encode()).hexdigest()
+    return 'graphql:{}:{}:{}:{}'.format(household_id, household_version(household_id), user_id, digest)
+
+
+def get_response(key):
+    response = get_cache().get(key)
+    with _stats_lock:
+        _stats['hits' if response is not None else 'misses'] += 1
+    return response
+
+
+def set_response(key, response):
+    get_cache().set(key, response, getattr(settings, 'GRAPHQL_CACHE_TIMEOUT', 300))
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
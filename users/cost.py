@@ -0,0 +1,180 @@
+from django.conf import settings
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull
+from graphql.validation import validate
+
+
+# expected number of items returned by list fields, by 'Type.field'
+LIST_SIZES = {
+    'Query.users':                  100,
+    'Query.households':             100,
+    'Query.homepage':               8,
+    'Query.tasks':                  50,
+    'Query.completeTasks':          500,
+    'Query.bills':                  2,
+    'Query.completeBills':          500,
+    'Query.balances':               8,
+    'BillListType.data':            20,
+    'CycleListType.data':           20,
+    'HouseholdType.users':          8,
+    'HouseholdType.tasks':          50,
+    'HouseholdType.completeTasks':  500,
+    'HouseholdType.bills':          20,
+    'UserType.current':             10,
+    'UserType.rotation':            20,
+    'UserType.manager':             10,
+    'UserType.participants':        20,
+    'UserType.billcycleSet':        100,
+    'UserType.completetaskSet':     100,
+    'TaskType.rotation':            8,
+    'BillType.participants':        8,
+    'BillType.cycles':              8,
+}
+
+# cost of resolving one object of a field, by 'Type.field' (default 1, scalars 0)
+FIELD_COSTS = {}
+
+# every mutation writes, so it weighs more than a read
+MUTATION_COST = 10
+
+
+'''----------------------------ANALYSIS----------------------------'''
+
+class OperationCost(object):
+    def __init__(self, cost, depth):
+        self.cost = cost
+        self.depth = depth
+
+    def __repr__(self):
+        return 'OperationCost(cost={}, depth={})'.format(self.cost, self.depth)
+
+
+def literal_int(node, name):
+    for argument in node.arguments or []:
+        if argument.name.value == name:
+            if isinstance(argument.value, ast.IntValue):
+                return int(argument.value.value)
+            # a variable: assume the largest page it could ask for
+            return getattr(settings, 'GRAPHQL_MAX_PAGE_SIZE', 100)
+    return None
+
+
+class CostAnalyzer(object):
+    '''Estimates the cost and depth of each operation of a validated document.
+
+    The cost of an object field is its per-object cost plus the cost of its
+    selections, multiplied by the expected size of the list it returns.
+    Connection edges use the `first`/`last` argument of the connection.
+    '''
+
+    def __init__(self, schema, document_ast):
+        self.schema = schema
+        self.fragments = {
+            d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)
+        }
+        self.operations = [d for d in document_ast.definitions if isinstance(d, ast.OperationDefinition)]
+
+    def analyze(self):
+        costs = {}
+        for operation in self.operations:
+            if operation.operation == 'mutation':
+                root = self.schema.get_mutation_type()
+            elif operation.operation == 'subscription':
+                root = self.schema.get_subscription_type()
+            else:
+                root = self.schema.get_query_type()
+            name = operation.name.value if operation.name else None
+            costs[name] = OperationCost(*self.selection_cost(root, operation.selection_set, 0, None))
+        return costs
+
+    def selection_cost(self, parent_type, selection_set, depth, page_size):
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                field_cost, field_depth = self.field_cost(parent_type, selection, depth, page_size)
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                field_cost, field_depth = self.selection_cost(fragment_type, selection.selection_set, depth, page_size)
+            else:
+                fragment = self.fragments[selection.name.value]
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                field_cost, field_depth = self.selection_cost(fragment_type, fragment.selection_set, depth, page_size)
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def field_cost(self, parent_type, node, depth, page_size):
+        name = node.name.value
+        field = getattr(parent_type, 'fields', {}).get(name)
+        if field is None or node.selection_set is None:
+            return 0, depth  # scalars and introspection fields are free
+
+        key = '{}.{}'.format(parent_type.name, name)
+        if parent_type is self.schema.get_mutation_type():
+            own_cost = FIELD_COSTS.get(key, MUTATION_COST)
+        else:
+            own_cost = FIELD_COSTS.get(key, 1)
+
+        field_type, lists = field.type, 0
+        while isinstance(field_type, (GraphQLList, GraphQLNonNull)):
+            if isinstance(field_type, GraphQLList):
+                lists += 1
+            field_type = field_type.of_type
+
+        if name == 'edges' and page_size is not None:
+            multiplier = page_size
+        elif lists:
+            multiplier = LIST_SIZES.get(key, getattr(settings, 'GRAPHQL_DEFAULT_LIST_SIZE', 10) ** lists)
+        else:
+            multiplier = 1
+
+        # given both, the page is the last `last` of the first `first` rows
+        sizes = [size for size in (literal_int(node, 'first'), literal_int(node, 'last')) if size is not None]
+        child_page_size = min(sizes) if sizes else None
+        if child_page_size is None and field_type.name.endswith('Connection'):
+            child_page_size = getattr(settings, 'GRAPHQL_PAGE_SIZE', 20)
+        child_cost, child_depth = self.selection_cost(field_type, node.selection_set, depth + 1, child_page_size)
+        return multiplier * (own_cost + child_cost), child_depth
+
+
+def validate_document(schema, document_ast):
+    '''Runs the standard validation rules, then the cost and depth limits.
+
+    Returns (errors, costs) where costs maps operation names to their
+    OperationCost; costs is None when the document is invalid.
+    '''
+    errors = validate(schema, document_ast)
+    if errors:
+        return errors, None
+
+    costs = CostAnalyzer(schema, document_ast).analyze()
+    max_cost = getattr(settings, 'GRAPHQL_MAX_COST', None)
+    max_depth = getattr(settings, 'GRAPHQL_MAX_DEPTH', None)
+    for name, cost in costs.items():
+        label = name or 'anonymous'
+        if max_depth is not None and cost.depth > max_depth:
+            errors.append(GraphQLError(
+                'Operation {} is {} levels deep, the limit is {}'.format(label, cost.depth, max_depth)))
+        if max_cost is not None and cost.cost > max_cost:
+            errors.append(GraphQLError(
+                'Operation {} has an estimated cost of {}, the limit is {}'.format(label, cost.cost, max_cost)))
+    return errors, costs
+
+
+def rejected(errors, *args, **kwargs):
+    '''Execute function of a document that failed validation.'''
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+def operation_cost(document, operation_name=None):
+    '''Returns the OperationCost of the operation a request will run, if known.'''
+    costs = getattr(document, 'costs', None)
+    if not costs:
+        return None
+    if operation_name is None and len(costs) == 1:
+        return next(iter(costs.values()))
+    return costs.get(operation_name)
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql.backend import GraphQLBackend, GraphQLDocument
+from graphql.backend.core import execute_and_validate
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.language.printer import print_ast
+
+from .cost import rejected, validate_document
+
+
+class DocumentCacheBackend(GraphQLBackend):
+    '''Keeps the most recently used parsed and validated documents.
+
+    Documents are keyed by schema and query text. A cached document was
+    validated when it was stored, so executing it runs neither parse nor
+    validate. Invalid queries, including those over the cost limits (see
+    users.cost), are not cached and report their errors without executing.
+    '''
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def document_from_string(self, schema, request_string):
+        if isinstance(request_string, ast.Document):
+            request_string = print_ast(request_string)
+        key = (schema, request_string)
+
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        document_ast = parse(request_string)
+        errors, costs = validate_document(schema, document_ast)
+        if errors:
+            return GraphQLDocument(
+                schema=schema,
+                document_string=request_string,
+                document_ast=document_ast,
+                execute=partial(rejected, errors),
+            )
+
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=request_string,
+            document_ast=document_ast,
+            execute=partial(execute_and_validate, schema, document_ast, validate=False),
+        )
+        document.costs = costs
+        if self.max_size > 0:
+            with self.lock:
+                self.documents[key] = document
+                while len(self.documents) > self.max_size:
+                    self.documents.popitem(last=False)
+        return document
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.documents),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.hits = self.misses = 0
+
+
+_document_cache = None
+_document_cache_lock = threading.Lock()
+
+
+def get_document_cache():
+    '''Returns the process-wide document cache sized by GRAPHQL_DOCUMENT_CACHE_SIZE.'''
+    global _document_cache
+    with _document_cache_lock:
+        if _document_cache is None:
+            _document_cache = DocumentCacheBackend(getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 256))
+        return _document_cache
@@ -0,0 +1,373 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils.module_loading import import_string
+
+from .models import User, Task, CompleteTask, Bill, BillCycle
+
+
+# fields sent with the changes of each model: GraphQL type, [(attname, GraphQL field)]
+FIELDS = {
+    Task: ('task', [('name', 'name'), ('description', 'description'), ('due_date', 'dueDate'),
+                    ('frequency', 'frequency'), ('complete', 'complete'), ('current_id', 'current')]),
+    CompleteTask: ('completeTask', [('name', 'name'), ('roommate_id', 'roommate'), ('date', 'date')]),
+    Bill: ('bill', [('name', 'name'), ('total_balance', 'totalBalance'), ('due_date', 'dueDate'),
+                    ('frequency', 'frequency'), ('is_active', 'isActive'), ('manager_id', 'manager')]),
+    BillCycle: ('billCycle', [('bill_id', 'bill'), ('recipient_id', 'recipient'), ('amount', 'amount'),
+                              ('is_paid', 'isPaid'), ('date_paid', 'datePaid')]),
+    User: ('user', [('first_name', 'firstName'), ('last_name', 'lastName'), ('status', 'status')]),
+}
+
+RESET = b'event: reset\ndata: {}\n\n'
+KEEP_ALIVE = b': keep-alive\n\n'
+
+
+'''----------------------------CHANGES----------------------------'''
+
+def change(kind, op, id, fields=None):
+    '''One entry of a change message: `op` is create, update or delete of the `kind` row `id`.
+
+    `fields` hold the new values of the fields that may have changed. Kinds
+    without fields (rotation, participants) tell the client to refetch them.
+    '''
+    entry = {'type': kind, 'op': op, 'id': id}
+    if fields:
+        entry['fields'] = fields
+    return entry
+
+
+def row_change(row, op, attnames=None):
+    '''The change of a model instance, with every field of FIELDS or only `attnames`.'''
+    kind, fields = FIELDS[type(row)]
+    if op == 'delete':
+        return change(kind, op, row.pk)
+    return change(kind, op, row.pk, {
+        name: getattr(row, attname) for attname, name in fields if attnames is None or attname in attnames
+    })
+
+
+class Batch(object):
+    '''Changes made in one transaction, published once it commits.'''
+
+    def __init__(self):
+        self.changes = defaultdict(list)
+        # the bound method registered with on_commit, to find it there again
+        self.callback = self.publish
+
+    def publish(self):
+        if getattr(_pending, 'batch', None) is self:
+            _pending.batch = None
+        for household_id, changes in self.changes.items():
+            publish_changes(household_id, changes)
+
+
+_pending = threading.local()
+
+
+def record_changes(household_id, changes):
+    '''Queues `changes` of a household for its subscribers once the current transaction commits.
+
+    Changes of one transaction go out as one message per household; those of
+    a transaction that rolls back are never sent.
+    '''
+    if household_id is None or not changes:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        publish_changes(household_id, changes)
+        return
+    batch = getattr(_pending, 'batch', None)
+    if batch is None or not any(func is batch.callback for _, func in connection.run_on_commit):
+        batch = _pending.batch = Batch()
+        transaction.on_commit(batch.callback)
+    batch.changes[household_id].extend(changes)
+
+
+def record_change(household_id, entry):
+    record_changes(household_id, [entry])
+
+
+def publish_changes(household_id, changes):
+    message = {'changes': compact(changes)}
+    get_broker().publish(household_id, json.dumps(message, default=str, separators=(',', ':')))
+
+
+def compact(changes):
+    '''`changes` with one entry per row: later updates are merged into the first, a delete replaces them.'''
+    entries = OrderedDict()
+    for entry in changes:
+        # rows created in bulk may have no id yet
+        key = (entry['type'], entry['id']) if entry['id'] is not None else object()
+        previous = entries.get(key)
+        if previous is None or 'delete' in (entry['op'], previous['op']):
+            entries[key] = entry
+        else:
+            entries[key] = change(previous['type'], previous['op'], previous['id'],
+                                  dict(previous.get('fields') or {}, **(entry.get('fields') or {})))
+    return list(entries.values())
+
+
+
+'''----------------------------BROKERS----------------------------'''
+
+class Broker(object):
+    '''Delivers the change messages of each household to the subscribers of this process.
+
+    A subscriber has a `deliver(frame)` method that must not block, or a
+    `loop` attribute and a `put(frame)` method called in that asyncio loop.
+    The LocalBroker only reaches subscribers of the process publishing; a
+    deployment with several processes needs a broker relaying messages between
+    them (e.g. over Redis pub/sub) set as EVENTS_BROKER.
+    '''
+
+    def publish(self, household_id, data):
+        raise NotImplementedError
+
+    def subscribe(self, household_id, subscriber, last_id=None):
+        raise NotImplementedError
+
+    def unsubscribe(self, household_id, subscriber):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    '''In-process broker keeping the last `history_size` messages of each household for resuming clients.'''
+
+    def __init__(self, history_size=100):
+        self.subscribers = defaultdict(set)
+        self.history = defaultdict(lambda: deque(maxlen=history_size))
+        self.last_ids = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def publish(self, household_id, data):
+        with self.lock:
+            self.last_ids[household_id] += 1
+            event_id = self.last_ids[household_id]
+            # encoded once for every subscriber
+            frame = 'id: {}\nevent: changes\ndata: {}\n\n'.format(event_id, data).encode()
+            self.history[household_id].append((event_id, frame))
+            subscribers = list(self.subscribers.get(household_id, ()))
+        deliver(subscribers, frame)
+
+    def subscribe(self, household_id, subscriber, last_id=None):
+        with self.lock:
+            self.subscribers[household_id].add(subscriber)
+            if last_id is None:
+                return
+            history = self.history.get(household_id) or ()
+            oldest = history[0][0] if history else self.last_ids[household_id] + 1
+            if last_id > self.last_ids[household_id] or last_id < oldest - 1:
+                # missed messages are gone (or the id is from before a restart)
+                missed = [RESET]
+            else:
+                missed = [frame for event_id, frame in history if event_id > last_id]
+            # before any message published once the lock is released
+            for frame in missed:
+                deliver([subscriber], frame)
+
+    def unsubscribe(self, household_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(household_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[household_id]
+
+
+def deliver(subscribers, frame):
+    '''Hands `frame` to `subscribers`, waking each asyncio loop once for all of its subscribers.'''
+    loops = defaultdict(list)
+    for subscriber in subscribers:
+        loop = getattr(subscriber, 'loop', None)
+        if loop is None:
+            subscriber.deliver(frame)
+        else:
+            loops[loop].append(subscriber)
+    for loop, group in loops.items():
+        try:
+            loop.call_soon_threadsafe(put_all, group, frame)
+        except RuntimeError:
+            pass  # loop closed, its subscribers are gone
+
+
+def put_all(subscribers, frame):
+    for subscriber in subscribers:
+        subscriber.put(frame)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            broker_class = import_string(getattr(settings, 'EVENTS_BROKER', 'users.events.LocalBroker'))
+            _broker = broker_class(getattr(settings, 'EVENTS_HISTORY_SIZE', 100))
+        return _broker
+
+
+
+'''----------------------------SUBSCRIBERS----------------------------'''
+
+class QueueSubscriber(object):
+    '''Frames queued for a thread; past `max_size` unread frames they are replaced by a reset.'''
+
+    def __init__(self, max_size=100):
+        self.queue = queue.Queue(max_size)
+        self.lock = threading.Lock()
+
+    def deliver(self, frame):
+        with self.lock:
+            try:
+                self.queue.put_nowait(frame)
+            except queue.Full:
+                clear(self.queue, queue.Empty)
+                self.queue.put_nowait(RESET)
+
+    def get(self, timeout=None):
+        '''The next frame, or None after `timeout` seconds without one.'''
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscriber(object):
+    '''Frames queued for a coroutine of `loop`; past `max_size` unread frames they are replaced by a reset.'''
+
+    def __init__(self, loop, max_size=100):
+        self.loop = loop
+        self.queue = asyncio.Queue(max_size, loop=loop)
+        self.closed = False
+
+    def put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            clear(self.queue, asyncio.QueueEmpty)
+            self.queue.put_nowait(RESET)
+
+    def close(self):
+        '''Wakes the coroutine waiting in get(), which then returns None.'''
+        self.closed = True
+        clear(self.queue, asyncio.QueueEmpty)
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def clear(frames, empty):
+    try:
+        while True:
+            frames.get_nowait()
+    except empty:
+        pass
+
+
+
+'''----------------------------STREAMS----------------------------'''
+
+def queue_size():
+    return getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+
+
+def heartbeat():
+    return getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+
+
+def parse_last_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_stream(household_id, last_id=None):
+    '''Yields the frames of a household's change feed, with keep-alive comments, until closed.'''
+    broker, subscriber = get_broker(), QueueSubscriber(queue_size())
+    broker.subscribe(household_id, subscriber, last_id)
+    try:
+        # the feed runs no queries; do not hold the request's connections open for hours
+        connections.close_all()
+        yield b'retry: 5000\n\n'
+        while True:
+            yield subscriber.get(heartbeat()) or KEEP_ALIVE
+    finally:
+        broker.unsubscribe(household_id, subscriber)
+
+
+def authenticated_user(authorization):
+    '''The user of an `Authorization: JWT <token>` header value, or None.'''
+    from graphql_jwt import settings as jwt_settings
+    from graphql_jwt.exceptions import GraphQLJWTError
+    from .auth import get_user_by_token
+
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != jwt_settings.JWT_AUTH_HEADER_PREFIX.lower():
+        return None
+    close_old_connections()
+    try:
+        return get_user_by_token(parts[1])
+    except GraphQLJWTError:
+        return None
+    finally:
+        close_old_connections()
+
+
+def events_application(application, path='/events/'):
+    '''Wraps an ASGI application to serve the change feed at `path` from the event loop.
+
+    Unlike events_view, an open feed holds no thread: thousands of clients
+    wait on one loop, and a publish wakes it once.
+    '''
+    from asgiref.sync import sync_to_async
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != path:
+            return await application(scope, receive, send)
+
+        headers = dict(scope['headers'])
+        user = await sync_to_async(authenticated_user)(headers.get(b'authorization', b'').decode('latin-1'))
+        if user is None or user.household_id is None:
+            status, message = (401, 'You do not have permission to perform this action') if user is None \
+                else (404, 'User is not in a household')
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': json.dumps({'errors': [{'message': message}]}).encode()})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no'),
+        ]})
+        broker, subscriber = get_broker(), AsyncSubscriber(asyncio.get_event_loop(), queue_size())
+        broker.subscribe(user.household_id, subscriber, parse_last_id(headers.get(b'last-event-id')))
+        disconnected = asyncio.ensure_future(close_on_disconnect(receive, subscriber))
+        try:
+            await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+            while True:
+                frame = await subscriber.get(heartbeat())
+                if subscriber.closed:
+                    break
+                await send({'type': 'http.response.body', 'body': frame or KEEP_ALIVE, 'more_body': True})
+        finally:
+            broker.unsubscribe(user.household_id, subscriber)
+            disconnected.cancel()
+
+    return app
+
+
+async def close_on_disconnect(receive, subscriber):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscriber.close()
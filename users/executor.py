@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from promise import Promise
+
+from .metrics import current_operation, measuring, evaluate
+from .routers import current_alias, reading_from
+
+
+class RootFieldExecutor(object):
+    '''A graphql-core executor resolving the root fields of query operations concurrently.
+
+    Each root field's resolver runs in a thread of `pool`, with its own
+    database connection, and its querysets are evaluated there. The promises
+    handed back to graphql-core are settled in the request's thread once
+    every root field is done, so the fields below them, and the DataLoaders
+    batching their queries, resolve in that thread as before.
+
+    Mutations resolve serially, as the spec requires, and so does everything
+    run inside a transaction of the request's thread (other connections would
+    not see its uncommitted rows).
+    '''
+
+    def __init__(self, pool):
+        self.pool = pool
+        # a view serves requests from several threads with one executor
+        self.local = threading.local()
+
+    @property
+    def pending(self):
+        return self.local.__dict__.setdefault('pending', [])
+
+    def execute(self, fn, *args, **kwargs):
+        info = args[1] if len(args) > 1 else None
+        if (info is None or len(info.path) != 1 or info.operation.operation != 'query'
+                or connection.in_atomic_block):
+            return fn(*args, **kwargs)
+
+        future = self.pool.submit(resolve, current_alias(), current_operation(), fn, args, kwargs)
+        promise = Promise()
+        self.pending.append((future, promise))
+        return promise
+
+    def wait_until_finished(self):
+        while self.pending:
+            pending, self.local.pending = self.pending, []
+            for future, promise in pending:
+                try:
+                    promise.do_resolve(future.result())
+                except Exception as e:
+                    promise.do_reject(e)
+
+    def clean(self):
+        self.local.pending = []
+
+
+def resolve(alias, operation, fn, args, kwargs):
+    '''Runs a resolver in a pool thread, reading from `alias` and measured as part of `operation`.
+
+    Pool threads keep their database connections from one field to the next,
+    so they are recycled here as request_started and request_finished do for
+    the request's thread: past CONN_MAX_AGE, or left unusable by an error.
+    '''
+    close_old_connections()
+    try:
+        with reading_from(alias), (measuring(operation) if operation is not None else ExitStack()):
+            value = fn(*args, **kwargs)
+            if isinstance(value, Promise) and not value.is_pending:
+                # settled by the middleware in this thread
+                value = value.get()
+            return evaluate(value)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    '''The executor of RoomGraphQLView: a RootFieldExecutor, or None (serial) when GRAPHQL_ROOT_FIELD_THREADS is 0.'''
+    global _executor
+    threads = getattr(settings, 'GRAPHQL_ROOT_FIELD_THREADS', 0)
+    if not threads:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = RootFieldExecutor(ThreadPoolExecutor(threads, thread_name_prefix='graphql'))
+        return _executor
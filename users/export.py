@@ -0,0 +1,87 @@
+import csv
+import json
+from itertools import chain, islice
+
+from django.conf import settings
+
+from .archive import complete_task_history, paid_cycle_history
+
+
+# name: ((live, archived) querysets of a household's history, fields, column names)
+HISTORY = {
+    'tasks': (
+        complete_task_history,
+        ['id', 'date', 'name', 'roommate_id', 'roommate__first_name', 'roommate__last_name'],
+        ['id', 'date', 'name', 'roommate_id', 'roommate_first_name', 'roommate_last_name'],
+    ),
+    'bills': (
+        paid_cycle_history,
+        ['id', 'date_paid', 'bill_id', 'bill__name', 'amount', 'recipient_id',
+         'recipient__first_name', 'recipient__last_name'],
+        ['id', 'date_paid', 'bill_id', 'bill_name', 'amount', 'recipient_id',
+         'recipient_first_name', 'recipient_last_name'],
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+'''----------------------------ENCODING----------------------------'''
+
+class Echo:
+    '''File-like object handing back what csv.writer writes to it.'''
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+
+ENCODERS = {
+    'csv': csv_lines,
+    'ndjson': ndjson_lines,
+}
+
+
+
+'''----------------------------STREAMING----------------------------'''
+
+def export_history(household_id, kind, format):
+    '''Yields the `kind` history of a household encoded as `format`, a chunk of rows at a time.
+
+    Rows are read with a server-side cursor (or fetchmany) of EXPORT_CHUNK_SIZE
+    rows in (date, id) order, the order of the history indexes, so neither the
+    database nor this process holds the whole history at once. Archived rows
+    come first, as they are older than every live row.
+    '''
+    history, fields, columns = HISTORY[kind]
+    size = chunk_size()
+    live, archived = history(household_id)
+    order = [fields[1], 'id']
+    rows = chain.from_iterable(
+        queryset.order_by(*order).values_list(*fields).iterator(chunk_size=size)
+        for queryset in (archived, live)
+    )
+    lines = ENCODERS[format](columns, rows)
+    while True:
+        chunk = ''.join(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
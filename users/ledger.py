@@ -0,0 +1,115 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Balance, BillCycle
+from .cache import invalidate_household
+
+
+# balances changed per UPDATE
+BALANCE_BATCH_SIZE = 500
+
+
+'''----------------------------INCREMENTAL----------------------------'''
+
+def shift_balances(shares, sign, create=True):
+    '''Adds (sign=1) or removes (sign=-1) unpaid shares from the balances.
+
+    `shares` are (household id, manager id, recipient id, amount) tuples: the
+    recipient owes the amount and the manager is owed it. Balances changing by
+    the same amounts (e.g. every participant of a bill) are updated together
+    with one F() UPDATE per batch. Missing balances are created unless
+    `create` is False (deletions only remove what activation added).
+    '''
+    deltas = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    for household_id, manager_id, recipient_id, amount in shares:
+        deltas[household_id, manager_id][0] += sign * amount
+        deltas[household_id, recipient_id][1] += sign * amount
+    if not deltas:
+        return
+
+    groups = defaultdict(list)
+    for (household_id, user_id), (owed, owes) in deltas.items():
+        groups[household_id, owed, owes].append(user_id)
+
+    with transaction.atomic():
+        if create:
+            create_balances(deltas)
+        for (household_id, owed, owes), user_ids in groups.items():
+            for start in range(0, len(user_ids), BALANCE_BATCH_SIZE):
+                Balance.objects.filter(
+                    household_id=household_id, user_id__in=user_ids[start:start + BALANCE_BATCH_SIZE]
+                ).update(owed=F('owed') + owed, owes=F('owes') + owes)
+        for household_id in {household_id for household_id, _ in deltas}:
+            invalidate_household(household_id)
+
+
+def create_balances(keys):
+    existing = set(Balance.objects.filter(
+        household_id__in={h for h, _ in keys}, user_id__in={u for _, u in keys}
+    ).values_list('household_id', 'user_id'))
+    missing = [Balance(household_id=h, user_id=u) for h, u in keys if (h, u) not in existing]
+    try:
+        with transaction.atomic():
+            Balance.objects.bulk_create(missing)
+    except IntegrityError:
+        # created concurrently by another activation
+        for balance in missing:
+            Balance.objects.get_or_create(household_id=balance.household_id, user_id=balance.user_id)
+
+
+def cycle_shares(cycles):
+    '''Shares of BillCycle rows whose bill is loaded (or cached on them).'''
+    return [(c.bill.household_id, c.bill.manager_id, c.recipient_id, c.amount) for c in cycles]
+
+
+
+'''----------------------------RECONCILIATION----------------------------'''
+
+def computed_balances(household=None):
+    '''Balances summed from the unpaid cycles, by (household id, user id).'''
+    unpaid = BillCycle.objects.filter(is_paid=False)
+    if household is not None:
+        unpaid = unpaid.filter(bill__household=household)
+
+    balances = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    for row in unpaid.values('bill__household_id', 'bill__manager_id').annotate(total=Sum('amount')):
+        balances[row['bill__household_id'], row['bill__manager_id']][0] += row['total']
+    for row in unpaid.values('bill__household_id', 'recipient_id').annotate(total=Sum('amount')):
+        balances[row['bill__household_id'], row['recipient_id']][1] += row['total']
+    return balances
+
+
+def balance_differences(household=None):
+    '''(household id, user id, stored (owed, owes), computed (owed, owes)) of every balance that differs.'''
+    stored = Balance.objects.all()
+    if household is not None:
+        stored = stored.filter(household=household)
+    stored = {(b.household_id, b.user_id): (b.owed, b.owes) for b in stored}
+    computed = {key: tuple(value) for key, value in computed_balances(household).items()}
+
+    zero = (Decimal('0.00'), Decimal('0.00'))
+    return [
+        (key[0], key[1], stored.get(key, zero), computed.get(key, zero))
+        for key in sorted(set(stored) | set(computed))
+        if stored.get(key, zero) != computed.get(key, zero)
+    ]
+
+
+def rebuild_balances(household=None):
+    '''Replaces the stored balances with the ones computed from the unpaid cycles.'''
+    with transaction.atomic():
+        stored = Balance.objects.all()
+        if household is not None:
+            stored = stored.filter(household=household)
+        households = set(stored.values_list('household_id', flat=True))
+        stored.delete()
+        computed = computed_balances(household)
+        Balance.objects.bulk_create(
+            Balance(household_id=h, user_id=u, owed=owed, owes=owes)
+            for (h, u), (owed, owes) in computed.items()
+        )
+        for household_id in households | {h for h, _ in computed}:
+            invalidate_household(household_id)
@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .models import User, Household, Task, RotationMember, CompleteTask, Bill, BillCycle
+from .metrics import measured_batch
+
+
+'''----------------------------LOADERS----------------------------'''
+
+class ModelLoader(DataLoader):
+    '''Loads rows of a model by primary key, one query per batch.'''
+
+    def __init__(self, model):
+        super(ModelLoader, self).__init__()
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        rows = self.model.objects.in_bulk(keys)
+        return Promise.resolve([rows.get(k) for k in keys])
+
+
+class RelatedLoader(DataLoader):
+    '''Loads the rows of a queryset whose foreign key `field` points at each key.'''
+
+    def __init__(self, queryset, field):
+        super(RelatedLoader, self).__init__()
+        self.queryset = queryset
+        self.field = field
+
+    def batch_load_fn(self, keys):
+        attname = self.field + '_id'
+        grouped = defaultdict(list)
+        for row in self.queryset.filter(**{attname + '__in': keys}).order_by('pk'):
+            grouped[getattr(row, attname)].append(row)
+        return Promise.resolve([grouped[k] for k in keys])
+
+
+class ManyToManyLoader(DataLoader):
+    '''Loads the `target` side of a many-to-many through table for each `source` key.'''
+
+    def __init__(self, through, source, target, order_by='pk'):
+        super(ManyToManyLoader, self).__init__()
+        self.through = through
+        self.source = source
+        self.target = target
+        self.order_by = order_by
+
+    def batch_load_fn(self, keys):
+        attname = self.source + '_id'
+        links = (self.through.objects
+                 .filter(**{attname + '__in': keys})
+                 .select_related(self.target)
+                 .order_by(self.order_by, 'pk'))
+        grouped = defaultdict(list)
+        for link in links:
+            grouped[getattr(link, attname)].append(getattr(link, self.target))
+        return Promise.resolve([grouped[k] for k in keys])
+
+
+
+'''----------------------------REGISTRY----------------------------'''
+
+class Loaders(object):
+    '''Every loader used by the schema. A new registry is built for each request.'''
+
+    def __init__(self):
+        # rows by primary key
+        self.user               = ModelLoader(User)
+        self.household          = ModelLoader(Household)
+        self.bill               = ModelLoader(Bill)
+        # reverse foreign keys
+        self.household_users    = RelatedLoader(User.objects.all(), 'household')
+        self.household_tasks    = RelatedLoader(Task.objects.all(), 'household')
+        self.household_bills    = RelatedLoader(Bill.objects.all(), 'household')
+        self.household_complete_tasks = RelatedLoader(CompleteTask.objects.all(), 'household')
+        self.user_current_tasks = RelatedLoader(Task.objects.all(), 'current')
+        self.user_managed_bills = RelatedLoader(Bill.objects.all(), 'manager')
+        self.user_cycles        = RelatedLoader(BillCycle.objects.all(), 'recipient')
+        self.user_complete_tasks = RelatedLoader(CompleteTask.objects.all(), 'roommate')
+        self.bill_cycles        = RelatedLoader(BillCycle.objects.all(), 'bill')
+        # many to many
+        self.task_rotation      = ManyToManyLoader(RotationMember, 'task', 'user', order_by='position')
+        self.user_rotation_tasks = ManyToManyLoader(RotationMember, 'user', 'task')
+        self.bill_participants  = ManyToManyLoader(Bill.participants.through, 'bill', 'user')
+        self.user_participant_bills = ManyToManyLoader(Bill.participants.through, 'user', 'bill')
+
+        for name, loader in vars(self).items():
+            loader.batch_load_fn = measured_batch('loader.' + name, loader.batch_load_fn)
+
+
+def get_loaders(info):
+    '''Returns the loader registry of the current request, creating it on first use.'''
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, 'loaders', loaders)
+    return loaders
+
+
+def load_one(info, root, field_name, loader_name):
+    '''Resolves a forward foreign key through a loader unless it is already cached.'''
+    field = root._meta.get_field(field_name)
+    if field.is_cached(root):
+        return getattr(root, field_name)
+    key = getattr(root, field.attname)
+    if key is None:
+        return None
+    return getattr(get_loaders(info), loader_name).load(key)
+
+
+def load_many(info, root, accessor, loader_name):
+    '''Resolves a to-many relation through a loader unless it was prefetched.'''
+    prefetched = getattr(root, '_prefetched_objects_cache', {})
+    if accessor in prefetched:
+        return list(prefetched[accessor])
+    return getattr(get_loaders(info), loader_name).load(root.pk)
@@ -0,0 +1,23 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from users.archive import BATCH_SIZE, archive_history
+
+
+class Command(BaseCommand):
+    help = 'Moves completed tasks and paid bill cycles older than ARCHIVE_AFTER_DAYS to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive rows dated before this day (DDMMYYYY) instead')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        before = datetime.strptime(options['before'], '%d%m%Y').date() if options['before'] else None
+        started = time.perf_counter()
+        counts = archive_history(before, options['batch_size'])
+        self.stdout.write('Archived {} in {:.2f} s'.format(
+            ', '.join('{} {}'.format(n, name) for name, n in counts.items()),
+            time.perf_counter() - started))
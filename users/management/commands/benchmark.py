@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from itertools import count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from graphql.language.parser import parse
+from graphql_jwt.shortcuts import get_token
+
+from users.benchmark.data import generate_household, delete_household
+from users.benchmark.report import summarize, load_baseline, save_baseline, regressions
+from users.benchmark.runners import ClientRunner, HTTPRunner, serve, operation_queries
+from users.benchmark.scenarios import SCENARIOS
+
+
+BASELINE = os.path.join(settings.BASE_DIR, 'users', 'benchmark', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ('Runs the client operations against a generated household through the test client or a local '
+            'gunicorn/uWSGI server and reports latency percentiles, SQL queries per operation and throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roommates', type=int, default=6)
+        parser.add_argument('--tasks', type=int, default=20)
+        parser.add_argument('--bills', type=int, default=12)
+        parser.add_argument('--history', type=int, default=1000,
+                            help='Completed tasks, and paid cycles, of the household')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed runs per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed runs per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads sending operations')
+        parser.add_argument('--warm', action='store_true',
+                            help='Let queries hit the response cache (by default every run misses it)')
+        parser.add_argument('--server', choices=['none', 'gunicorn', 'uwsgi'], default='none',
+                            help='Run the app in a local server process instead of the test client')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Server processes; queries per operation are only exact with one')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+        parser.add_argument('--check', action='store_true', help='Fail on regressions from the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed slowdown of p95 latency and throughput (0.25 = 25%%)')
+        parser.add_argument('scenarios', nargs='*', help='Names of scenarios to run (default: all)')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['scenarios'] or s.name in options['scenarios']]
+        if not scenarios:
+            raise CommandError('Unknown scenarios, choose from: {}'.format(', '.join(s.name for s in SCENARIOS)))
+
+        # the runs read committed rows from other threads (or processes), so they are created for real
+        household, users = generate_household(
+            options['roommates'], options['tasks'], options['bills'], options['history'])
+        try:
+            token = get_token(users[0])
+            if options['server'] == 'none':
+                results = self.run_all(ClientRunner(token), scenarios, household, users[0], options)
+            else:
+                with serve(options['server'], options['port'], options['workers']) as url:
+                    results = self.run_all(HTTPRunner(token, url), scenarios, household, users[0], options)
+        finally:
+            delete_household(household)
+
+        mode = 'client' if options['server'] == 'none' else options['server']
+        baseline = load_baseline(options['baseline'])
+        before = baseline.get(mode, {}).get('results', {})
+        self.report(results, before)
+
+        if options['save_baseline']:
+            keys = ['roommates', 'tasks', 'bills', 'history', 'iterations', 'concurrency', 'warm', 'workers']
+            save_baseline(options['baseline'], baseline, mode, {k: options[k] for k in keys}, results)
+            self.stdout.write('Saved the {} baseline to {}'.format(mode, options['baseline']))
+        elif options['check']:
+            found = regressions(results, before, options['tolerance'])
+            if found:
+                raise CommandError('Regressions from the {} baseline:\n  {}'.format(mode, '\n  '.join(found)))
+            self.stdout.write('No regressions from the {} baseline'.format(mode))
+
+    def run_all(self, runner, scenarios, household, user, options):
+        return {
+            scenario.name: self.run(runner, scenario, scenario.runs(household, user), options)
+            for scenario in scenarios
+        }
+
+    def run(self, runner, scenario, variables, options):
+        query = scenario.query
+        operation = parse(query).definitions[0].name.value
+        lock = threading.Lock()
+        runs = count()
+        latencies, errors = [], [0]
+
+        def body():
+            with lock:
+                run = next(runs)
+                data = {'query': query, 'operationName': operation, 'variables': variables() or {}}
+            if not options['warm']:
+                # undeclared variables are ignored, but make each response cache key unique
+                data['variables']['benchmarkRun'] = run
+            return data
+
+        def send(total, timed):
+            for _ in range(total):
+                data = body()
+                started = time.perf_counter()
+                ok = runner.post(data)
+                if timed:
+                    latencies.append(time.perf_counter() - started)
+                    if not ok:
+                        errors[0] += 1
+
+        def sender(total):
+            try:
+                send(total, True)
+            finally:
+                connections.close_all()
+
+        send(options['warmup'], False)
+        before = operation_queries(runner.metrics()).get(operation, [0, 0])
+        shares = split(options['iterations'], options['concurrency'])
+        started = time.perf_counter()
+        if len(shares) == 1:
+            send(shares[0], True)
+        else:
+            threads = [threading.Thread(target=sender, args=(share,)) for share in shares]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+        after = operation_queries(runner.metrics()).get(operation, [0, 0])
+
+        executed = after[1] - before[1]
+        queries = round((after[0] - before[0]) / executed, 2) if executed > 0 else None
+        return summarize(latencies, elapsed, errors[0], queries)
+
+    def report(self, results, baseline):
+        self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'ops/s', 'queries', 'errors'))
+        for name, result in results.items():
+            self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['throughput'],
+                '-' if result['queries'] is None else result['queries'], result['errors']))
+            before = baseline.get(name)
+            if before:
+                self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+                    '  baseline', before['p50_ms'], before['p95_ms'], before['p99_ms'], before['throughput'],
+                    '-' if before['queries'] is None else before['queries'], before['errors']))
+
+
+def split(total, parts):
+    '''`total` runs shared between `parts` threads.'''
+    parts = max(1, min(parts, total))
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
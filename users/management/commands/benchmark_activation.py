@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from users.billing import activate_bills, cycle_amount
+from users.models import Household, BillCycle
+from users.seed import seed_users, seed_bills
+
+
+class Command(BaseCommand):
+    help = 'Times bill activation for one bill with many participants and for many bills at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[1, 100, 10000])
+        parser.add_argument('--legacy-limit', type=int, default=1000,
+                            help='Largest size also timed with the old per-cycle save loop')
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            for scenario in ('participants', 'bills'):
+                line = '{:<12} {:>6}  bulk {:9.1f} ms {:>5} queries'.format(
+                    scenario, size, *self.run(scenario, size, activate_bills))
+                if size <= options['legacy_limit']:
+                    line += '   per-cycle {:9.1f} ms {:>6} queries'.format(
+                        *self.run(scenario, size, self.activate_one_by_one))
+                self.stdout.write(line)
+
+    def run(self, scenario, size, activate):
+        # the seeded rows never outlive the command
+        with transaction.atomic():
+            household = Household.objects.create(name='Benchmark')
+            if scenario == 'participants':
+                users = seed_users(household, size + 1)
+                bills = seed_bills(household, users[0], users[1:], 1)
+            else:
+                users = seed_users(household, 3)
+                bills = seed_bills(household, users[0], users[1:], size)
+
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                activate(bills)
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return elapsed * 1000, len(ctx.captured_queries)
+
+    def activate_one_by_one(self, bills):
+        '''The activation UpdateBill used to run: a validated save per cycle.'''
+        for bill in bills:
+            bill.is_active = True
+            amount = cycle_amount(bill)
+            for recipient in bill.participants.all():
+                cycle = BillCycle(bill=bill, recipient=recipient, amount=amount)
+                cycle.full_clean()
+                cycle.save()
+            bill.full_clean()
+            bill.save()
@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from graphql.language.parser import parse
+from graphql.validation import validate
+
+from room_graphql_api.schema import schema
+from users.documents import DocumentCacheBackend
+
+
+class Command(BaseCommand):
+    help = 'Measures the CPU time the document cache saves per request on the real client queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('queries', nargs='*', default=['homepage', 'bills'],
+                            help='Names of files in GRAPHQL_PERSISTED_QUERIES_DIR')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        for name in options['queries']:
+            with open(os.path.join(settings.GRAPHQL_PERSISTED_QUERIES_DIR, name + '.graphql')) as f:
+                query = f.read()
+
+            started = time.process_time()
+            for _ in range(iterations):
+                validate(schema, parse(query))
+            uncached = (time.process_time() - started) / iterations
+
+            backend = DocumentCacheBackend(max_size=16)
+            backend.document_from_string(schema, query)
+            started = time.process_time()
+            for _ in range(iterations):
+                backend.document_from_string(schema, query)
+            cached = (time.process_time() - started) / iterations
+
+            self.stdout.write('{:<10} parse+validate {:8.1f} us   cached {:6.1f} us   saved {:8.1f} us/request'.format(
+                name, uncached * 1e6, cached * 1e6, (uncached - cached) * 1e6))
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+
+from users.benchmark.report import percentile
+from users.events import LocalBroker, QueueSubscriber, AsyncSubscriber, change
+
+
+# a task completed from the app: the task moves on and the completion is logged
+MESSAGE = json.dumps({'changes': [
+    change('task', 'update', 1, {'dueDate': '2020-06-08', 'current': 2, 'complete': False}),
+    change('completeTask', 'create', 1, {'name': 'Dishes', 'roommate': 1, 'date': '2020-06-01'}),
+]}, separators=(',', ':'))
+
+
+class Fanout(object):
+    '''Counts the subscribers that received the current message and when the last one did.'''
+
+    def __init__(self, subscribers):
+        self.subscribers = subscribers
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        self.received = 0
+        self.done = threading.Event()
+        self.finished = None
+
+    def receive(self):
+        with self.lock:
+            self.received += 1
+            if self.received == self.subscribers:
+                self.finished = time.perf_counter()
+                self.done.set()
+
+
+class Command(BaseCommand):
+    help = ('Publishes household change messages to many subscribers of the in-process broker '
+            '(users.events) and reports the publish cost and the time until every subscriber has them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000, help='Open feeds of the household')
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--mode', choices=['async', 'threads', 'both'], default='both',
+                            help='async: feeds served from one event loop (room_graphql_api.asgi); '
+                                 'threads: a thread per feed (the WSGI events view)')
+
+    def handle(self, *args, **options):
+        modes = ['async', 'threads'] if options['mode'] == 'both' else [options['mode']]
+        self.stdout.write('{} subscribers, {} messages of {} bytes'.format(
+            options['subscribers'], options['messages'], len(MESSAGE)))
+        for mode in modes:
+            broker, fanout = LocalBroker(), Fanout(options['subscribers'])
+            with getattr(self, 'serve_' + mode)(broker, fanout):
+                publish, deliver = self.publish(broker, fanout, options['messages'])
+            self.stdout.write('{:<8} publish p50 {:.3f} ms  p95 {:.3f} ms   all delivered p50 {:.3f} ms  p95 {:.3f} ms'.format(
+                mode, percentile(publish, 50) * 1000, percentile(publish, 95) * 1000,
+                percentile(deliver, 50) * 1000, percentile(deliver, 95) * 1000))
+
+    @staticmethod
+    def publish(broker, fanout, messages):
+        publish, deliver = [], []
+        for _ in range(messages):
+            fanout.start()
+            started = time.perf_counter()
+            broker.publish(1, MESSAGE)
+            publish.append(time.perf_counter() - started)
+            if not fanout.done.wait(30):
+                raise Exception('{} of {} subscribers received the message'.format(
+                    fanout.received, fanout.subscribers))
+            deliver.append(fanout.finished - started)
+        return sorted(publish), sorted(deliver)
+
+    @contextmanager
+    def serve_threads(self, broker, fanout):
+        def consume(subscriber):
+            while subscriber.get() is not None:
+                fanout.receive()
+
+        subscribers = [QueueSubscriber() for _ in range(fanout.subscribers)]
+        threads = [threading.Thread(target=consume, args=(s,), daemon=True) for s in subscribers]
+        for subscriber, thread in zip(subscribers, threads):
+            broker.subscribe(1, subscriber)
+            thread.start()
+        try:
+            yield
+        finally:
+            for subscriber, thread in zip(subscribers, threads):
+                subscriber.deliver(None)
+                thread.join()
+
+    @contextmanager
+    def serve_async(self, broker, fanout):
+        loop, subscribers = asyncio.new_event_loop(), [None] * fanout.subscribers
+
+        async def consume(i):
+            subscribers[i] = subscriber = AsyncSubscriber(loop)
+            broker.subscribe(1, subscriber)
+            while await subscriber.get() is not None:
+                fanout.receive()
+
+        consumers = asyncio.gather(*[consume(i) for i in range(fanout.subscribers)], loop=loop)
+        thread = threading.Thread(target=loop.run_until_complete, args=(consumers,), daemon=True)
+        thread.start()
+        while len(broker.subscribers[1]) < fanout.subscribers:
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            for subscriber in subscribers:
+                loop.call_soon_threadsafe(subscriber.close)
+            thread.join()
+            loop.close()
@@ -0,0 +1,93 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.test import RequestFactory
+
+from room_graphql_api.schema import schema
+from users.benchmark.data import generate_household, delete_household
+from users.benchmark.report import summarize
+from users.executor import RootFieldExecutor
+
+
+def combined_query(names):
+    '''One query selecting the root fields of several files of GRAPHQL_PERSISTED_QUERIES_DIR.'''
+    bodies = []
+    for name in names:
+        with open(os.path.join(settings.GRAPHQL_PERSISTED_QUERIES_DIR, name + '.graphql')) as f:
+            text = f.read()
+        bodies.append(text[text.index('{') + 1:text.rindex('}')])
+    return 'query HomeScreen {' + ''.join(bodies) + '}'
+
+
+@contextmanager
+def round_trips(seconds):
+    '''Adds `seconds` to every SQL query of every thread, as a database server on another host would.'''
+    if not seconds:
+        yield
+        return
+    execute = CursorWrapper._execute
+
+    def delayed(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    CursorWrapper._execute = delayed
+    try:
+        yield
+    finally:
+        CursorWrapper._execute = execute
+
+
+class Command(BaseCommand):
+    help = ('Compares the latency of a query selecting several root fields (the home screen) '
+            'resolved serially and with the root fields resolved concurrently (users.executor)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=4, help='Threads of the concurrent executor')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Milliseconds added to each SQL query, e.g. 1 for a database on another host')
+        parser.add_argument('--history', type=int, default=1000,
+                            help='Completed tasks, and paid cycles, of the generated household')
+        parser.add_argument('queries', nargs='*', default=['me', 'homepage', 'tasks', 'bills'],
+                            help='Names of files in GRAPHQL_PERSISTED_QUERIES_DIR whose root fields are combined')
+
+    def handle(self, *args, **options):
+        query = combined_query(options['queries'])
+        # pool threads read committed rows with their own connections
+        household, users = generate_household(history=options['history'])
+        pool = ThreadPoolExecutor(options['threads'])
+        try:
+            request = RequestFactory().post('/graphql/')
+            request.user = users[0]
+            executors = [('serial', None), ('root fields', RootFieldExecutor(pool))]
+            for name, executor in executors:
+                self.time_query(query, request, executor)
+            # alternating the executors spreads any drift of the machine over both
+            latencies = {name: [] for name, _ in executors}
+            with round_trips(options['latency'] / 1000):
+                for _ in range(options['iterations']):
+                    for name, executor in executors:
+                        latencies[name].append(self.time_query(query, request, executor))
+            for name, _ in executors:
+                result = summarize(latencies[name], sum(latencies[name]), 0, None)
+                self.stdout.write('{:<12} p50 {:>8} ms  p95 {:>8} ms  p99 {:>8} ms  {:>7} ops/s'.format(
+                    name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['throughput']))
+        finally:
+            pool.shutdown()
+            connections.close_all()
+            delete_household(household)
+
+    def time_query(self, query, request, executor):
+        options = {'executor': executor} if executor is not None else {}
+        started = time.perf_counter()
+        result = schema.execute(query, context_value=request, **options)
+        if result.errors:
+            raise Exception(result.errors[0])
+        return time.perf_counter() - started
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from room_graphql_api.schema import schema
+from users.seed import seed_household, seed_tasks
+
+
+TASKS_PAGE = '{ tasks { name dueDate current { firstName } rotation { firstName } } }'
+
+
+class Command(BaseCommand):
+    help = ('Times the tasks page of one household as its task count grows; '
+            'the time should grow linearly with the rows and the query count not at all')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[500, 2000, 8000])
+        parser.add_argument('--roommates', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per size; the fastest is reported')
+
+    def handle(self, *args, **options):
+        # the seeded rows never outlive the command
+        with transaction.atomic():
+            household, users = seed_household(options['roommates'], name='Benchmark')
+            request = RequestFactory().post('/graphql/')
+            request.user = users[0]
+            seeded, previous = 0, None
+            for size in sorted(options['sizes']):
+                seed_tasks(household, users, size - seeded)
+                seeded = size
+                elapsed, queries = self.run(request, options['repeat'])
+                line = '{:>7} tasks  {:9.1f} ms {:>4} queries'.format(size, elapsed * 1000, queries)
+                if previous is not None:
+                    line += '   x{:.1f} rows  x{:.1f} time'.format(size / previous[0], elapsed / previous[1])
+                self.stdout.write(line)
+                previous = (size, elapsed)
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def run(request, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                result = schema.execute(TASKS_PAGE, context_value=request)
+                elapsed = time.perf_counter() - started
+            if result.errors:
+                raise Exception(result.errors[0])
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(ctx.captured_queries)
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from room_graphql_api.schema import schema
+from users.seed import seed_household
+
+
+# operations the Flutter client sends on every screen
+HOT_QUERIES = {
+    'homepage': '{ homepage { ... on HouseholdType { name } ... on UserType { firstName status } } }',
+    'tasks': '{ tasks { name dueDate current { firstName } rotation { firstName } } }',
+    'completeTasks': '{ completeTasks { name date roommate { firstName } } }',
+    'bills': '''{ bills {
+        ... on BillListType { data { name participants { firstName } cycles { isPaid } } }
+        ... on CycleListType { data { amount bill { name } } } } }''',
+    'completeBills': '{ completeBills { amount datePaid recipient { firstName } } }',
+    'balances': '{ balances { owed owes net user { firstName } } }',
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the SQL of the hot resolvers and fails if any of it scans a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20,
+                            help='Roommates in the seeded household')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the plan of every statement')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError('EXPLAIN checks support sqlite and postgresql, not {}'.format(connection.vendor))
+
+        failures = []
+        # the seeded rows never outlive the command
+        with transaction.atomic():
+            household, users = seed_household(options['size'], name='Explain')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                    # small seeded tables make sequential scans look cheap
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, query in HOT_QUERIES.items():
+                for sql in self.capture(query, users[0]):
+                    plan = self.explain(sql)
+                    scans = [line for line in plan if self.is_full_scan(line)]
+                    if scans:
+                        failures.append((name, sql, scans))
+                    if options['verbose_plans'] or scans:
+                        self.stdout.write('{}: {}'.format(name, sql))
+                        for line in plan:
+                            self.stdout.write('    ' + line)
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('{} hot queries fall back to a full table scan'.format(len(failures)))
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
+
+    def capture(self, query, user):
+        request = RequestFactory().post('/graphql/')
+        request.user = user
+        with CaptureQueriesContext(connection) as ctx:
+            result = schema.execute(query, context_value=request)
+        if result.errors:
+            raise CommandError(result.errors)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall()]
+
+    def is_full_scan(self, line):
+        if connection.vendor == 'sqlite':
+            # 'SCAN TABLE t' / 'SCAN t' without an index walks every row
+            return line.startswith('SCAN') and 'USING' not in line
+        return 'Seq Scan' in line
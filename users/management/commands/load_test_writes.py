@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import RequestFactory
+
+from room_graphql_api.schema import schema
+from users.models import User, Household
+from users.seed import seed_household
+
+
+CREATE_TASK = '''
+mutation ($current: Int!) {
+  createTask(name: "Load", description: "load test", dueDate: "01062020", frequency: "W1",
+             current: $current, rotation: [$current]) { task { id } }
+}
+'''
+COMPLETE_TASK = 'mutation ($id: Int!) { updateTask(taskData: {taskId: $id, complete: true}) { task { id } } }'
+DELETE_TASK = 'mutation ($id: Int!) { deleteTask(taskId: $id) { ok } }'
+
+
+class Command(BaseCommand):
+    help = ('Runs task mutations from several threads at once against the configured database '
+            'and reports write throughput, latency percentiles and errors')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent writers, each a roommate of its own household')
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Create, complete and delete rounds per writer')
+        parser.add_argument('--journal', action='store_true',
+                            help='SQLite only: use the rollback journal instead of SQLITE_PRAGMAS, for comparison')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if options['journal'] and vendor == 'sqlite':
+            settings.SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+            connection.close()
+
+        # writers need committed rows, so they are created (and deleted) for real
+        users = [seed_household(1, name='Load{}-'.format(i))[1][0] for i in range(options['threads'])]
+        connection.close()
+
+        latencies, errors = [], Counter()
+        threads = [
+            threading.Thread(target=self.writer, args=(user, options['iterations'], latencies, errors))
+            for user in users
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        households = [user.household_id for user in users]
+        User.objects.filter(household_id__in=households).delete()
+        Household.objects.filter(id__in=households).delete()
+
+        latencies.sort()
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+        self.stdout.write('{} ({}): {} writes by {} threads in {:.2f} s, {:.0f} writes/s'.format(
+            vendor, connection.settings_dict['NAME'], len(latencies), len(threads), elapsed,
+            len(latencies) / elapsed))
+        self.stdout.write('latency p50 {:.1f} ms  p95 {:.1f} ms  p99 {:.1f} ms'.format(
+            percentile(0.50), percentile(0.95), percentile(0.99)))
+        self.stdout.write('{} errors'.format(sum(errors.values())))
+        for message, count in errors.most_common():
+            self.stdout.write('  {:>5}  {}'.format(count, message))
+
+    def writer(self, user, iterations, latencies, errors):
+        request = RequestFactory().post('/graphql/')
+        request.user = user
+        try:
+            for _ in range(iterations):
+                data = self.mutate(request, CREATE_TASK, {'current': user.id}, latencies, errors)
+                if not data:
+                    continue
+                task_id = int(data['createTask']['task']['id'])
+                self.mutate(request, COMPLETE_TASK, {'id': task_id}, latencies, errors)
+                self.mutate(request, DELETE_TASK, {'id': task_id}, latencies, errors)
+        finally:
+            connections.close_all()
+
+    def mutate(self, request, query, variables, latencies, errors):
+        started = time.perf_counter()
+        result = schema.execute(query, context_value=request, variables=variables)
+        latencies.append(time.perf_counter() - started)
+        if result.errors:
+            errors[str(result.errors[0])] += 1
+            return None
+        return result.data
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.ledger import balance_differences, rebuild_balances
+from users.models import Household
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every balance from the unpaid bill cycles and reports where the stored table differs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--household', type=int, help='Only check this household')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the stored balances from the cycles')
+
+    def handle(self, *args, **options):
+        household = None
+        if options['household'] is not None:
+            household = Household.objects.filter(id=options['household']).first()
+            if household is None:
+                raise CommandError('Household {} does not exist'.format(options['household']))
+
+        differences = balance_differences(household)
+        for household_id, user_id, (owed, owes), (real_owed, real_owes) in differences:
+            self.stdout.write('household {} user {}: stored owed {} owes {}, cycles say owed {} owes {}'.format(
+                household_id, user_id, owed, owes, real_owed, real_owes))
+
+        if not differences:
+            self.stdout.write(self.style.SUCCESS('Balances match the bill cycles'))
+        elif options['fix']:
+            rebuild_balances(household)
+            self.stdout.write(self.style.SUCCESS('Rebuilt balances, {} differed'.format(len(differences))))
+        else:
+            raise CommandError('{} balances differ from the bill cycles, run with --fix to rebuild them'.format(
+                len(differences)))
@@ -0,0 +1,29 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from users.recurrence import CHUNK_SIZE, roll_forward
+
+
+class Command(BaseCommand):
+    help = 'Moves overdue tasks to their next occurrence, closes paid bills and activates due bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Run as of this day (DDMMYYYY), defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows advanced per transaction')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running, once every this many seconds')
+
+    def handle(self, *args, **options):
+        today = datetime.strptime(options['date'], '%d%m%Y').date() if options['date'] else None
+        while True:
+            started = time.perf_counter()
+            counts = roll_forward(today, options['chunk_size'])
+            self.stdout.write('{} in {:.2f} s'.format(
+                ', '.join('{} {}'.format(n, name) for name, n in counts.items()),
+                time.perf_counter() - started))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from users.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = ('Copies the SQLite primary database into the replica database file, '
+            'to try replica routing locally without a replicating server')
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('No replica configured, set REPLICA_DATABASE_URL')
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite files can be copied, replicate other databases with the server')
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        self.stdout.write('Copied {} to {}'.format(primary.settings_dict['NAME'], replica.settings_dict['NAME']))
@@ -0,0 +1,341 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+from graphql import GraphQLEnumType, GraphQLScalarType
+from graphql.type.definition import get_named_type
+from promise import Promise, is_thenable
+
+from .cache import cache_stats
+from .documents import get_document_cache
+
+logger = logging.getLogger('users.metrics')
+
+# seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# SQL queries, list items
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+'''----------------------------HISTOGRAMS----------------------------'''
+
+class Histogram(object):
+    '''A Prometheus histogram with one series per combination of label values.
+
+    Values live in the memory of each process: with several uWSGI workers
+    every scrape of /metrics/ reads the worker that happens to serve it.
+    Label values come from clients (operation names), so past `max_series`
+    new combinations are counted as 'other'.
+    '''
+
+    def __init__(self, name, documentation, buckets, labels, max_series=500):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self.max_series = max_series
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.series.get(label_values)
+            if counts is None and len(self.series) >= self.max_series:
+                label_values = ('other',) * len(label_values)
+                counts = self.series.get(label_values)
+            if counts is None:
+                # one count per bucket, then +Inf, sum and count
+                counts = self.series[label_values] = [0] * (len(self.buckets) + 3)
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            series = sorted((labels, list(counts)) for labels, counts in self.series.items())
+        for label_values, counts in series:
+            labels = ','.join('{}="{}"'.format(k, escape(v)) for k, v in zip(self.labels, label_values))
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(
+                    self.name, labels, ',' if labels else '', bound, total))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labels, counts[-2]))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labels, counts[-1]))
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Counter(object):
+    '''A Prometheus counter whose series are read from `collect` when rendered.
+
+    `collect` returns {label values: count}, for counts kept elsewhere (the
+    hits and misses of the caches).
+    '''
+
+    def __init__(self, name, documentation, labels, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.collect = collect
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        for label_values, value in sorted(self.collect().items()):
+            labels = ','.join('{}="{}"'.format(k, escape(v)) for k, v in zip(self.labels, label_values))
+            lines.append('{}{{{}}} {}'.format(self.name, labels, value))
+        return lines
+
+
+def cache_lookups(stats):
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+RESOLVER_SECONDS = Histogram(
+    'graphql_resolver_duration_seconds', 'Wall time from calling a resolver to its value being ready.',
+    DURATION_BUCKETS, ['field'])
+RESOLVER_QUERIES = Histogram(
+    'graphql_resolver_sql_queries', 'SQL queries run by a resolver or loader batch.',
+    COUNT_BUCKETS, ['field'])
+RESOLVER_SIZE = Histogram(
+    'graphql_resolver_result_size', 'Items returned by list and connection resolvers, keys of loader batches.',
+    COUNT_BUCKETS, ['field'])
+OPERATION_SECONDS = Histogram(
+    'graphql_operation_duration_seconds', 'Wall time of a GraphQL operation.',
+    DURATION_BUCKETS, ['type', 'operation'])
+OPERATION_QUERIES = Histogram(
+    'graphql_operation_sql_queries', 'SQL queries run by a GraphQL operation.',
+    COUNT_BUCKETS, ['type', 'operation'])
+
+REGISTRY = [RESOLVER_SECONDS, RESOLVER_QUERIES, RESOLVER_SIZE, OPERATION_SECONDS, OPERATION_QUERIES]
+
+COUNTERS = [
+    Counter('graphql_response_cache_lookups_total', 'Lookups of the household response cache (users.cache).',
+            ['result'], lambda: cache_lookups(cache_stats())),
+    Counter('graphql_document_cache_lookups_total', 'Lookups of the parsed document cache (users.documents).',
+            ['result'], lambda: cache_lookups(get_document_cache().stats())),
+]
+
+
+def render_metrics():
+    '''Every histogram and counter in the Prometheus text exposition format.'''
+    return '\n'.join(line for metric in REGISTRY + COUNTERS for line in metric.render()) + '\n'
+
+
+
+'''----------------------------SPANS----------------------------'''
+
+_state = threading.local()
+
+
+class Span(object):
+    __slots__ = ('name', 'path', 'parent_type', 'return_type', 'start', 'duration', 'queries')
+
+    def __init__(self, name, path=None, parent_type=None, return_type=None):
+        self.name = name
+        self.path = path
+        self.parent_type = parent_type
+        self.return_type = return_type
+        self.start = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+
+
+class Operation(object):
+    def __init__(self, operation_type, name):
+        self.type = operation_type or '-'
+        self.name = name or '-'
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.spans = []
+        # root fields may resolve in other threads (see users.executor)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def stack(self):
+        '''Spans running synchronously in this thread; queries count towards the innermost one.'''
+        return self.local.__dict__.setdefault('stack', [])
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+        if self.stack:
+            self.stack[-1].queries += 1
+        return execute(sql, params, many, context)
+
+
+def current_operation():
+    return getattr(_state, 'operation', None)
+
+
+@contextmanager
+def measuring(operation):
+    '''Counts the SQL queries this thread runs within the block towards `operation`.'''
+    previous, _state.operation = current_operation(), operation
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(operation))
+            yield operation
+    finally:
+        _state.operation = previous
+
+
+@contextmanager
+def measure_operation(operation_type, name):
+    '''Collects the spans and SQL queries of the GraphQL operation run within the block.'''
+    operation = Operation(operation_type, name)
+    try:
+        with measuring(operation):
+            yield operation
+    finally:
+        operation.duration = time.perf_counter() - operation.start
+        OPERATION_SECONDS.observe(operation.duration, operation.type, operation.name)
+        OPERATION_QUERIES.observe(operation.queries, operation.type, operation.name)
+        log_if_slow(operation)
+
+
+@contextmanager
+def running(span):
+    '''Counts the SQL queries run within the block towards `span`.'''
+    operation = current_operation()
+    if operation is None:
+        yield
+        return
+    operation.stack.append(span)
+    try:
+        yield
+    finally:
+        operation.stack.pop()
+
+
+def finish(span, value):
+    span.duration = time.perf_counter() - span.start
+    RESOLVER_SECONDS.observe(span.duration, span.name)
+    RESOLVER_QUERIES.observe(span.queries, span.name)
+    size = result_size(value)
+    if size is not None:
+        RESOLVER_SIZE.observe(size, span.name)
+    operation = current_operation()
+    if operation is not None:
+        with operation.lock:
+            operation.spans.append(span)
+
+
+def result_size(value):
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    edges = getattr(value, 'edges', None)
+    if isinstance(edges, list):
+        return len(edges)
+    return None
+
+
+def measured_batch(name, batch_load_fn):
+    '''Wraps the batch function of a DataLoader so its queries are recorded under `name`.'''
+    def batch(keys):
+        span = Span(name)
+        with running(span):
+            result = batch_load_fn(keys)
+        finish(span, list(keys))
+        return result
+    return batch
+
+
+
+'''----------------------------MIDDLEWARE----------------------------'''
+
+class MetricsMiddleware(object):
+    '''Records the wall time, SQL queries and result size of every resolver returning objects.
+
+    Scalar fields are read from rows that are already loaded and are skipped.
+    Querysets are evaluated while the resolver's span is open, so their
+    query counts towards the field that returned them; rows loaded through
+    DataLoaders count towards the `loader.<name>` batch instead.
+    '''
+
+    def resolve(self, next, root, info, **args):
+        if isinstance(get_named_type(info.return_type), (GraphQLScalarType, GraphQLEnumType)):
+            return next(root, info, **args)
+
+        span = Span('{}.{}'.format(info.parent_type.name, info.field_name),
+                    info.path, info.parent_type.name, str(info.return_type))
+        with running(span):
+            result = next(root, info, **args)
+        if is_thenable(result):
+            return Promise.resolve(result).then(lambda value: self.complete(span, value))
+        return self.complete(span, result)
+
+    @staticmethod
+    def complete(span, value):
+        with running(span):
+            value = evaluate(value)
+        finish(span, value)
+        return value
+
+
+def evaluate(value):
+    '''Runs the queries of a returned queryset, or list of querysets, and returns their rows.'''
+    if isinstance(value, QuerySet):
+        return list(value)
+    if isinstance(value, list) and any(isinstance(item, QuerySet) for item in value):
+        # e.g. the [my tasks, other tasks] lists of Query.tasks
+        return [list(item) if isinstance(item, QuerySet) else item for item in value]
+    return value
+
+
+
+'''----------------------------REPORTING----------------------------'''
+
+def tracing(operation):
+    '''The operation's spans in the Apollo tracing format, plus the SQL queries of each.'''
+    nanoseconds = lambda seconds: int(seconds * 1e9)
+    return {
+        'version': 1,
+        'startTime': operation.started_at.isoformat(),
+        'endTime': datetime.now(timezone.utc).isoformat(),
+        'duration': nanoseconds(time.perf_counter() - operation.start),
+        'sqlQueries': operation.queries,
+        'execution': {
+            'resolvers': [
+                {
+                    'path': span.path,
+                    'parentType': span.parent_type,
+                    'fieldName': span.name.rpartition('.')[2],
+                    'returnType': span.return_type,
+                    'startOffset': nanoseconds(span.start - operation.start),
+                    'duration': nanoseconds(span.duration),
+                    'sqlQueries': span.queries,
+                }
+                for span in operation.spans if span.path is not None
+            ],
+        },
+    }
+
+
+def log_if_slow(operation):
+    threshold = getattr(settings, 'GRAPHQL_SLOW_OPERATION_SECONDS', None)
+    if threshold is None or operation.duration < threshold:
+        return
+    slowest = sorted(operation.spans, key=lambda span: -span.duration)[:3]
+    logger.warning(
+        'slow operation=%s type=%s duration=%.3f queries=%s slowest=%s',
+        operation.name, operation.type, operation.duration, operation.queries,
+        ', '.join('{} {:.3f}s/{}q'.format(span.name, span.duration, span.queries) for span in slowest) or '-')
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.4 on 2026-10-17 21:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20200429_1858'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bill',
+            name='remaining_balance',
+        ),
+    ]
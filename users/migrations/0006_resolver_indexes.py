@@ -0,0 +1,33 @@
+# Generated by Django 2.2.10 on 2026-10-17 21:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_remove_bill_remaining_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['household', 'manager'], name='bill_household_manager_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billcycle',
+            index=models.Index(fields=['bill', 'recipient', 'is_paid'], name='cycle_bill_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billcycle',
+            index=models.Index(fields=['is_paid', 'date_paid'], name='cycle_paid_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completetask',
+            index=models.Index(fields=['household', 'date'], name='completetask_household_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['household', 'complete', 'due_date'], name='task_household_due_idx'),
+        ),
+    ]
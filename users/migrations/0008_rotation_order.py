@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def number_rotations(apps, schema_editor):
+    '''Orders each rotation by when its members were added and points the cursor at `current`.'''
+    RotationMember = apps.get_model('users', 'RotationMember')
+    Task = apps.get_model('users', 'Task')
+
+    member_ids, positions = defaultdict(list), {}
+    task_id, position = None, 0
+    for id, member_task_id, user_id in RotationMember.objects.order_by('task_id', 'id').values_list(
+            'id', 'task_id', 'user_id'):
+        position = position + 1 if member_task_id == task_id else 0
+        task_id = member_task_id
+        member_ids[position].append(id)
+        positions[task_id, user_id] = position
+
+    for position, ids in member_ids.items():
+        for i in range(0, len(ids), 500):
+            RotationMember.objects.filter(id__in=ids[i:i + 500]).update(position=position)
+
+    task_ids = defaultdict(list)
+    for id, current_id in Task.objects.filter(current__isnull=False).values_list('id', 'current_id'):
+        if (id, current_id) in positions:
+            task_ids[positions[id, current_id]].append(id)
+    for position, ids in task_ids.items():
+        for i in range(0, len(ids), 500):
+            Task.objects.filter(id__in=ids[i:i + 500]).update(rotation_position=position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_recurrence_indexes'),
+    ]
+
+    operations = [
+        # the implicit rotation table becomes RotationMember as-is
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RotationMember',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='users.Task')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rotation_members', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'users_task_rotation',
+                        'unique_together': {('task', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='task',
+                    name='rotation',
+                    field=models.ManyToManyField(related_name='rotation', through='users.RotationMember', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rotationmember',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='rotation_position',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(number_rotations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rotationmember',
+            index=models.Index(fields=['task', 'position'], name='rotation_task_position_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.10 on 2026-10-17 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_balances(apps, schema_editor):
+    '''Sums the unpaid cycles into the new table, as manage.py reconcile_balances --fix does.'''
+    from collections import defaultdict
+    from decimal import Decimal
+    from django.db.models import Sum
+
+    BillCycle = apps.get_model('users', 'BillCycle')
+    Balance = apps.get_model('users', 'Balance')
+
+    unpaid = BillCycle.objects.filter(is_paid=False)
+    balances = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    for row in unpaid.values('bill__household_id', 'bill__manager_id').annotate(total=Sum('amount')):
+        balances[row['bill__household_id'], row['bill__manager_id']][0] += row['total']
+    for row in unpaid.values('bill__household_id', 'recipient_id').annotate(total=Sum('amount')):
+        balances[row['bill__household_id'], row['recipient_id']][1] += row['total']
+    Balance.objects.bulk_create(
+        Balance(household_id=h, user_id=u, owed=owed, owes=owes)
+        for (h, u), (owed, owes) in balances.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_rotation_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Balance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owed', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('owes', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Household')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('household', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
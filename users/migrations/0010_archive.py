@@ -0,0 +1,43 @@
+# Generated by Django 2.2.10 on 2026-10-17 22:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCompleteTask',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Household')),
+                ('roommate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBillCycle',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('date_paid', models.DateField()),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Bill')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedcompletetask',
+            index=models.Index(fields=['household', 'date'], name='archivedtask_household_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbillcycle',
+            index=models.Index(fields=['date_paid'], name='archivedcycle_date_idx'),
+        ),
+    ]
@@ -84,12 +84,45 @@ class Task(models.Model):
                     related_name='current', 
                     on_delete=models.SET_NULL, 
                     null=True, blank=True)
-    rotation    = models.ManyToManyField(User, related_name='rotation')
+    rotation    = models.ManyToManyField(User, related_name='rotation', through='RotationMember')
     household   = models.ForeignKey(
                   Household, 
                   related_name='tasks',
                   on_delete = models.CASCADE
             )
+    # position of `current` in the rotation, the next roommate is the next position
+    rotation_position = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # tasks page: household tasks sorted by (complete, due_date)
+            models.Index(fields=['household', 'complete', 'due_date'], name='task_household_due_idx'),
+            # roll_forward: overdue tasks of every household
+            models.Index(fields=['due_date'], name='task_due_idx'),
+        ]
+
+
+class RotationMember(models.Model):
+    task        = models.ForeignKey(
+                Task,
+                related_name='members',
+                on_delete=models.CASCADE
+    )
+    user        = models.ForeignKey(
+                User,
+                related_name='rotation_members',
+                on_delete=models.CASCADE
+    )
+    position    = models.PositiveIntegerField()
+
+    class Meta:
+        # the table of the former implicit rotation many-to-many
+        db_table = 'users_task_rotation'
+        unique_together = ('task', 'user')
+        indexes = [
+            # next roommate of a task: first position after the cursor
+            models.Index(fields=['task', 'position'], name='rotation_task_position_idx'),
+        ]
 
 
 class CompleteTask(models.Model):
@@ -105,6 +138,12 @@ class CompleteTask(models.Model):
                 on_delete = models.CASCADE
         )
 
+    class Meta:
+        indexes = [
+            # completed task history of a household sorted by date
+            models.Index(fields=['household', 'date'], name='completetask_household_idx'),
+        ]
+
 
 
 
@@ -127,6 +166,14 @@ class Bill(models.Model):
                         on_delete = models.CASCADE
             )
 
+    class Meta:
+        indexes = [
+            # bills page: bills of a household managed / not managed by the user
+            models.Index(fields=['household', 'manager'], name='bill_household_manager_idx'),
+            # roll_forward: due inactive bills and open active bills of every household
+            models.Index(fields=['is_active', 'due_date'], name='bill_active_due_idx'),
+        ]
+
 
 class BillCycle(models.Model):
     bill        = models.ForeignKey(
@@ -137,4 +184,87 @@ class BillCycle(models.Model):
     recipient   = models.ForeignKey(User, on_delete=models.CASCADE)
     amount      = models.DecimalField(max_digits=8, decimal_places=2)
     is_paid     = models.BooleanField(default=False)     
-    date_paid   = models.DateField(null=True, blank=True)
\ No newline at end of file
+    date_paid   = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # unpaid cycles of a recipient on a bill
+            models.Index(fields=['bill', 'recipient', 'is_paid'], name='cycle_bill_recipient_idx'),
+            # paid cycle history sorted by payment date
+            models.Index(fields=['is_paid', 'date_paid'], name='cycle_paid_date_idx'),
+        ]
+
+
+
+'''----------------------------BALANCES----------------------------''' 
+
+class Balance(models.Model):
+    household   = models.ForeignKey(
+                Household,
+                related_name='+',
+                on_delete=models.CASCADE
+    )
+    user        = models.ForeignKey(
+                User,
+                related_name='+',
+                on_delete=models.CASCADE
+    )
+    # unpaid shares of the bills this user manages
+    owed        = models.DecimalField(default=0, max_digits=10, decimal_places=2)
+    # this user's own unpaid shares
+    owes        = models.DecimalField(default=0, max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ('household', 'user')
+
+
+
+'''----------------------------ARCHIVE----------------------------''' 
+
+class ArchivedCompleteTask(models.Model):
+    '''A CompleteTask moved out of the live table by manage.py archive_history.
+
+    Keeps the id and columns of the original row, so archived rows are served
+    as CompleteTask by the history queries (see users.archive).
+    '''
+    id          = models.IntegerField(primary_key=True)
+    name        = models.CharField(max_length=64)
+    roommate    = models.ForeignKey(
+                User,
+                related_name='+',
+                on_delete=models.CASCADE
+    )
+    date        = models.DateField()
+    household   = models.ForeignKey(
+                Household,
+                related_name='+',
+                on_delete=models.CASCADE
+    )
+
+    class Meta:
+        indexes = [
+            # older pages of the completed task history of a household
+            models.Index(fields=['household', 'date'], name='archivedtask_household_idx'),
+        ]
+
+
+class ArchivedBillCycle(models.Model):
+    '''A paid BillCycle moved out of the live table by manage.py archive_history.'''
+    id          = models.IntegerField(primary_key=True)
+    bill        = models.ForeignKey(
+                Bill,
+                related_name='+',
+                on_delete=models.CASCADE
+    )
+    recipient   = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    amount      = models.DecimalField(max_digits=8, decimal_places=2)
+    date_paid   = models.DateField()
+
+    # only paid cycles are archived
+    is_paid     = True
+
+    class Meta:
+        indexes = [
+            # older pages of the paid cycle history sorted by payment date
+            models.Index(fields=['date_paid'], name='archivedcycle_date_idx'),
+        ]
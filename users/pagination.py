@@ -0,0 +1,113 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from graphene.relay import PageInfo
+
+
+'''----------------------------CURSORS----------------------------'''
+
+def encode_cursor(row, keys):
+    '''Encodes the values of the ordering keys of `row` as an opaque cursor.'''
+    values = [str(getattr(row, key.lstrip('-'))) for key in keys]
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, model, keys):
+    '''Returns the ordering key values stored in `cursor`, converted back to python.'''
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        assert len(values) == len(keys)
+        return [model._meta.get_field(key.lstrip('-')).to_python(v) for key, v in zip(keys, values)]
+    except Exception:
+        raise Exception('Invalid cursor')
+
+
+def seek(keys, values, forward=True):
+    '''Builds the keyset condition selecting rows past `values` in the order of `keys`.
+
+    For keys ('-date', '-id') moving forward this is
+    date < d OR (date = d AND id < i), which the (household, date) style
+    indexes can answer without counting skipped rows like OFFSET does.
+    '''
+    conditions = []
+    for i, key in enumerate(keys):
+        name = key.lstrip('-')
+        descending = key.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        equal = {k.lstrip('-'): v for k, v in zip(keys[:i], values[:i])}
+        conditions.append(Q(**equal) & Q(**{'{}__{}'.format(name, lookup): values[i]}))
+    return reduce(or_, conditions)
+
+
+
+'''----------------------------CONNECTIONS----------------------------'''
+
+def fetch(segments, keys, after=None, before=None, limit=None):
+    '''The first `limit` rows of `segments` ordered by `keys`, between the `after` and `before` cursors.
+
+    Each segment is queried only while the earlier ones have not filled the page.
+    '''
+    rows = []
+    for queryset in segments:
+        model = queryset.model
+        page = queryset.order_by(*keys)
+        if after:
+            page = page.filter(seek(keys, decode_cursor(after, model, keys)))
+        if before:
+            page = page.filter(seek(keys, decode_cursor(before, model, keys), forward=False))
+        rows.extend(page[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def keyset_connection(connection_type, queryset, keys, first=None, after=None, last=None, before=None):
+    '''Returns one page of `queryset` ordered by `keys` as a relay connection.
+
+    `keys` must end in a unique column (normally 'id' or '-id') so every row
+    has a distinct cursor. Pages are fetched with a WHERE on the cursor values
+    rather than OFFSET, so the cost of a page does not grow with its depth.
+
+    `queryset` may also be a sequence of querysets whose rows follow each
+    other in the order of `keys` (e.g. live rows, then archived ones); the
+    page continues from one into the next.
+
+    Given both `first` and `last`, the page is the last `last` rows of the
+    first `first`, as in the Relay specification.
+    '''
+    for name, value in (('first', first), ('last', last)):
+        if value is not None and value < 0:
+            raise Exception('Argument "{}" must be a non-negative integer'.format(name))
+
+    max_size = getattr(settings, 'GRAPHQL_MAX_PAGE_SIZE', 100)
+    segments = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+
+    if last is not None and first is None:
+        # walk backwards from `before` down to `after`, then restore the forward order
+        size = min(last, max_size)
+        reverse = [k[1:] if k.startswith('-') else '-' + k for k in keys]
+        rows = fetch(segments[::-1], reverse, after=before, before=after, limit=size + 1)
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        page_info = PageInfo(has_previous_page=has_more, has_next_page=False)
+
+    else:
+        size = min(first if first is not None else getattr(settings, 'GRAPHQL_PAGE_SIZE', 20), max_size)
+        rows = fetch(segments, keys, after=after, before=before, limit=size + 1)
+        has_more = len(rows) > size
+        rows = rows[:size]
+        page_info = PageInfo(has_previous_page=False, has_next_page=has_more)
+        if last is not None:
+            page_info.has_previous_page = len(rows) > last
+            rows = rows[len(rows) - min(last, len(rows)):]
+
+    edges = [connection_type.Edge(node=row, cursor=encode_cursor(row, keys)) for row in rows]
+    if edges:
+        page_info.start_cursor = edges[0].cursor
+        page_info.end_cursor = edges[-1].cursor
+
+    return connection_type(edges=edges, page_info=page_info)
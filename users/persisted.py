@@ -0,0 +1,117 @@
+import os
+import threading
+from functools import partial
+from hashlib import sha256
+
+from django.conf import settings
+from graphql.backend import GraphQLBackend, GraphQLDocument, get_default_backend
+from graphql.backend.core import execute_and_validate
+from graphql.language.parser import parse
+
+from .cost import validate_document
+
+
+def query_hash(query):
+    return sha256(query.encode('utf-8')).hexdigest()
+
+
+'''----------------------------REGISTRY----------------------------'''
+
+class PersistedQueryRegistry(object):
+    '''Parsed and validated documents of the operations a client may send by hash.
+
+    Documents are validated once when registered; executing them skips the
+    parse and validation steps entirely.
+    '''
+
+    def __init__(self, schema, max_size=1000):
+        self.schema = schema
+        self.max_size = max_size
+        self.by_hash = {}
+        self.by_query = {}
+        self.lock = threading.Lock()
+
+    def register(self, query):
+        '''Parses and validates `query`, raising its first error if it is invalid.'''
+        document = self.get(query_hash(query))
+        if document is not None:
+            return document
+
+        document_ast = parse(query)
+        errors, costs = validate_document(self.schema, document_ast)
+        if errors:
+            raise errors[0]
+
+        document = GraphQLDocument(
+            schema=self.schema,
+            document_string=query,
+            document_ast=document_ast,
+            execute=partial(execute_and_validate, self.schema, document_ast, validate=False),
+        )
+        document.costs = costs
+        with self.lock:
+            self.by_hash[query_hash(query)] = document
+            self.by_query[query] = document
+        return document
+
+    def register_automatic(self, query):
+        '''Registers a query sent by a client, unless it is invalid or the registry is full.'''
+        if len(self.by_hash) >= self.max_size:
+            return None
+        try:
+            return self.register(query)
+        except Exception:
+            return None  # the normal execution path reports the errors
+
+    def load_directory(self, path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.graphql'):
+                with open(os.path.join(path, name)) as f:
+                    self.register(f.read())
+
+    def get(self, sha):
+        return self.by_hash.get(sha)
+
+    def lookup(self, query):
+        return self.by_query.get(query)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(schema):
+    '''Returns the registry of `schema`, loading GRAPHQL_PERSISTED_QUERIES_DIR on first use.'''
+    with _registries_lock:
+        registry = _registries.get(schema)
+        if registry is None:
+            registry = PersistedQueryRegistry(
+                schema, getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_MAX', 1000))
+            path = getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_DIR', None)
+            if path:
+                registry.load_directory(path)
+            _registries[schema] = registry
+        return registry
+
+
+
+'''----------------------------BACKEND----------------------------'''
+
+class PersistedQueryBackend(GraphQLBackend):
+    '''Serves registered documents as-is and falls back to `backend` for the rest.
+
+    In strict mode queries that are not registered are rejected.
+    '''
+
+    def __init__(self, registry, strict=False, backend=None):
+        self.registry = registry
+        self.strict = strict
+        self.backend = backend or get_default_backend()
+
+    def document_from_string(self, schema, request_string):
+        document = self.registry.lookup(request_string)
+        if document is not None:
+            return document
+        if self.strict:
+            raise Exception('Query is not a persisted query')
+        return self.backend.document_from_string(schema, request_string)
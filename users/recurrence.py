@@ -0,0 +1,184 @@
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+
+from .models import Task, RotationMember, Bill
+from .billing import activate_bills, due_bills
+from .cache import invalidate_household
+from .events import change, record_change
+
+logger = logging.getLogger('users.recurrence')
+
+
+# a frequency is a unit followed by a count, e.g. 'W2' is every two weeks; 'X' never repeats
+UNITS = {
+    'D': lambda num: timedelta(days=num),
+    'W': lambda num: timedelta(weeks=num),
+    'M': lambda num: relativedelta(months=num),
+    'Y': lambda num: relativedelta(years=num),
+}
+
+# rows advanced per transaction by the roll_forward command
+CHUNK_SIZE = 500
+
+
+'''----------------------------FREQUENCIES----------------------------'''
+
+def parse_frequency(frequency):
+    '''Returns the (unit, count) of a frequency such as 'W2'.'''
+    unit, num = frequency[:1], frequency[1:]
+    if unit != 'X' and (unit not in UNITS or not num.isdigit() or int(num) < 1):
+        raise Exception('Invalid frequency {}'.format(frequency))
+    return unit, int(num) if num.isdigit() else 0
+
+
+def is_one_off(frequency):
+    return parse_frequency(frequency)[0] == 'X'
+
+
+def next_due_date(due_date, frequency):
+    '''Due date of the next occurrence, or None for one-off ('X') frequencies.'''
+    unit, num = parse_frequency(frequency)
+    if unit == 'X':
+        return None
+    return due_date + UNITS[unit](num)
+
+
+def next_in_rotation(members, cursor, steps=1):
+    '''The member `steps` places after the `cursor` position, wrapping around.
+
+    `members` are (position, user id) pairs sorted by position. A cursor of
+    None (the current roommate is not in the rotation) counts from before the
+    first member. Returns None for an empty rotation.
+    '''
+    if not members:
+        return None
+    index = -1 if cursor is None else bisect_right([p for p, _ in members], cursor) - 1
+    return members[(index + steps) % len(members)]
+
+
+
+'''----------------------------ROLLING FORWARD----------------------------'''
+
+def overdue_tasks(today=None):
+    '''Repeating tasks whose due date has passed.'''
+    return Task.objects.filter(due_date__lt=today or date.today()).exclude(frequency__startswith='X')
+
+
+def paid_bills():
+    '''Active bills whose every cycle has been paid.'''
+    return Bill.objects.filter(is_active=True, cycles__isnull=False).exclude(cycles__is_paid=False).distinct()
+
+
+def in_chunks(queryset, chunk_size):
+    '''Yields lists of rows of `queryset` by increasing id, re-running it for each chunk.
+
+    The query is evaluated again for every chunk, so rows handled by an earlier
+    run (or another worker) drop out of it.
+    '''
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def roll_tasks(today=None, chunk_size=CHUNK_SIZE):
+    '''Moves overdue tasks to their first occurrence from `today` on.
+
+    Each missed occurrence passes the task to the next member of its rotation.
+    Tasks with an invalid frequency are logged and left where they are.
+    Returns the number of tasks moved.
+    '''
+    today = today or date.today()
+    count = 0
+    for tasks in in_chunks(overdue_tasks(today), chunk_size):
+        rotations = defaultdict(list)
+        rows = RotationMember.objects.filter(task_id__in=[t.id for t in tasks]).order_by('task_id', 'position')
+        for task_id, position, user_id in rows.values_list('task_id', 'position', 'user_id'):
+            rotations[task_id].append((position, user_id))
+
+        changes = defaultdict(list)
+        for task in tasks:
+            try:
+                parse_frequency(task.frequency)
+            except Exception as e:
+                logger.error('Not rolling task %s forward: %s', task.id, e)
+                continue
+            due_date, steps = task.due_date, 0
+            while due_date < today:
+                due_date, steps = next_due_date(due_date, task.frequency), steps + 1
+            position, current = (next_in_rotation(rotations[task.id], task.rotation_position, steps)
+                                 or (task.rotation_position, task.current_id))
+            changes[due_date, current, position].append(task)
+
+        with transaction.atomic():
+            # tasks sharing a due date and assignee are moved by one UPDATE
+            for (due_date, current, position), moved in changes.items():
+                Task.objects.filter(id__in=[t.id for t in moved], due_date__lt=today).update(
+                    due_date=due_date, current_id=current, rotation_position=position, complete=False)
+                for task in moved:
+                    record_change(task.household_id, change(
+                        'task', 'update', task.id, {'dueDate': due_date, 'current': current, 'complete': False}))
+            # updates bypass the post_save signals
+            for household_id in {t.household_id for moved in changes.values() for t in moved}:
+                invalidate_household(household_id)
+        count += sum(len(moved) for moved in changes.values())
+    return count
+
+
+def reset_bills(chunk_size=CHUNK_SIZE):
+    '''Closes fully paid bills: they become inactive with no balance, due one period later.
+
+    One-off bills are deleted instead; bills with an invalid frequency are
+    logged and left open. Returns the number of bills closed.
+    '''
+    count = 0
+    for bills in in_chunks(paid_bills(), chunk_size):
+        changes = defaultdict(list)
+        for bill in bills:
+            try:
+                changes[next_due_date(bill.due_date, bill.frequency)].append(bill)
+            except Exception as e:
+                logger.error('Not closing bill %s: %s', bill.id, e)
+
+        with transaction.atomic():
+            for due_date, closed in changes.items():
+                ids = [b.id for b in closed]
+                if due_date is None:
+                    Bill.objects.filter(id__in=ids, is_active=True).delete()
+                    continue
+                Bill.objects.filter(id__in=ids, is_active=True).update(
+                    due_date=due_date, total_balance=Decimal('0.00'), is_active=False)
+                for bill in closed:
+                    record_change(bill.household_id, change('bill', 'update', bill.id, {
+                        'dueDate': due_date, 'totalBalance': Decimal('0.00'), 'isActive': False}))
+            for household_id in {b.household_id for closed in changes.values() for b in closed}:
+                invalidate_household(household_id)
+        count += sum(len(closed) for closed in changes.values())
+    return count
+
+
+def activate_bills_due(today=None, chunk_size=CHUNK_SIZE):
+    '''Activates due bills, each chunk in its own transaction. Returns the number activated.'''
+    count = 0
+    for bills in in_chunks(due_bills(today), chunk_size):
+        activate_bills(bills)
+        count += len(bills)
+    return count
+
+
+def roll_forward(today=None, chunk_size=CHUNK_SIZE):
+    '''Runs every recurrence step. Safe to run again or to resume after a failure.'''
+    return {
+        'tasks': roll_tasks(today, chunk_size),
+        'closed bills': reset_bills(chunk_size),
+        'activated bills': activate_bills_due(today, chunk_size),
+    }
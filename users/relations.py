@@ -0,0 +1,40 @@
+from django.db import transaction
+
+from .models import User
+
+
+def get_users(ids):
+    '''Fetches the users with `ids` in one query, keyed by id.
+
+    Raises one error listing every id that does not exist.
+    '''
+    ids = set(ids)
+    users = User.objects.in_bulk(ids)
+    missing = sorted(ids - set(users))
+    if missing:
+        raise Exception('Unknown user ids: {}'.format(', '.join(str(i) for i in missing)))
+    return users
+
+
+def update_members(relation, add=(), remove=()):
+    '''Adds and removes users of a many-to-many `relation` by id.
+
+    The ids are resolved in one query and diffed against the current members,
+    then applied with one bulk add and one bulk remove. An id both added and
+    removed ends up removed. Returns the number of users added and removed.
+    '''
+    add, remove = set(add or ()), set(remove or ())
+    if not add and not remove:
+        return 0, 0
+
+    with transaction.atomic():
+        users = get_users(add | remove)
+        current = set(relation.values_list('id', flat=True))
+        members = (current | add) - remove
+        added = [users[i] for i in sorted(members - current)]
+        removed = [users[i] for i in sorted(current - members)]
+        if added:
+            relation.add(*added)
+        if removed:
+            relation.remove(*removed)
+    return len(added), len(removed)
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField
+
+from .models import Task, RotationMember
+from .relations import get_users
+from .cache import invalidate_household
+from .events import change, record_change
+
+
+'''----------------------------ORDER----------------------------'''
+
+def unique(ids):
+    '''`ids` without duplicates, in their first-seen order.'''
+    seen = set()
+    return [i for i in ids if not (i in seen or seen.add(i))]
+
+
+def set_rotation(task, user_ids):
+    '''Replaces the rotation of a newly created task with `user_ids`, in that order.'''
+    user_ids = unique(user_ids)
+    get_users(user_ids)
+    with transaction.atomic():
+        RotationMember.objects.filter(task=task).delete()
+        RotationMember.objects.bulk_create(
+            RotationMember(task=task, user_id=user_id, position=position)
+            for position, user_id in enumerate(user_ids)
+        )
+        sync_cursor(task)
+        invalidate_household(task.household_id)
+        record_change(task.household_id, change('rotation', 'update', task.id))
+
+
+def update_rotation(task, add=(), remove=()):
+    '''Adds users at the end of the rotation and removes others, by id.
+
+    Follows users.relations.update_members: one query resolves the ids, the
+    diff is computed in memory and applied with one insert and one delete.
+    Removing members leaves gaps in the positions, which keeps the cursor valid.
+    '''
+    add, remove = unique(add or ()), set(remove or ())
+    if not add and not remove:
+        return 0, 0
+
+    with transaction.atomic():
+        get_users(set(add) | remove)
+        current = dict(RotationMember.objects.filter(task=task).values_list('user_id', 'position'))
+        added = [i for i in add if i not in current and i not in remove]
+        removed = [i for i in remove if i in current]
+        if removed:
+            RotationMember.objects.filter(task=task, user_id__in=removed).delete()
+        if added:
+            start = max(current.values()) + 1 if current else 0
+            RotationMember.objects.bulk_create(
+                RotationMember(task=task, user_id=user_id, position=start + i)
+                for i, user_id in enumerate(added)
+            )
+        invalidate_household(task.household_id)
+        record_change(task.household_id, change('rotation', 'update', task.id))
+    return len(added), len(removed)
+
+
+def reorder_rotation(task, user_ids):
+    '''Puts the members of the rotation in the order of `user_ids` with one UPDATE.'''
+    user_ids = unique(user_ids)
+    with transaction.atomic():
+        members = set(RotationMember.objects.filter(task=task).values_list('user_id', flat=True))
+        if set(user_ids) != members:
+            raise Exception('New order must list every member of the rotation exactly once')
+        RotationMember.objects.filter(task=task).update(position=Case(
+            *[When(user_id=user_id, then=Value(position)) for position, user_id in enumerate(user_ids)],
+            output_field=IntegerField()
+        ))
+        sync_cursor(task)
+        invalidate_household(task.household_id)
+        record_change(task.household_id, change('rotation', 'update', task.id))
+
+
+def sync_cursor(task):
+    '''Points the cursor of `task` at the position of its current roommate, if in the rotation.'''
+    task.rotation_position = (RotationMember.objects
+                              .filter(task=task, user_id=task.current_id)
+                              .values_list('position', flat=True)
+                              .first())
+    Task.objects.filter(id=task.id).update(rotation_position=task.rotation_position)
+
+
+
+'''----------------------------ADVANCING----------------------------'''
+
+def next_member(task):
+    '''The member after the cursor, wrapping to the first one; None for an empty rotation.'''
+    members = RotationMember.objects.filter(task=task).select_related('user').order_by('position')
+    if task.rotation_position is not None:
+        member = members.filter(position__gt=task.rotation_position).first()
+        if member is not None:
+            return member
+    return members.first()
+
+
+def advance_rotation(task):
+    '''Hands `task` over to the next roommate of its rotation (unsaved).'''
+    member = next_member(task)
+    if member is not None:
+        task.current = member.user
+        task.rotation_position = member.position
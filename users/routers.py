@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import is_pinned
+
+
+_state = threading.local()
+
+
+'''----------------------------ROUTING----------------------------'''
+
+class ReplicaRouter:
+    '''Routes reads made inside `reading_from(alias)` to that alias; everything else to the primary.
+
+    RoomGraphQLView opens such a block around query operations (see
+    read_alias), so mutations, authentication and the code outside GraphQL
+    keep reading what they write.
+    '''
+
+    def db_for_read(self, model, **hints):
+        return current_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+
+def current_alias():
+    '''The alias reads of the current thread go to, None for the primary.'''
+    return getattr(_state, 'alias', None)
+
+
+@contextmanager
+def reading_from(alias):
+    '''Sends the reads of the current thread to `alias` (None for the primary) within the block.'''
+    previous = current_alias()
+    _state.alias = alias
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+
+'''----------------------------HINTS----------------------------'''
+
+def replica_alias():
+    return getattr(settings, 'REPLICA_DATABASE', None)
+
+
+def read_alias(user, operation_type):
+    '''Database alias the resolvers of an operation read from, None for the primary.
+
+    Only queries go to the replica, and not those of a household written to in
+    the last READ_YOUR_WRITES_SECONDS (every write pins it, see
+    users.cache.invalidate_household).
+    '''
+    alias = replica_alias()
+    if alias is None or operation_type != 'query':
+        return None
+    household_id = getattr(user, 'household_id', None)
+    if household_id is not None and is_pinned(household_id):
+        return None
+    return alias
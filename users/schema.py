@@ -1,12 +1,26 @@
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import transaction
 import graphene
+from graphene import relay
 from graphene_django import DjangoObjectType
-from datetime import datetime, timedelta
+from datetime import datetime
 from datetime import date as date_o
-from dateutil.relativedelta import relativedelta
-from .models import User, Household, Task, CompleteTask, Bill, BillCycle
+from .models import User, Household, Task, CompleteTask, Bill, BillCycle, Balance, ArchivedCompleteTask, ArchivedBillCycle
+from .loaders import load_one, load_many
+from .pagination import keyset_connection
+from .projection import project
+from .cache import invalidate_household
+from .events import change, record_change
+from .billing import activate_bill
+from .relations import get_users, update_members
+from .rotation import set_rotation, update_rotation, reorder_rotation, sync_cursor, advance_rotation
+from .recurrence import next_due_date, parse_frequency
+from .bulk import create_tasks, update_tasks, delete_tasks, pay_bill_cycles
+from .ledger import shift_balances, cycle_shares
+from .archive import complete_task_history, paid_cycle_history
 from copy import deepcopy
-from decimal import Decimal, ROUND_UP
+from decimal import Decimal
 
 
 '''----------------------------USERS----------------------------''' 
@@ -15,6 +29,27 @@ class UserType(DjangoObjectType):
     class Meta:
         model = User
 
+    def resolve_household(self, info):
+        return load_one(info, self, 'household', 'household')
+
+    def resolve_current(self, info):
+        return load_many(info, self, 'current', 'user_current_tasks')
+
+    def resolve_rotation(self, info):
+        return load_many(info, self, 'rotation', 'user_rotation_tasks')
+
+    def resolve_manager(self, info):
+        return load_many(info, self, 'manager', 'user_managed_bills')
+
+    def resolve_participants(self, info):
+        return load_many(info, self, 'participants', 'user_participant_bills')
+
+    def resolve_billcycle_set(self, info):
+        return load_many(info, self, 'billcycle_set', 'user_cycles')
+
+    def resolve_completetask_set(self, info):
+        return load_many(info, self, 'completetask_set', 'user_complete_tasks')
+
 
 class CreateUser(graphene.Mutation):
     user = graphene.Field(UserType)
@@ -54,8 +89,12 @@ class UpdateUser(graphene.Mutation):
 
     def mutate(self, info, user_data):
         user = info.context.user
+        # saving only the changed fields leaves last_login (auto_now) alone
+        fields = []
+        old_household_id = user.household_id
 
         for k, v in user_data.items():
+            fields.append(k)
             if k == 'password' and v is not None:
                 user.set_password(v)
 
@@ -63,6 +102,7 @@ class UpdateUser(graphene.Mutation):
                 household = Household.objects.get(id=v)
                 if not household:
                     raise Exception('Household not in database')
+                invalidate_household(user.household_id)  # leaving the old household
                 setattr(user, 'household', household)
 
             else:
@@ -70,7 +110,9 @@ class UpdateUser(graphene.Mutation):
         
         try:
             user.full_clean()
-            user.save()
+            user.save(update_fields=fields)
+            if user.household_id != old_household_id:
+                record_change(old_household_id, change('user', 'delete', user.id))
             return UpdateUser(user=user)
         
         except ValidationError as e:
@@ -99,6 +141,18 @@ class HouseholdType(DjangoObjectType):
     class Meta:
         model = Household
 
+    def resolve_users(self, info):
+        return load_many(info, self, 'users', 'household_users')
+
+    def resolve_tasks(self, info):
+        return load_many(info, self, 'tasks', 'household_tasks')
+
+    def resolve_complete_tasks(self, info):
+        return load_many(info, self, 'complete_tasks', 'household_complete_tasks')
+
+    def resolve_bills(self, info):
+        return load_many(info, self, 'bills', 'household_bills')
+
 
 class CreateHousehold(graphene.Mutation):
     household = graphene.Field(HouseholdType)
@@ -108,10 +162,12 @@ class CreateHousehold(graphene.Mutation):
 
     def mutate(self, info, name):
         user = info.context.user
+        invalidate_household(user.household_id)  # leaving the old household
+        record_change(user.household_id, change('user', 'delete', user.id))
         household = Household(name=name)
         household.save()
         setattr(user, 'household', household)
-        user.save()
+        user.save(update_fields=['household'])
         return CreateHousehold(household=household)
         
 
@@ -151,11 +207,31 @@ class TaskType(DjangoObjectType):
     class Meta:
         model = Task
 
+    def resolve_current(self, info):
+        return load_one(info, self, 'current', 'user')
+
+    def resolve_rotation(self, info):
+        return load_many(info, self, 'rotation', 'task_rotation')
+
+    def resolve_household(self, info):
+        return load_one(info, self, 'household', 'household')
+
 
 class CompleteTaskType(DjangoObjectType):
     class Meta:
         model = CompleteTask
 
+    @classmethod
+    def is_type_of(cls, root, info):
+        # archived rows keep the columns of the live ones
+        return isinstance(root, (CompleteTask, ArchivedCompleteTask))
+
+    def resolve_roommate(self, info):
+        return load_one(info, self, 'roommate', 'user')
+
+    def resolve_household(self, info):
+        return load_one(info, self, 'household', 'household')
+
 
 class CreateTask(graphene.Mutation):
     task = graphene.Field(TaskType)
@@ -168,6 +244,7 @@ class CreateTask(graphene.Mutation):
         current     = graphene.Int()
         rotation    = graphene.List(graphene.Int)
 
+    @transaction.atomic
     def mutate(self, info, name, description, due_date, frequency, current=None, rotation=None):
         user = info.context.user
         task = Task(
@@ -179,12 +256,13 @@ class CreateTask(graphene.Mutation):
         )
         if current:
             setattr(task, 'current', User.objects.get(id=current))
+        # an invalid frequency would stop roll_forward at this task
+        parse_frequency(task.frequency)
         task.full_clean()
         task.save()
 
         if rotation:
-            for r_id in rotation:
-                task.rotation.add(User.objects.get(id=r_id))
+            set_rotation(task, rotation)
 
         return CreateTask(task=task)
         
@@ -200,6 +278,7 @@ class TaskInput(graphene.InputObjectType):
     complete        = graphene.Boolean()
     add_rotation    = graphene.List(graphene.Int)
     remove_rotation = graphene.List(graphene.Int)
+    rotation_order  = graphene.List(graphene.Int)
 
 
 class UpdateTask(graphene.Mutation):
@@ -208,13 +287,18 @@ class UpdateTask(graphene.Mutation):
     class Arguments:
         task_data = TaskInput(required=True)
     
+    @transaction.atomic
     def mutate(self, info, task_data):
         task = Task.objects.get(id=task_data['task_id'])
+        update_rotation(task, task_data.get('add_rotation'), task_data.get('remove_rotation'))
 
         for k, v in task_data.items():
-            if k == 'task_id':
+            if k in ('task_id', 'add_rotation', 'remove_rotation'):
                 continue
 
+            elif k == 'rotation_order' and v is not None:
+                reorder_rotation(task, v)
+
             elif k == 'due_date' and v is not None:
                 new_date = datetime.strptime(v, '%d%m%Y').date()
                 setattr(task, k, new_date)
@@ -222,6 +306,7 @@ class UpdateTask(graphene.Mutation):
             elif k == 'current' and v is not None:
                 new_current = User.objects.get(id=v)
                 setattr(task, k, new_current)
+                sync_cursor(task)
                 
             elif k == 'complete' and v is not None:
                 if v:   # if changing completed to true
@@ -235,62 +320,26 @@ class UpdateTask(graphene.Mutation):
                     done_task.full_clean()
                     done_task.save()
                     
-                    unit, num = task.frequency[0], int(task.frequency[1:])
-                    if unit == 'X':
+                    next_date = next_due_date(task.due_date, task.frequency)
+                    if next_date is None:
                         setattr(task, 'name', 'deleted')
                         ret = deepcopy(task)
                         task.delete()
                         return UpdateTask(task=ret)
-                    elif unit == 'D':
-                        delta = timedelta(days=num)
-                    elif unit == 'W':
-                        delta = timedelta(weeks=num)
-                    elif unit == 'M':
-                        delta = relativedelta(months=num)
-                    elif unit == 'Y':
-                        delta = relativedelta(years=num)
                     # updating to next due date based on frequency
-                    next_date = task.due_date + delta
                     setattr(task, 'due_date', next_date)
                     setattr(task, k, False) # setting complete to false
 
-                    if task.rotation.all().exists():
-                        # update current to next in rotation
-                        start = True
-                        up_next = False
-                        for r in task.rotation.all():
-                            if start:
-                                first = r
-                                start = False
-
-                            if up_next:
-                                setattr(task, 'current', r)
-                                task.full_clean()
-                                task.save()
-                                return UpdateTask(task=task)
-
-                            if r == task.current:
-                                up_next = True
-                
-                        # if here, current was last, so first is next
-                        setattr(task, 'current', first)
+                    # update current to next in rotation
+                    advance_rotation(task)
 
                 else:   # if changing to false
                     setattr(task, k, v)
             
-            elif k == 'add_rotation' and v is not None:
-                for r_id in v:
-                    if not task.rotation.filter(id=r_id).exists():
-                        task.rotation.add(User.objects.get(id=r_id))
-            
-            elif k == 'remove_rotation' and v is not None:
-                for r_id in v:
-                    if task.rotation.filter(id=r_id).exists():
-                        task.rotation.remove(User.objects.get(id=r_id))
-
             else:
                 setattr(task, k, v)
             
+            parse_frequency(task.frequency)
             task.full_clean()
             task.save()
 
@@ -310,6 +359,61 @@ class DeleteTask(graphene.Mutation):
         return DeleteTask(ok=True)
 
 
+class NewTaskInput(graphene.InputObjectType):
+    name        = graphene.String(required=True)
+    description = graphene.String(required=True)
+    due_date    = graphene.String(required=True)
+    frequency   = graphene.String(required=True)
+    current     = graphene.Int()
+    rotation    = graphene.List(graphene.Int)
+
+
+class TaskResult(graphene.ObjectType):
+    task    = graphene.Field(TaskType)
+    error   = graphene.String()
+
+
+class DeleteResult(graphene.ObjectType):
+    id      = graphene.Int()
+    ok      = graphene.Boolean()
+    error   = graphene.String()
+
+
+class CreateTasks(graphene.Mutation):
+    results = graphene.List(TaskResult)
+
+    class Arguments:
+        tasks = graphene.List(NewTaskInput, required=True)
+
+    def mutate(self, info, tasks):
+        results = create_tasks(info.context.user, tasks)
+        return CreateTasks(results=[TaskResult(task=task, error=error) for task, error in results])
+
+
+class UpdateTasks(graphene.Mutation):
+    results = graphene.List(TaskResult)
+
+    class Arguments:
+        tasks = graphene.List(TaskInput, required=True)
+
+    def mutate(self, info, tasks):
+        results = update_tasks(info.context.user, tasks)
+        return UpdateTasks(results=[TaskResult(task=task, error=error) for task, error in results])
+
+
+class DeleteTasks(graphene.Mutation):
+    results = graphene.List(DeleteResult)
+
+    class Arguments:
+        task_ids = graphene.List(graphene.Int, required=True)
+
+    def mutate(self, info, task_ids):
+        errors = delete_tasks(info.context.user, task_ids)
+        return DeleteTasks(results=[
+            DeleteResult(id=task_id, ok=error is None, error=error) for task_id, error in zip(task_ids, errors)
+        ])
+
+
 
 
 '''----------------------------BILLS----------------------------''' 
@@ -317,11 +421,33 @@ class BillType(DjangoObjectType):
     class Meta:
         model = Bill
 
+    def resolve_manager(self, info):
+        return load_one(info, self, 'manager', 'user')
+
+    def resolve_participants(self, info):
+        return load_many(info, self, 'participants', 'bill_participants')
+
+    def resolve_cycles(self, info):
+        return load_many(info, self, 'cycles', 'bill_cycles')
+
+    def resolve_household(self, info):
+        return load_one(info, self, 'household', 'household')
+
 
 class BillCycleType(DjangoObjectType):
     class Meta:
         model = BillCycle
 
+    @classmethod
+    def is_type_of(cls, root, info):
+        return isinstance(root, (BillCycle, ArchivedBillCycle))
+
+    def resolve_bill(self, info):
+        return load_one(info, self, 'bill', 'bill')
+
+    def resolve_recipient(self, info):
+        return load_one(info, self, 'recipient', 'user')
+
 
 class CreateBill(graphene.Mutation):
     bill = graphene.Field(BillType)
@@ -333,8 +459,10 @@ class CreateBill(graphene.Mutation):
         participants    = graphene.List(graphene.Int)  
         total_balance   = graphene.Decimal()
     
+    @transaction.atomic
     def mutate(self, info, name, due_date, frequency, total_balance=0.00, participants=[]):
         user = info.context.user
+        participants = get_users(participants or [])
         bill = Bill(
             name=name,
             due_date=datetime.strptime(due_date, '%d%m%Y').date(),
@@ -344,11 +472,11 @@ class CreateBill(graphene.Mutation):
             num_split=len(participants)+1,
             household=Household.objects.get(id=user.household.id),
         )
+        parse_frequency(bill.frequency)
         bill.full_clean()
         bill.save()
         if participants:
-            for r_id in participants:
-                bill.participants.add(User.objects.get(id=r_id))
+            bill.participants.add(*participants.values())
 
         return CreateBill(bill=bill)
 
@@ -369,11 +497,15 @@ class UpdateBill(graphene.Mutation):
     class Arguments:
         bill_data = BillInput(required=True)
     
+    @transaction.atomic
     def mutate(self, info, bill_data):
         bill = Bill.objects.get(id=bill_data['bill_id'])
+        added, removed = update_members(
+            bill.participants, bill_data.get('add_participants'), bill_data.get('remove_participants'))
+        bill.num_split += added - removed
 
         for k, v in bill_data.items():
-            if k == 'bill_id':
+            if k in ('bill_id', 'add_participants', 'remove_participants'):
                 continue
             
             elif k == 'due date' and v is not None:
@@ -383,64 +515,21 @@ class UpdateBill(graphene.Mutation):
             elif k == 'total_balance' and v is not None:
                 setattr(bill, k, v)
                 
-            elif k == 'add_participants' and v is not None:
-                count = 0
-                for r_id in v:
-                    if not bill.participants.filter(id=r_id).exists():
-                        bill.participants.add(User.objects.get(id=r_id))
-                        count += 1
-                if count > 0:
-                    new_num = bill.num_split + count
-                    setattr(bill, 'num_split', new_num)
-            
-            elif k == 'remove_participants' and v is not None:
-                count = 0
-                for r_id in v:
-                    if bill.participants.filter(id=r_id).exists():
-                        bill.participants.remove(User.objects.get(id=r_id))
-                        count += 1
-                if count > 0:
-                    new_num = bill.num_split - count
-                    setattr(bill, 'num_split', new_num)
-
             elif k == 'is_active' and v is not None:
                 # if switching bill from inavtive to active
                 if v and not bill.is_active:
-                    if bill.participants: # if bill has participants
-                        setattr(bill, k, v)
-                        cents = Decimal('.01')
-                        amount = Decimal((bill.total_balance / bill.num_split).quantize(cents, rounding=ROUND_UP))
-                        for r in bill.participants.all():
-                            cycle = BillCycle (
-                                bill=bill,
-                                recipient=r,
-                                amount=amount
-                            )
-                            cycle.full_clean()
-                            cycle.save()
-                    
-                    else:
-                        raise Exception('No roommates splitting bill')
+                    activate_bill(bill)
                 
                 # if swtiching bill from active to inactive (e.g. all users paid)
                 elif not v and bill.is_active:
                     # calculate next due date
-                    unit, num = bill.frequency[0], int(bill.frequency[1:])
-                    if unit == 'X':
+                    next_date = next_due_date(bill.due_date, bill.frequency)
+                    if next_date is None:
                         setattr(bill, 'name', 'deleted')
                         ret = deepcopy(bill)
                         bill.delete()
-                        return UpdateTask(task=ret)
-                    elif unit == 'D':
-                        delta = timedelta(days=num)
-                    elif unit == 'W':
-                        delta = timedelta(weeks=num)
-                    elif unit == 'M':
-                        delta = relativedelta(months=num)
-                    elif unit == 'Y':
-                        delta = relativedelta(years=num)
+                        return UpdateBill(bill=ret)
                     # updating to next due date based on frequency
-                    next_date = bill.due_date + delta
                     setattr(bill, 'due_date', next_date)
                     setattr(bill, 'total_balance', Decimal('0.00'))
                     setattr(bill, k, v) # setting active to false
@@ -459,15 +548,38 @@ class PayBillCycle(graphene.Mutation):
     class Arguments:
         bill_id = graphene.Int(required=True)
     
+    @transaction.atomic
     def mutate(self, info, bill_id):
         user = info.context.user
         bill = Bill.objects.get(id=bill_id)
         cycle = bill.cycles.get(recipient=user)
+        was_paid = cycle.is_paid
         setattr(cycle, 'is_paid', True)
         setattr(cycle, 'date_paid', date_o.today())
         cycle.full_clean()
         cycle.save()
+        if not was_paid:
+            shift_balances(cycle_shares([cycle]), -1)
         return PayBillCycle(cycle=cycle)
+
+
+class CycleResult(graphene.ObjectType):
+    bill_id = graphene.Int()
+    cycle   = graphene.Field(BillCycleType)
+    error   = graphene.String()
+
+
+class PayBillCycles(graphene.Mutation):
+    results = graphene.List(CycleResult)
+
+    class Arguments:
+        bill_ids = graphene.List(graphene.Int, required=True)
+
+    def mutate(self, info, bill_ids):
+        results = pay_bill_cycles(info.context.user, bill_ids)
+        return PayBillCycles(results=[
+            CycleResult(bill_id=bill_id, cycle=cycle, error=error) for bill_id, (cycle, error) in zip(bill_ids, results)
+        ])
         
 
 
@@ -487,6 +599,26 @@ class DeleteBill(graphene.Mutation):
 
 
 
+'''----------------------------BALANCES----------------------------''' 
+
+class BalanceType(DjangoObjectType):
+    net = graphene.Decimal(description='Amount owed to the user minus the amount the user owes')
+
+    class Meta:
+        model = Balance
+
+    def resolve_net(self, info):
+        return self.owed - self.owes
+
+    def resolve_user(self, info):
+        return load_one(info, self, 'user', 'user')
+
+    def resolve_household(self, info):
+        return load_one(info, self, 'household', 'household')
+
+
+
+
 '''-----------------------MUTATIONS-----------------------''' 
 class Mutation(graphene.ObjectType):
     # USERS
@@ -501,11 +633,15 @@ class Mutation(graphene.ObjectType):
     create_task = CreateTask.Field()
     update_task = UpdateTask.Field()
     delete_task = DeleteTask.Field()
+    create_tasks = CreateTasks.Field()
+    update_tasks = UpdateTasks.Field()
+    delete_tasks = DeleteTasks.Field()
     # BILLS
     create_bill = CreateBill.Field()
     update_bill = UpdateBill.Field()
     delete_bill = DeleteBill.Field()
     pay_bill_cycle = PayBillCycle.Field()
+    pay_bill_cycles = PayBillCycles.Field()
 
 
 
@@ -528,22 +664,54 @@ class BillsPageUnion(graphene.Union):
         types = (BillListType, CycleListType)
 
 
+class UserConnection(relay.Connection):
+    class Meta:
+        node = UserType
+
+class HouseholdConnection(relay.Connection):
+    class Meta:
+        node = HouseholdType
+
+class CompleteTaskConnection(relay.Connection):
+    class Meta:
+        node = CompleteTaskType
+
+class BillCycleConnection(relay.Connection):
+    class Meta:
+        node = BillCycleType
+
+
+def check_legacy_list(field_name):
+    if not getattr(settings, 'GRAPHQL_LEGACY_LIST_FIELDS', True):
+        raise Exception('{0} has been removed, use {0}Connection'.format(field_name))
+
+
 class Query(graphene.ObjectType):
-    users           = graphene.List(UserType)
+    users           = graphene.List(UserType, deprecation_reason='Use usersConnection')
+    users_connection = relay.ConnectionField(UserConnection)
     me              = graphene.Field(UserType)
 
-    households      = graphene.List(HouseholdType)
+    households      = graphene.List(HouseholdType, deprecation_reason='Use householdsConnection')
+    households_connection = relay.ConnectionField(HouseholdConnection)
     homepage        = graphene.List(HomepageUnion)
 
     tasks           = graphene.List(graphene.List(TaskType))
-    complete_tasks  = graphene.List(CompleteTaskType)
+    complete_tasks  = graphene.List(CompleteTaskType, deprecation_reason='Use completeTasksConnection')
+    complete_tasks_connection = relay.ConnectionField(CompleteTaskConnection)
 
-    bills           = graphene.List(BillsPageUnion)
-    complete_bills  = graphene.List(BillCycleType)
+    bills           = graphene.List(BillsPageUnion, limit=graphene.Int(), before=graphene.String())
+    complete_bills  = graphene.List(BillCycleType, limit=graphene.Int(), before=graphene.String(),
+                                    deprecation_reason='Use completeBillsConnection')
+    complete_bills_connection = relay.ConnectionField(BillCycleConnection)
+    balances        = graphene.List(BalanceType)
 
     # USERS
     def resolve_users(self, info):
-        return User.objects.all()
+        check_legacy_list('users')
+        return project(info, User.objects.all())
+
+    def resolve_users_connection(self, info, **args):
+        return keyset_connection(UserConnection, project(info, User.objects.all()), ['id'], **args)
 
     def resolve_me(self, info):
         user = info.context.user
@@ -553,7 +721,11 @@ class Query(graphene.ObjectType):
     
     # HOUSEHOLD
     def resolve_households(self, info):
-        return Household.objects.all()
+        check_legacy_list('households')
+        return project(info, Household.objects.all())
+
+    def resolve_households_connection(self, info, **args):
+        return keyset_connection(HouseholdConnection, project(info, Household.objects.all()), ['id'], **args)
 
     def resolve_homepage(self, info):
         logged_in = info.context.user
@@ -565,45 +737,84 @@ class Query(graphene.ObjectType):
 
     # TASKS
     def resolve_tasks(self, info):
-        # TODO: use filtering instead of a for loop
         user = info.context.user
-        my_tasks = []
-        task_list = user.household.tasks.order_by('complete', 'due_date')
-        for t in task_list:
-            if t.current == user:
-                my_tasks.append(t)
+        task_list = project(info, Task.objects
+                            .filter(household_id=user.household_id)
+                            .select_related('current')
+                            .order_by('complete', 'due_date', 'id'))
+
+        my_tasks = task_list.filter(current=user)
+        other_tasks = task_list.exclude(current=user)
 
-        other_tasks = [x for x in task_list if x not in my_tasks]
-        
         return [my_tasks, other_tasks]
 
 
     def resolve_complete_tasks(self, info):
-        return info.context.user.household.complete_tasks.order_by('date')
+        check_legacy_list('completeTasks')
+        live, archived = (project(info, rows) for rows in complete_task_history(info.context.user.household_id))
+        return [*archived.order_by('date'), *live.order_by('date')]
+
+    def resolve_complete_tasks_connection(self, info, **args):
+        # newest first: the live rows, then the archived ones
+        history = [project(info, rows, keep=['date']) for rows in complete_task_history(info.context.user.household_id)]
+        return keyset_connection(CompleteTaskConnection, history, ['-date', '-id'], **args)
 
 
     # BILLS
-    def resolve_bills(self, info):
+    def resolve_bills(self, info, limit=None, before=None):
         user = info.context.user
-        all_bills = user.household.bills.all()
-        my_bills = all_bills.filter(manager=user)
-        other_bills = all_bills.exclude(manager=user)
+        my_bills = Bill.objects.filter(household_id=user.household_id, manager=user)
+
+        # unpaid cycles owed by the user on bills managed by someone else
+        my_cycles = (BillCycle.objects
+                     .filter(bill__household_id=user.household_id, recipient=user, is_paid=False)
+                     .exclude(bill__manager=user)
+                     .select_related('bill', 'recipient')
+                     .order_by('bill__due_date', 'id'))
+        if before:
+            my_cycles = my_cycles.filter(bill__due_date__lt=datetime.strptime(before, '%d%m%Y').date())
+        if limit is not None:
+            my_cycles = my_cycles[:limit]
 
-        my_cycles = []
-        for b in other_bills:
-            my_cycles.extend(b.cycles.filter(recipient=user, is_paid=False))
-        
         return [BillListType(data=my_bills), CycleListType(data=my_cycles)]
 
 
-    def resolve_complete_bills(self, info):
-        bills = info.context.user.household.bills
-        complete_cycles = []
-        for b in bills.all():
-            complete_cycles.extend(b.cycles.filter(is_paid=True)) 
-
-        complete_cycles.sort(key=lambda x: x.date_paid, reverse=True)
+    def resolve_complete_bills(self, info, limit=None, before=None):
+        check_legacy_list('completeBills')
+        complete_cycles = project(info, BillCycle.objects
+                                  .filter(bill__household_id=info.context.user.household_id, is_paid=True)
+                                  .select_related('bill', 'recipient')
+                                  .order_by('-date_paid', '-id'))
+        if before:
+            complete_cycles = complete_cycles.filter(date_paid__lt=datetime.strptime(before, '%d%m%Y').date())
+        if limit is not None:
+            complete_cycles = complete_cycles[:limit]
+        complete_cycles = list(complete_cycles)
+
+        # older cycles are only read from the archive when the live ones run out
+        if limit is None or len(complete_cycles) < limit:
+            archived = project(info, ArchivedBillCycle.objects
+                               .filter(bill__household_id=info.context.user.household_id)
+                               .select_related('bill', 'recipient')
+                               .order_by('-date_paid', '-id'))
+            if before:
+                archived = archived.filter(date_paid__lt=datetime.strptime(before, '%d%m%Y').date())
+            if limit is not None:
+                archived = archived[:limit - len(complete_cycles)]
+            complete_cycles.extend(archived)
 
         return complete_cycles
 
+    def resolve_complete_bills_connection(self, info, **args):
+        history = [project(info, cycles.select_related('bill', 'recipient'), keep=['date_paid'])
+                   for cycles in paid_cycle_history(info.context.user.household_id)]
+        return keyset_connection(BillCycleConnection, history, ['-date_paid', '-id'], **args)
+
 
+    # BALANCES
+    def resolve_balances(self, info):
+        user = info.context.user
+        return project(info, Balance.objects
+                       .filter(household_id=user.household_id)
+                       .select_related('user')
+                       .order_by('user_id'))
@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from .models import User, Household, Task, RotationMember, CompleteTask, Bill, BillCycle
+from .ledger import rebuild_balances
+
+
+'''----------------------------SEEDING----------------------------'''
+
+def seed_household(size, name='Home'):
+    '''Creates a household with `size` roommates, tasks, bills and cycles.'''
+    household = Household.objects.create(name=name)
+    users = [
+        User.objects.create(
+            email='{}{}@example.com'.format(name.lower(), i),
+            first_name='First{}'.format(i),
+            last_name='Last{}'.format(i),
+            household=household,
+        )
+        for i in range(size)
+    ]
+    for i, user in enumerate(users):
+        task = Task.objects.create(
+            name='Task {}'.format(i),
+            description='chore',
+            due_date=date(2020, 5, 1 + i % 28),
+            frequency='W1',
+            current=user,
+            rotation_position=i,
+            household=household,
+        )
+        RotationMember.objects.bulk_create(
+            RotationMember(task=task, user=member, position=j) for j, member in enumerate(users))
+        CompleteTask.objects.create(
+            name=task.name, roommate=user, date=date(2020, 4, 1 + i % 28), household=household)
+
+        bill = Bill.objects.create(
+            name='Bill {}'.format(i),
+            total_balance=Decimal('90.00'),
+            due_date=date(2020, 5, 1 + i % 28),
+            frequency='M1',
+            is_active=True,
+            manager=user,
+            household=household,
+        )
+        others = [u for u in users if u != user]
+        bill.participants.add(*others)
+        for j, other in enumerate(others):
+            BillCycle.objects.create(
+                bill=bill,
+                recipient=other,
+                amount=Decimal('10.00'),
+                is_paid=j % 2 == 0,
+                date_paid=date(2020, 4, 1 + (i + j) % 28) if j % 2 == 0 else None,
+            )
+    rebuild_balances(household)
+    return household, users
+
+
+def seed_tasks(household, users, count):
+    '''Bulk inserts `count` tasks rotating between `users`.'''
+    start = Task.objects.count()
+    Task.objects.bulk_create(
+        Task(
+            name='Chore {}'.format(start + i),
+            description='chore',
+            due_date=date(2020, 1, 1) + timedelta(days=i % 365),
+            frequency='W1',
+            complete=i % 5 == 0,
+            current=users[i % len(users)],
+            rotation_position=i % len(users),
+            household=household,
+        )
+        for i in range(count)
+    )
+    RotationMember.objects.bulk_create(
+        RotationMember(task_id=task_id, user_id=user.id, position=j)
+        for task_id in Task.objects.order_by('id').values_list('id', flat=True)[start:]
+        for j, user in enumerate(users)
+    )
+
+
+def seed_users(household, count, name='bulk'):
+    '''Bulk inserts `count` roommates of `household`.'''
+    start = User.objects.count()
+    User.objects.bulk_create(
+        User(
+            email='{}{}@example.com'.format(name, start + i),
+            first_name='First{}'.format(start + i),
+            last_name='Last{}'.format(start + i),
+            household=household,
+        )
+        for i in range(count)
+    )
+    return list(User.objects.order_by('id')[start:])
+
+
+def seed_bills(household, manager, participants, count):
+    '''Bulk inserts `count` inactive bills of `manager` split with `participants`.'''
+    start = Bill.objects.count()
+    Bill.objects.bulk_create(
+        Bill(
+            name='Bill {}'.format(start + i),
+            total_balance=Decimal('90.00'),
+            due_date=date(2020, 5, 1 + i % 28),
+            frequency='M1',
+            manager=manager,
+            num_split=len(participants) + 1,
+            household=household,
+        )
+        for i in range(count)
+    )
+    bills = list(Bill.objects.order_by('id')[start:])
+    Through = Bill.participants.through
+    Through.objects.bulk_create(
+        (Through(bill_id=bill.id, user_id=user.id) for bill in bills for user in participants),
+        batch_size=500,
+    )
+    return bills
+
+
+def seed_history(household, users, count):
+    '''Bulk inserts `count` completed tasks and `count` paid cycles of a bill of `household`.'''
+    CompleteTask.objects.bulk_create(
+        (CompleteTask(
+            name='Chore {}'.format(i),
+            roommate=users[i % len(users)],
+            date=date(2019, 1, 1) + timedelta(days=i % 365),
+            household=household,
+        ) for i in range(count)),
+        batch_size=500,
+    )
+    bill = Bill.objects.create(
+        name='History', due_date=date(2020, 1, 1), frequency='M1', manager=users[0], household=household)
+    BillCycle.objects.bulk_create(
+        (BillCycle(
+            bill=bill,
+            recipient=users[i % len(users)],
+            amount=Decimal('10.00'),
+            is_paid=True,
+            date_paid=date(2019, 1, 1) + timedelta(days=i % 365),
+        ) for i in range(count)),
+        batch_size=500,
+    )
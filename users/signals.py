@@ -0,0 +1,168 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_delete, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .archive import archiving
+from .auth import forget_user
+from .cache import invalidate_household
+from .events import change, row_change, record_change, record_changes
+from .ledger import shift_balances, cycle_shares
+from .models import User, Household, Task, RotationMember, CompleteTask, Bill, BillCycle
+
+
+'''----------------------------DELETED BILLS----------------------------'''
+
+_deleting = threading.local()
+
+
+def deleting_bills():
+    '''Bills of this thread being deleted: id -> (bill, balance shares of its deleted unpaid cycles).'''
+    return _deleting.__dict__.setdefault('bills', {})
+
+
+@receiver(pre_delete, sender=Bill)
+def bill_deleting(sender, instance, **kwargs):
+    # its cycles are deleted (and signalled) before it, without their bill loaded
+    deleting_bills()[instance.id] = (instance, [])
+
+
+@receiver(post_delete, sender=Bill)
+def bill_deleted(sender, instance, **kwargs):
+    _, shares = deleting_bills().pop(instance.id, (None, []))
+    shift_balances(shares, -1, create=False)
+
+
+@receiver(request_started)
+def forget_deleting_bills(sender, **kwargs):
+    # left behind by a deletion that failed halfway
+    _deleting.__dict__.pop('bills', None)
+
+
+@receiver(post_delete, sender=BillCycle)
+def cycle_deleted_with_bill(sender, instance, **kwargs):
+    '''Gives the cycles of a bill being deleted that bill, before the BillCycle receivers below read it.'''
+    entry = deleting_bills().get(instance.bill_id)
+    if entry is not None:
+        instance.bill = entry[0]
+
+
+
+'''----------------------------CACHE INVALIDATION----------------------------'''
+
+@receiver(post_save, sender=Household)
+@receiver(post_delete, sender=Household)
+def household_changed(sender, instance, **kwargs):
+    invalidate_household(instance.id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=CompleteTask)
+@receiver(post_delete, sender=CompleteTask)
+@receiver(post_save, sender=Bill)
+@receiver(post_delete, sender=Bill)
+def household_row_changed(sender, instance, **kwargs):
+    invalidate_household(instance.household_id)
+
+
+@receiver(post_save, sender=BillCycle)
+@receiver(post_delete, sender=BillCycle)
+def cycle_changed(sender, instance, **kwargs):
+    invalidate_household(household_of(instance))
+
+
+@receiver(post_delete, sender=BillCycle)
+def unpaid_cycle_deleted(sender, instance, **kwargs):
+    if instance.is_paid:
+        return
+    entry = deleting_bills().get(instance.bill_id)
+    if entry is not None:
+        # removed together once the bill is deleted
+        entry[1].extend(cycle_shares([instance]))
+    else:
+        shift_balances(cycle_shares([instance]), -1, create=False)
+
+
+@receiver(post_save, sender=RotationMember)
+@receiver(post_delete, sender=RotationMember)
+def rotation_changed(sender, instance, **kwargs):
+    invalidate_household(instance.task.household_id)
+
+
+@receiver(m2m_changed, sender=Bill.participants.through)
+def membership_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        # instance is the bill, or the user when edited from the reverse side
+        invalidate_household(instance.household_id)
+
+
+
+'''----------------------------AUTHENTICATION----------------------------'''
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.id)
+
+
+@receiver(pre_delete, sender=Household)
+def household_deleted(sender, instance, **kwargs):
+    # its users lose their household with an UPDATE, without signals
+    for user_id in instance.users.values_list('id', flat=True):
+        forget_user(user_id)
+
+
+
+'''----------------------------EVENTS----------------------------'''
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=CompleteTask)
+@receiver(post_save, sender=Bill)
+@receiver(post_save, sender=BillCycle)
+def row_saved(sender, instance, created, **kwargs):
+    record_change(household_of(instance), row_change(instance, 'create' if created else 'update'))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=CompleteTask)
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=BillCycle)
+def row_deleted(sender, instance, **kwargs):
+    if archiving():
+        # moved to the archive, still read by the history connections
+        return
+    record_change(household_of(instance), row_change(instance, 'delete'))
+
+
+@receiver(m2m_changed, sender=Bill.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    # from the user's side, pk_set holds the bills (None when clearing them all)
+    bill_ids = sorted(pk_set or ()) if reverse else [instance.id]
+    record_changes(instance.household_id, [change('participants', 'update', bill_id) for bill_id in bill_ids])
+
+
+def household_of(row):
+    return row.bill.household_id if isinstance(row, BillCycle) else row.household_id
+
+
+
+'''----------------------------DATABASE----------------------------'''
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    '''Applies settings.SQLITE_PRAGMAS to each new SQLite connection.'''
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import json
+import threading
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+
+from room_graphql_api.schema import schema
+from .models import Household, Task, CompleteTask, Bill, BillCycle
+from .seed import seed_household, seed_tasks, seed_users, seed_bills, seed_history
+from .billing import activate_bills, activate_due_bills
+from .recurrence import next_due_date, roll_tasks, roll_forward
+from .cache import cache_stats, reset_cache_stats
+from .persisted import query_hash
+from .documents import DocumentCacheBackend, get_document_cache
+from .cost import CostAnalyzer
+
+
+class GraphQLTestCase(TestCase):
+    def execute(self, query, user=None, variables=None):
+        request = RequestFactory().post('/graphql/')
+        request.user = user
+        result = schema.execute(query, context_value=request, variables=variables)
+        self.assertIsNone(result.errors, result.errors)
+        return result.data
+
+    def post(self, query, user, variables=None, **body):
+        from graphql_jwt.shortcuts import get_token
+        response = self.client.post(
+            '/graphql/',
+            json.dumps(dict(body, query=query, variables=variables)),
+            content_type='application/json',
+            HTTP_AUTHORIZATION='JWT ' + get_token(user),
+        )
+        return response.json()
+
+    def count_queries(self, query, user=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.execute(query, user)
+        return len(ctx.captured_queries)
+
+
+
+'''----------------------------LOADERS----------------------------'''
+
+HOUSEHOLD_GRAPH = '''
+{
+  households {
+    name
+    users { firstName household { name } }
+    tasks { name current { firstName } rotation { firstName } }
+    completeTasks { roommate { firstName } }
+    bills {
+      manager { firstName }
+      participants { firstName }
+      cycles { amount recipient { firstName } bill { name } }
+    }
+  }
+}
+'''
+
+
+class LoaderTests(GraphQLTestCase):
+    def test_query_count_is_independent_of_row_count(self):
+        seed_household(2, name='Small')
+        small = self.count_queries(HOUSEHOLD_GRAPH)
+
+        seed_household(8, name='Large')
+        large = self.count_queries(HOUSEHOLD_GRAPH)
+
+        self.assertEqual(small, large)
+
+    def test_relations_resolve_to_related_rows(self):
+        household, users = seed_household(3)
+        data = self.execute(HOUSEHOLD_GRAPH)['households'][0]
+
+        self.assertEqual(len(data['users']), 3)
+        self.assertEqual(data['tasks'][0]['current']['firstName'], 'First0')
+        self.assertEqual(len(data['tasks'][0]['rotation']), 3)
+        self.assertEqual(len(data['bills'][0]['participants']), 2)
+        self.assertEqual(data['bills'][0]['cycles'][0]['bill']['name'], 'Bill 0')
+        self.assertEqual(data['users'][1]['household']['name'], 'Home')
+
+
+
+'''----------------------------TASKS----------------------------'''
+
+TASKS_PAGE = '{ tasks { name dueDate current { firstName } rotation { firstName } } }'
+
+
+class TaskQueryTests(GraphQLTestCase):
+    def test_tasks_split_between_current_user_and_others(self):
+        _, users = seed_household(3)
+        mine, others = self.execute(TASKS_PAGE, users[0])['tasks']
+
+        self.assertEqual([t['name'] for t in mine], ['Task 0'])
+        self.assertEqual([t['name'] for t in others], ['Task 1', 'Task 2'])
+        self.assertTrue(all(t['current']['firstName'] == 'First0' for t in mine))
+
+    def test_tasks_query_count_is_independent_of_task_count(self):
+        household, users = seed_household(4)
+        # how the page's time grows with the tasks: manage.py benchmark_tasks
+        seed_tasks(household, users, 50)
+        small = self.count_queries(TASKS_PAGE, users[0])
+        seed_tasks(household, users, 150)
+        large = self.count_queries(TASKS_PAGE, users[0])
+
+        self.assertEqual(small, large)
+
+
+BILLS_PAGE = '''
+{
+  bills {
+    ... on BillListType { data { name } }
+    ... on CycleListType { data { amount bill { name } recipient { firstName } } }
+  }
+  completeBills { datePaid bill { name } recipient { firstName } }
+}
+'''
+
+
+class BillQueryTests(GraphQLTestCase):
+    def test_bills_page_query_count_is_constant(self):
+        _, users = seed_household(2, name='Small')
+        small = self.count_queries(BILLS_PAGE, users[0])
+
+        _, users = seed_household(8, name='Large')
+        large = self.count_queries(BILLS_PAGE, users[0])
+
+        self.assertEqual(small, large)
+
+    def test_bills_returns_managed_bills_and_unpaid_cycles(self):
+        _, users = seed_household(4)
+        my_bills, my_cycles = self.execute(BILLS_PAGE, users[1])['bills']
+
+        self.assertEqual([b['name'] for b in my_bills['data']], ['Bill 1'])
+        self.assertEqual(
+            len(my_cycles['data']),
+            BillCycle.objects.filter(recipient=users[1], is_paid=False).count())
+        self.assertNotIn('Bill 1', [c['bill']['name'] for c in my_cycles['data']])
+
+    def test_complete_bills_ordered_newest_first(self):
+        _, users = seed_household(4)
+        data = self.execute(BILLS_PAGE, users[0])['completeBills']
+
+        dates = [c['datePaid'] for c in data]
+        self.assertEqual(len(dates), BillCycle.objects.filter(is_paid=True).count())
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_complete_bills_limit_and_before(self):
+        _, users = seed_household(4)
+        query = '{ completeBills(limit: 2, before: "03042020") { datePaid } }'
+        data = self.execute(query, users[0])['completeBills']
+
+        self.assertEqual(len(data), 2)
+        self.assertTrue(all(c['datePaid'] < '2020-04-03' for c in data))
+
+
+class BillActivationTests(GraphQLTestCase):
+    def setUp(self):
+        self.household = Household.objects.create(name='Home')
+        self.users = seed_users(self.household, 4)
+
+    def test_update_bill_activates_with_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for size in (1, 3):
+            bill = seed_bills(self.household, self.users[0], self.users[1:1 + size], 1)[0]
+            query = 'mutation { updateBill(billData: {billId: %d, isActive: true}) { bill { isActive } } }' % bill.id
+            with CaptureQueriesContext(connection) as ctx:
+                self.execute(query, self.users[0])
+            counts.append(len(ctx.captured_queries))
+            self.assertEqual(
+                sorted(bill.cycles.values_list('recipient_id', flat=True)),
+                [u.id for u in self.users[1:1 + size]])
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delete_bill_runs_constant_queries(self):
+        from django.db import connection
+        from .ledger import balance_differences
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for size in (1, 3):
+            bill = seed_bills(self.household, self.users[0], self.users[1:1 + size], 1)[0]
+            activate_bills([bill])
+            query = 'mutation { deleteBill(billId: %d) { ok } }' % bill.id
+            with CaptureQueriesContext(connection) as ctx:
+                self.execute(query, self.users[0])
+            counts.append(len(ctx.captured_queries))
+            self.assertFalse(BillCycle.objects.filter(bill_id=bill.id).exists())
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(balance_differences(self.household), [])
+
+    def test_activation_splits_balance(self):
+        bill = seed_bills(self.household, self.users[0], self.users[1:], 1)[0]
+        activate_bills([bill])
+
+        self.assertEqual({str(c.amount) for c in bill.cycles.all()}, {'22.50'})
+        self.assertTrue(Bill.objects.get(id=bill.id).is_active)
+
+    def test_activation_is_all_or_nothing(self):
+        bill = seed_bills(self.household, self.users[0], self.users[1:], 1)[0]
+        lonely = seed_bills(self.household, self.users[0], [], 1)[0]
+
+        with self.assertRaises(Exception):
+            activate_bills([bill, lonely])
+        self.assertFalse(BillCycle.objects.exists())
+        self.assertFalse(Bill.objects.filter(is_active=True).exists())
+
+    def test_activate_due_bills_is_idempotent(self):
+        from datetime import date
+        seed_bills(self.household, self.users[0], self.users[1:], 20)
+
+        self.assertEqual(activate_due_bills(self.household, today=date(2020, 5, 10)), 10)
+        self.assertEqual(activate_due_bills(self.household, today=date(2020, 5, 10)), 0)
+        self.assertEqual(BillCycle.objects.count(), 10 * 3)
+
+
+
+'''----------------------------RECURRENCE----------------------------'''
+
+class RecurrenceTests(GraphQLTestCase):
+    def test_next_due_date(self):
+        from datetime import date
+        self.assertEqual(next_due_date(date(2020, 1, 31), 'M1'), date(2020, 2, 29))
+        self.assertEqual(next_due_date(date(2020, 1, 31), 'W2'), date(2020, 2, 14))
+        self.assertIsNone(next_due_date(date(2020, 1, 31), 'X'))
+        with self.assertRaises(Exception):
+            next_due_date(date(2020, 1, 31), 'Q1')
+
+    def test_completing_a_task_rotates_it(self):
+        _, users = seed_household(3)
+        task = Task.objects.get(current=users[2])
+        query = 'mutation { updateTask(taskData: {taskId: %d, complete: true}) { task { dueDate current { id } } } }'
+        data = self.execute(query % task.id, users[2])['updateTask']['task']
+
+        self.assertEqual(data['dueDate'], str(next_due_date(task.due_date, 'W1')))
+        self.assertEqual(data['current']['id'], str(users[0].id))
+
+    def test_overdue_tasks_skip_one_assignee_per_missed_week(self):
+        from datetime import date
+        _, users = seed_household(3)
+        task = Task.objects.get(current=users[0])  # due 2020-05-01, weekly
+
+        self.assertEqual(roll_tasks(date(2020, 5, 10)), 3)
+        task.refresh_from_db()
+        self.assertEqual(task.due_date, date(2020, 5, 15))
+        self.assertEqual(task.current, users[2])
+        # nothing is overdue any more
+        self.assertEqual(roll_tasks(date(2020, 5, 10)), 0)
+
+    def test_invalid_frequency_skips_only_its_task(self):
+        from datetime import date
+        _, users = seed_household(3)
+        bad, *good = Task.objects.order_by('id')
+        Task.objects.filter(id=bad.id).update(frequency='D0')
+
+        with self.assertLogs('users.recurrence', 'ERROR') as logs:
+            counts = roll_forward(date(2020, 5, 10), chunk_size=1)
+        self.assertEqual(counts['tasks'], 2)
+        self.assertIn('task {}'.format(bad.id), logs.output[0])
+        self.assertEqual(Task.objects.get(id=bad.id).due_date, bad.due_date)
+        self.assertFalse(Task.objects.filter(id__in=[t.id for t in good], due_date__lt=date(2020, 5, 10)).exists())
+
+    def test_mutations_reject_invalid_frequencies(self):
+        _, users = seed_household(1)
+        task = Task.objects.get()
+        query = 'mutation { updateTask(taskData: {taskId: %d, frequency: "Z"}) { task { id } } }'
+        result = schema.execute(query % task.id, context_value=self.request(users[0]))
+        self.assertEqual(str(result.errors[0]), 'Invalid frequency Z')
+
+        query = 'mutation { createTask(name: "Mop", description: "floor", dueDate: "01052020", frequency: "D0") { task { id } } }'
+        result = schema.execute(query, context_value=self.request(users[0]))
+        self.assertEqual(str(result.errors[0]), 'Invalid frequency D0')
+        self.assertEqual(Task.objects.get().frequency, task.frequency)
+
+    def request(self, user):
+        request = RequestFactory().post('/graphql/')
+        request.user = user
+        return request
+
+    def test_roll_forward_in_chunks_is_idempotent(self):
+        from datetime import date
+        household, users = seed_household(2)
+        seed_tasks(household, users, 25)
+        BillCycle.objects.update(is_paid=True)
+
+        counts = roll_forward(date(2021, 1, 1), chunk_size=4)
+        self.assertEqual(counts, {'tasks': 27, 'closed bills': 2, 'activated bills': 0})
+        self.assertFalse(Task.objects.filter(due_date__lt=date(2021, 1, 1)).exists())
+        self.assertEqual(set(Bill.objects.values_list('is_active', 'due_date')), {(False, date(2020, 6, 1)), (False, date(2020, 6, 2))})
+
+        self.assertEqual(roll_forward(date(2021, 1, 1), chunk_size=4),
+                         {'tasks': 0, 'closed bills': 0, 'activated bills': 0})
+
+        # once the managers enter the next amounts the bills are activated
+        Bill.objects.update(total_balance=40)
+        self.assertEqual(roll_forward(date(2021, 1, 1))['activated bills'], 2)
+        self.assertEqual(BillCycle.objects.filter(is_paid=False).count(), 2)
+
+
+'''----------------------------ROTATION ORDER----------------------------'''
+
+COMPLETE_TASK = 'mutation { updateTask(taskData: {taskId: %d, complete: true}) { task { current { id } } } }'
+
+
+class RotationOrderTests(GraphQLTestCase):
+    def complete(self, task, user):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.execute(COMPLETE_TASK % task.id, user)
+        return int(data['updateTask']['task']['current']['id']), len(ctx.captured_queries)
+
+    def test_advancing_costs_the_same_for_any_rotation_size(self):
+        _, small = seed_household(2, name='Small')
+        _, large = seed_household(8, name='Large')
+
+        _, small_queries = self.complete(Task.objects.get(current=small[0]), small[0])
+        _, large_queries = self.complete(Task.objects.get(current=large[3]), large[3])
+        self.assertEqual(small_queries, large_queries)
+
+    def test_reorder_sets_the_next_assignee(self):
+        _, users = seed_household(3)
+        task = Task.objects.get(current=users[0])
+        ids = [users[0].id, users[2].id, users[1].id]
+        query = 'mutation($order: [Int]) { updateTask(taskData: {taskId: %d, rotationOrder: $order}) { task { rotation { id } } } }'
+        data = self.execute(query % task.id, users[0], {'order': ids})
+
+        self.assertEqual([int(u['id']) for u in data['updateTask']['task']['rotation']], ids)
+        self.assertEqual(self.complete(task, users[0])[0], users[2].id)
+        self.assertEqual(self.complete(task, users[0])[0], users[1].id)
+        self.assertEqual(self.complete(task, users[0])[0], users[0].id)
+
+    def test_removing_the_current_roommate_keeps_the_turn_order(self):
+        _, users = seed_household(3)
+        task = Task.objects.get(current=users[1])
+        query = 'mutation { updateTask(taskData: {taskId: %d, removeRotation: [%d], addRotation: [%d]}) { task { id } } }'
+        self.execute(query % (task.id, users[1].id, users[1].id), users[0])
+
+        # users[1] was removed, their turn passes to the next position
+        self.assertEqual(self.complete(task, users[0])[0], users[2].id)
+
+
+'''----------------------------BALANCES----------------------------'''
+
+BALANCES = '{ balances { owed owes net user { id } } }'
+
+
+class BalanceTests(GraphQLTestCase):
+    def balances(self, user):
+        return {int(b['user']['id']): b for b in self.execute(BALANCES, user)['balances']}
+
+    def reconcile(self, **options):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('reconcile_balances', stdout=out, **options)
+        return out.getvalue()
+
+    def test_balances_query_count_is_constant(self):
+        _, small = seed_household(2, name='Small')
+        _, large = seed_household(8, name='Large')
+        self.assertEqual(self.count_queries(BALANCES, small[0]), self.count_queries(BALANCES, large[0]))
+
+    def test_seeded_balances_sum_to_zero(self):
+        _, users = seed_household(4)
+        balances = self.balances(users[0])
+
+        self.assertEqual(set(balances), {u.id for u in users})
+        self.assertEqual(sum(float(b['net']) for b in balances.values()), 0)
+
+    def test_activation_payment_and_deletion_update_balances(self):
+        household = Household.objects.create(name='Home')
+        users = seed_users(household, 3)
+        bill = seed_bills(household, users[0], users[1:], 1)[0]
+
+        activate_bills([bill])
+        balances = self.balances(users[0])
+        self.assertEqual((balances[users[0].id]['owed'], balances[users[1].id]['owes']), (60, 30))
+
+        self.execute('mutation { payBillCycle(billId: %d) { cycle { isPaid } } }' % bill.id, users[1])
+        balances = self.balances(users[0])
+        self.assertEqual((balances[users[0].id]['owed'], balances[users[1].id]['owes']), (30, 0))
+
+        bill.delete()
+        self.assertEqual({float(b['net']) for b in self.balances(users[0]).values()}, {0})
+        self.assertIn('Balances match', self.reconcile())
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        from django.core.management.base import CommandError
+        from .models import Balance
+        _, users = seed_household(3)
+        Balance.objects.filter(user=users[1]).update(owes=0)
+
+        with self.assertRaises(CommandError):
+            self.reconcile()
+        self.assertIn('Rebuilt balances, 1 differed', self.reconcile(fix=True))
+        self.assertIn('Balances match', self.reconcile())
+
+
+'''----------------------------BULK MUTATIONS----------------------------'''
+
+UPDATE_TASKS = '''mutation($tasks: [TaskInput]!) {
+    updateTasks(tasks: $tasks) { results { task { id dueDate current { id } } error } }
+}'''
+
+
+class BulkMutationTests(GraphQLTestCase):
+    def update_tasks(self, user, tasks):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.execute(UPDATE_TASKS, user, {'tasks': tasks})
+        return data['updateTasks']['results'], len(ctx.captured_queries)
+
+    def test_completing_many_tasks_costs_the_same_as_a_few(self):
+        _, small = seed_household(2, name='Small')
+        _, large = seed_household(6, name='Large')
+
+        _, few = self.update_tasks(small[0], [{'taskId': t.id, 'complete': True} for t in small[0].household.tasks.all()])
+        results, many = self.update_tasks(large[0], [{'taskId': t.id, 'complete': True} for t in large[0].household.tasks.all()])
+
+        self.assertEqual(few, many)
+        self.assertEqual(CompleteTask.objects.filter(household=large[0].household).count(), 6 * 2)
+        for task in Task.objects.filter(household=large[0].household).select_related('current'):
+            result = next(r['task'] for r in results if r['task']['id'] == str(task.id))
+            self.assertEqual(result['dueDate'], str(task.due_date))
+            self.assertEqual(result['current']['id'], str(task.current_id))
+        # every task went to the roommate after its previous assignee
+        self.assertEqual(sorted(Task.objects.filter(household=large[0].household).values_list('rotation_position', flat=True)),
+                         [0, 1, 2, 3, 4, 5])
+
+    def test_errors_are_reported_per_item(self):
+        _, users = seed_household(2)
+        other, _ = seed_household(1, name='Other')
+        tasks = list(users[0].household.tasks.order_by('id'))
+        results, _ = self.update_tasks(users[0], [
+            {'taskId': tasks[0].id, 'name': 'Dishes'},
+            {'taskId': tasks[1].id, 'dueDate': 'tomorrow'},
+            {'taskId': other.tasks.get().id, 'name': 'Not mine'},
+            {'taskId': tasks[0].id, 'name': 'Twice'},
+        ])
+
+        self.assertEqual([r['error'] for r in results], [
+            None,
+            "time data 'tomorrow' does not match format '%d%m%Y'",
+            'Task {} does not exist'.format(other.tasks.get().id),
+            'Task {} is listed more than once'.format(tasks[0].id),
+        ])
+        self.assertEqual(Task.objects.get(id=tasks[0].id).name, 'Dishes')
+        self.assertEqual(Task.objects.get(id=tasks[1].id).due_date, tasks[1].due_date)
+        self.assertEqual(other.tasks.get().name, 'Task 0')
+
+    def test_completing_a_task_without_roommate_fails_alone(self):
+        _, users = seed_household(2)
+        tasks = list(users[0].household.tasks.order_by('id'))
+        Task.objects.filter(id=tasks[1].id).update(current=None)
+        Task.objects.filter(id=tasks[0].id).update(complete=True)
+        logged = CompleteTask.objects.count()
+        results, _ = self.update_tasks(users[0], [
+            {'taskId': tasks[1].id, 'complete': True},
+            {'taskId': tasks[0].id, 'name': 'Dishes'},
+        ])
+
+        self.assertEqual([r['error'] for r in results], ['Task {} has no current roommate'.format(tasks[1].id), None])
+        self.assertEqual(CompleteTask.objects.count(), logged)
+        # an item leaving `complete` out keeps it as it was
+        self.assertTrue(Task.objects.get(id=tasks[0].id).complete)
+
+    def test_create_and_delete_tasks(self):
+        _, users = seed_household(2)
+        query = '''mutation($tasks: [NewTaskInput]!) {
+            createTasks(tasks: $tasks) { results { task { id rotation { id } } error } } }'''
+        ids = [users[1].id, users[0].id]
+        data = self.execute(query, users[0], {'tasks': [
+            {'name': 'Trash', 'description': 'bins', 'dueDate': '01052020', 'frequency': 'W1', 'current': ids[0], 'rotation': ids},
+            {'name': 'Mop', 'description': 'floor', 'dueDate': '01052020', 'frequency': 'Z9'},
+        ]})['createTasks']['results']
+
+        self.assertEqual([int(u['id']) for u in data[0]['task']['rotation']], ids)
+        self.assertEqual(data[1], {'task': None, 'error': 'Invalid frequency Z9'})
+
+        query = 'mutation($ids: [Int]!) { deleteTasks(taskIds: $ids) { results { id ok error } } }'
+        created = int(data[0]['task']['id'])
+        data = self.execute(query, users[0], {'ids': [created, 9999]})['deleteTasks']['results']
+        self.assertEqual([r['ok'] for r in data], [True, False])
+        self.assertFalse(Task.objects.filter(id=created).exists())
+
+    def test_pay_bill_cycles(self):
+        _, users = seed_household(3)
+        unpaid = list(BillCycle.objects.filter(recipient=users[0], is_paid=False).values_list('bill_id', flat=True))
+        paid = BillCycle.objects.filter(recipient=users[0], is_paid=True).values_list('bill_id', flat=True)[0]
+        query = 'mutation($ids: [Int]!) { payBillCycles(billIds: $ids) { results { billId cycle { isPaid } error } } }'
+        data = self.execute(query, users[0], {'ids': unpaid + [paid]})['payBillCycles']['results']
+
+        self.assertTrue(all(r['cycle']['isPaid'] for r in data[:-1]))
+        self.assertEqual(data[-1]['error'], 'No unpaid cycle of bill {}'.format(paid))
+        self.assertFalse(BillCycle.objects.filter(recipient=users[0], is_paid=False).exists())
+
+
+'''----------------------------ROTATIONS AND PARTICIPANTS----------------------------'''
+
+class MemberEditTests(GraphQLTestCase):
+    def setUp(self):
+        self.household = Household.objects.create(name='Home')
+        self.users = seed_users(self.household, 12)
+        self.bill = seed_bills(self.household, self.users[0], self.users[1:3], 1)[0]
+
+    def update_bill(self, add, remove):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        query = '''mutation($add: [Int], $remove: [Int]) {
+            updateBill(billData: {billId: %d, addParticipants: $add, removeParticipants: $remove}) { bill { numSplit } }
+        }''' % self.bill.id
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.execute(query, self.users[0], {'add': add, 'remove': remove})
+        return data['updateBill']['bill'], len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_id_count(self):
+        _, few = self.update_bill([u.id for u in self.users[3:5]], [self.users[1].id])
+        _, many = self.update_bill([u.id for u in self.users[5:]], [self.users[2].id, self.users[3].id])
+        self.assertEqual(few, many)
+
+    def test_diff_against_current_members(self):
+        ids = [u.id for u in self.users]
+        # 1 is already a participant, 4 is not one to remove, 5 is both added and removed
+        bill, _ = self.update_bill([ids[1], ids[3], ids[5]], [ids[2], ids[4], ids[5]])
+
+        self.assertEqual(sorted(self.bill.participants.values_list('id', flat=True)), [ids[1], ids[3]])
+        self.assertEqual(bill['numSplit'], 3)
+
+    def test_unknown_ids_are_reported_together(self):
+        query = 'mutation { updateTask(taskData: {taskId: %d, addRotation: [%d, 9998, 9999]}) { task { id } } }'
+        task = seed_household(1)[0].tasks.get()
+
+        result = self.post(query % (task.id, self.users[0].id), self.users[0])
+        self.assertEqual(result['errors'][0]['message'], 'Unknown user ids: 9998, 9999')
+        self.assertFalse(task.rotation.filter(id=self.users[0].id).exists())
+
+    def test_create_task_with_rotation(self):
+        ids = [u.id for u in self.users[:4]]
+        query = '''mutation($rotation: [Int]) {
+            createTask(name: "Dishes", description: "sink", dueDate: "01052020", frequency: "D1", rotation: $rotation) {
+                task { rotation { id } } } }'''
+        data = self.execute(query, self.users[0], {'rotation': ids + ids[:1]})
+
+        self.assertEqual(sorted(int(u['id']) for u in data['createTask']['task']['rotation']), ids)
+
+
+
+'''----------------------------PAGINATION----------------------------'''
+
+COMPLETE_TASKS_PAGE = '''
+query ($first: Int, $after: String, $last: Int, $before: String) {
+  completeTasksConnection(first: $first, after: $after, last: $last, before: $before) {
+    edges { cursor node { id date } }
+    pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+  }
+}
+'''
+
+
+class ConnectionTests(GraphQLTestCase):
+    def setUp(self):
+        household, self.users = seed_household(3)
+        # several completions on the same day so the id tie-breaker matters
+        for i in range(7):
+            CompleteTask.objects.create(
+                name='Extra', roommate=self.users[0], date=self.users[0].date_joined.date(), household=household)
+
+    def page(self, **variables):
+        return self.execute(COMPLETE_TASKS_PAGE, self.users[0], variables)['completeTasksConnection']
+
+    def test_forward_pages_cover_history_newest_first(self):
+        expected = [str(pk) for pk in CompleteTask.objects.order_by('-date', '-id').values_list('id', flat=True)]
+        seen, after = [], None
+        while True:
+            page = self.page(first=3, after=after)
+            seen.extend(edge['node']['id'] for edge in page['edges'])
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+
+        self.assertEqual(seen, expected)
+
+    def test_backward_page_ends_before_cursor(self):
+        first_page = self.page(first=6)
+        back = self.page(last=2, before=first_page['pageInfo']['endCursor'])
+
+        self.assertEqual(
+            [edge['node']['id'] for edge in back['edges']],
+            [edge['node']['id'] for edge in first_page['edges'][3:5]])
+        self.assertTrue(back['pageInfo']['hasPreviousPage'])
+
+    def test_backward_page_stops_at_after_cursor(self):
+        edges = self.page(first=6)['edges']
+        back = self.page(last=10, after=edges[0]['cursor'], before=edges[5]['cursor'])
+
+        self.assertEqual([edge['node']['id'] for edge in back['edges']],
+                         [edge['node']['id'] for edge in edges[1:5]])
+        self.assertFalse(back['pageInfo']['hasPreviousPage'])
+
+    def test_first_and_last_take_the_end_of_the_first_rows(self):
+        edges = self.page(first=6)['edges']
+        page = self.page(first=5, last=2)
+
+        self.assertEqual([edge['node']['id'] for edge in page['edges']],
+                         [edge['node']['id'] for edge in edges[3:5]])
+        self.assertTrue(page['pageInfo']['hasPreviousPage'])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+    def test_page_size_is_capped(self):
+        with self.settings(GRAPHQL_MAX_PAGE_SIZE=4):
+            self.assertEqual(len(self.page(first=50)['edges']), 4)
+
+    def test_negative_page_size_is_rejected(self):
+        request = RequestFactory().post('/graphql/')
+        request.user = self.users[0]
+        for variables in ({'first': -1}, {'last': -2}):
+            result = schema.execute(COMPLETE_TASKS_PAGE, context_value=request, variables=variables)
+            name = next(iter(variables))
+            self.assertEqual([e.message for e in result.errors],
+                             ['Argument "{}" must be a non-negative integer'.format(name)])
+
+    def test_complete_bills_connection_orders_by_date_paid(self):
+        query = '{ completeBillsConnection(first: 100) { edges { node { datePaid } } } }'
+        edges = self.execute(query, self.users[0])['completeBillsConnection']['edges']
+        dates = [edge['node']['datePaid'] for edge in edges]
+
+        self.assertEqual(len(dates), BillCycle.objects.filter(is_paid=True).count())
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    @override_settings(GRAPHQL_LEGACY_LIST_FIELDS=False)
+    def test_legacy_list_fields_can_be_switched_off(self):
+        request = RequestFactory().post('/graphql/')
+        request.user = self.users[0]
+        result = schema.execute('{ completeTasks { id } }', context_value=request)
+
+        self.assertIn('completeTasksConnection', str(result.errors[0]))
+
+
+
+'''----------------------------CACHE----------------------------'''
+
+class ResponseCacheTests(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.household, self.users = seed_household(3)
+
+    def test_repeated_household_query_is_served_from_cache(self):
+        first = self.post(TASKS_PAGE, self.users[0])
+        second = self.post(TASKS_PAGE, self.users[0])
+
+        self.assertEqual(first, second)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_mutation_invalidates_household(self):
+        self.post(TASKS_PAGE, self.users[0])
+        task = self.household.tasks.get(name='Task 0')
+        mutation = 'mutation ($id: Int!) { updateTask(taskData: {taskId: $id, name: "Dishes"}) { task { name } } }'
+        self.post(mutation, self.users[1], {'id': task.id})
+
+        mine, _ = self.post(TASKS_PAGE, self.users[0])['data']['tasks']
+        self.assertEqual(mine[0]['name'], 'Dishes')
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    def test_other_households_stay_cached(self):
+        _, strangers = seed_household(2, name='Other')
+        self.post(TASKS_PAGE, strangers[0])
+        self.household.tasks.create(name='New', description='chore', due_date='2020-01-01', frequency='W1')
+        self.post(TASKS_PAGE, strangers[0])
+
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_cache_is_per_user(self):
+        self.post(TASKS_PAGE, self.users[0])
+        mine, _ = self.post(TASKS_PAGE, self.users[1])['data']['tasks']
+
+        self.assertEqual(mine[0]['name'], 'Task 1')
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    def test_data_mentioning_errors_is_cached(self):
+        self.household.tasks.filter(name='Task 0').update(name='errors')
+        first = self.post(TASKS_PAGE, self.users[0])
+        second = self.post(TASKS_PAGE, self.users[0])
+
+        self.assertEqual(first['data']['tasks'][0][0]['name'], 'errors')
+        self.assertEqual(first, second)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_responses_with_errors_are_not_cached(self):
+        query = '{ tasks { name } completeTasksConnection(after: "nope") { edges { cursor } } }'
+        self.assertIn('errors', self.post(query, self.users[0]))
+        self.post(query, self.users[0])
+
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    def test_global_fields_are_not_cached(self):
+        self.post('{ households { name } }', self.users[0])
+        self.post('{ households { name } }', self.users[0])
+
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 0})
+
+
+
+'''----------------------------PERSISTED QUERIES----------------------------'''
+
+def persisted(sha):
+    return {'persistedQuery': {'version': 1, 'sha256Hash': sha}}
+
+
+class PersistedQueryTests(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        self.household, self.users = seed_household(2)
+
+    def test_registered_query_is_sent_by_hash(self):
+        import os
+        from django.conf import settings
+        with open(os.path.join(settings.GRAPHQL_PERSISTED_QUERIES_DIR, 'homepage.graphql')) as f:
+            sha = query_hash(f.read())
+
+        data = self.post(None, self.users[0], extensions=persisted(sha))['data']['homepage']
+        self.assertEqual(data[0], {'name': 'Home'})
+
+    def test_unknown_hash_asks_for_the_query(self):
+        result = self.post(None, self.users[0], extensions=persisted('0' * 64))
+        self.assertEqual(result['errors'][0]['message'], 'PersistedQueryNotFound')
+
+    def test_query_sent_with_hash_is_registered(self):
+        query = '{ me { firstName lastName } }'
+        self.post(query, self.users[0], extensions=persisted(query_hash(query)))
+
+        result = self.post(None, self.users[0], extensions=persisted(query_hash(query)))
+        self.assertEqual(result['data']['me']['lastName'], 'Last0')
+
+    def test_mismatched_hash_is_rejected(self):
+        result = self.post('{ me { id } }', self.users[0], extensions=persisted('0' * 64))
+        self.assertIn('does not match', result['errors'][0]['message'])
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_STRICT=True)
+    def test_strict_mode_rejects_unregistered_queries(self):
+        query = '{ me { email } }'
+        result = self.post(query, self.users[0], extensions=persisted(query_hash(query)))
+        self.assertIn('not a persisted query', result['errors'][0]['message'])
+
+        result = self.post(None, self.users[0], extensions=persisted(query_hash(query)))
+        self.assertEqual(result['errors'][0]['message'], 'PersistedQueryNotFound')
+
+
+
+'''----------------------------DOCUMENT CACHE----------------------------'''
+
+class DocumentCacheTests(GraphQLTestCase):
+    def test_view_reuses_parsed_documents(self):
+        _, users = seed_household(2)
+        documents = get_document_cache()
+        documents.clear()
+
+        self.post('{ households { id name } }', users[0])
+        self.post('{ households { id name } }', users[0])
+
+        # parsed once; every later lookup (cache check, execution) is a hit
+        self.assertEqual(documents.stats()['misses'], 1)
+        self.assertGreater(documents.stats()['hit_ratio'], 0.5)
+
+    def test_least_recently_used_document_is_evicted(self):
+        backend = DocumentCacheBackend(max_size=2)
+        for query in ('{ me { id } }', '{ users { id } }', '{ me { id } }', '{ households { id } }'):
+            backend.document_from_string(schema, query)
+
+        self.assertEqual([q for _, q in backend.documents], ['{ me { id } }', '{ households { id } }'])
+
+    def test_invalid_documents_are_not_cached(self):
+        backend = DocumentCacheBackend()
+        document = backend.document_from_string(schema, '{ nope }')
+
+        self.assertTrue(document.execute().invalid)
+        self.assertEqual(backend.stats()['size'], 0)
+
+
+
+'''----------------------------COST----------------------------'''
+
+FAN_OUT = '{ households { users { current { rotation { participants { id } } } } } }'
+
+
+class QueryCostTests(GraphQLTestCase):
+    def cost(self, query):
+        from graphql.language.parser import parse
+        return CostAnalyzer(schema, parse(query)).analyze()[None]
+
+    def test_list_cardinality_multiplies_nested_cost(self):
+        # 100 users, each with one household
+        self.assertEqual(self.cost('{ users { id household { name } } }').cost, 100 * (1 + 1))
+        # 20 edges of the requested page, each with a node and its roommate
+        self.assertEqual(self.cost('{ completeTasksConnection(first: 20) { edges { node { roommate { id } } } } }').cost,
+                         1 + 20 * (1 + 1 + 1))
+
+    def test_explicit_page_sizes_are_costed_as_given(self):
+        page = '{ completeTasksConnection(%s) { edges { node { id } } } }'
+        self.assertEqual(self.cost(page % 'first: 0').cost, 1)
+        self.assertEqual(self.cost(page % 'first: 0, last: 5').cost, 1)
+        self.assertEqual(self.cost(page % 'first: 10, last: 3').cost, 1 + 3 * (1 + 1))
+
+    def test_fan_out_is_rejected_before_execution(self):
+        _, users = seed_household(2)
+        documents = get_document_cache()
+        documents.clear()
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            result = self.post(FAN_OUT, users[0])
+
+        self.assertIn('estimated cost', result['errors'][0]['message'])
+        self.assertFalse(any('users_task' in q['sql'] for q in ctx.captured_queries))
+
+    @override_settings(GRAPHQL_MAX_DEPTH=2)
+    def test_depth_limit(self):
+        _, users = seed_household(2)
+        get_document_cache().clear()
+
+        result = self.post('{ me { household { users { id } } } }', users[0])
+        self.assertIn('3 levels deep', result['errors'][0]['message'])
+
+    def test_client_queries_are_within_budget(self):
+        from django.conf import settings
+        from .persisted import get_registry
+
+        for document in get_registry(schema).by_hash.values():
+            for cost in document.costs.values():
+                self.assertLessEqual(cost.cost, settings.GRAPHQL_MAX_COST)
+
+    def test_cost_is_recorded_for_logging(self):
+        _, users = seed_household(2)
+        with self.assertLogs('users.cost', 'INFO') as logs:
+            self.post('query Tasks { tasks { id } }', users[0], operationName='Tasks')
+        self.assertEqual(logs.output, ['INFO:users.cost:operation=Tasks cost=50 depth=1'])
+
+
+
+'''----------------------------EXPORT----------------------------'''
+
+class ExportTests(GraphQLTestCase):
+    def export(self, path, user=None):
+        from graphql_jwt.shortcuts import get_token
+        headers = {'HTTP_AUTHORIZATION': 'JWT ' + get_token(user)} if user else {}
+        return self.client.get(path, **headers)
+
+    def test_history_streams_in_date_order(self):
+        household, users = seed_household(3)
+        seed_household(2, name='Other')
+        response = self.export('/export/tasks/', users[0])
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,name,roommate_id,roommate_first_name,roommate_last_name')
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['Task 0', 'Task 1', 'Task 2'])
+
+        response = self.export('/export/bills/?format=ndjson', users[0])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), BillCycle.objects.filter(bill__household=household, is_paid=True).count())
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row['date_paid'], row['id'])))
+        self.assertEqual(rows[0]['amount'], '10.00')
+
+    def test_requires_a_token(self):
+        seed_household(1)
+        self.assertEqual(self.export('/export/tasks/').status_code, 401)
+
+    @override_settings(EXPORT_CHUNK_SIZE=100)
+    def test_memory_stays_flat_as_history_grows(self):
+        import tracemalloc
+
+        def peak(user):
+            response = self.export('/export/bills/', user)
+            tracemalloc.start()
+            rows = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return rows, peak
+
+        small, small_users = seed_household(2, name='Small')
+        seed_history(small, small_users, 1000)
+        large, large_users = seed_household(2, name='Large')
+        seed_history(large, large_users, 20000)
+
+        small_rows, small_peak = peak(small_users[0])
+        large_rows, large_peak = peak(large_users[0])
+        self.assertEqual(large_rows - small_rows, 19000)
+        # twenty times the rows, about the same memory: one chunk is held at a time
+        self.assertLess(large_peak, small_peak * 1.5)
+
+
+
+'''----------------------------ARCHIVE----------------------------'''
+
+HISTORY_PAGE = '''
+query ($after: String) {
+  completeTasksConnection(first: 40, after: $after) {
+    edges { node { id date roommate { firstName } } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+'''
+
+
+class ArchiveTests(GraphQLTestCase):
+    def setUp(self):
+        self.household, self.users = seed_household(3)
+        seed_history(self.household, self.users, 100)
+
+    def archive(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('archive_history', before='01032019', batch_size=30, stdout=out)
+        return out.getvalue()
+
+    def history(self, query):
+        ids, after = [], None
+        while True:
+            page = self.execute(query, self.users[0], {'after': after})['completeTasksConnection']
+            ids.extend(edge['node']['id'] for edge in page['edges'])
+            if not page['pageInfo']['hasNextPage']:
+                return ids
+            after = page['pageInfo']['endCursor']
+
+    def test_old_rows_move_in_batches(self):
+        from datetime import date
+        from .models import ArchivedCompleteTask, ArchivedBillCycle
+
+        old = CompleteTask.objects.filter(date__lt=date(2019, 3, 1)).count()
+        self.assertIn('Archived {} complete tasks'.format(old), self.archive())
+        self.assertEqual(ArchivedCompleteTask.objects.count(), old)
+        self.assertEqual(ArchivedBillCycle.objects.count(), old)
+        self.assertFalse(CompleteTask.objects.filter(date__lt=date(2019, 3, 1)).exists())
+        self.assertIn('Archived 0 complete tasks, 0 paid cycles', self.archive())
+
+    def test_history_reads_continue_into_the_archive(self):
+        before = self.history(HISTORY_PAGE)
+        self.archive()
+        self.assertEqual(self.history(HISTORY_PAGE), before)
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.execute(HISTORY_PAGE, self.users[0])
+        # the newest page is all live rows
+        self.assertFalse(any('archived' in q['sql'] for q in ctx.captured_queries))
+
+        cycles = self.execute('{ completeBills(limit: 100) { id datePaid } }', self.users[0])['completeBills']
+        self.assertEqual(len(cycles), 100)
+
+    def test_export_includes_the_archive(self):
+        total = CompleteTask.objects.count()
+        self.archive()
+        from graphql_jwt.shortcuts import get_token
+        response = self.client.get('/export/tasks/', HTTP_AUTHORIZATION='JWT ' + get_token(self.users[0]))
+        lines = b''.join(response.streaming_content).decode().splitlines()[1:]
+        self.assertEqual(len(lines), total)
+        self.assertEqual(lines, sorted(lines, key=lambda line: line.split(',')[1]))
+
+
+
+'''----------------------------DATABASE----------------------------'''
+
+class DatabaseTests(TestCase):
+    def test_sqlite_connections_are_tuned(self):
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+
+'''----------------------------METRICS----------------------------'''
+
+class MetricsTests(GraphQLTestCase):
+    def setUp(self):
+        from .metrics import REGISTRY
+        for histogram in REGISTRY:
+            histogram.clear()
+        _, self.users = seed_household(3)
+        cache.clear()
+
+    def test_metrics_attribute_every_query_to_a_resolver(self):
+        self.post('query Page { tasks { name rotation { firstName } } }', self.users[0], operationName='Page')
+        metrics = self.client.get('/metrics/').content.decode().splitlines()
+
+        self.assertIn('graphql_resolver_duration_seconds_count{field="Query.tasks"} 1', metrics)
+        self.assertIn('graphql_resolver_sql_queries_sum{field="Query.tasks"} 2', metrics)
+        self.assertIn('graphql_resolver_sql_queries_sum{field="loader.task_rotation"} 1', metrics)
+        self.assertIn('graphql_resolver_result_size_sum{field="TaskType.rotation"} 9', metrics)
+        self.assertIn('graphql_operation_sql_queries_sum{type="query",operation="Page"} 3', metrics)
+
+    def test_metrics_count_cache_lookups(self):
+        reset_cache_stats()
+        get_document_cache().clear()
+        for _ in range(2):
+            self.post('{ tasks { name } }', self.users[0])
+        metrics = self.client.get('/metrics/').content.decode().splitlines()
+
+        self.assertIn('# TYPE graphql_response_cache_lookups_total counter', metrics)
+        self.assertIn('graphql_response_cache_lookups_total{result="hit"} 1', metrics)
+        self.assertIn('graphql_response_cache_lookups_total{result="miss"} 1', metrics)
+        self.assertIn('graphql_document_cache_lookups_total{result="miss"} 1', metrics)
+
+    @override_settings(GRAPHQL_TRACING=True)
+    def test_tracing_extension(self):
+        result = self.post('{ tasks { name current { firstName } } }', self.users[0])
+        resolvers = result['extensions']['tracing']['execution']['resolvers']
+
+        tasks = next(r for r in resolvers if r['path'] == ['tasks'])
+        self.assertEqual((tasks['parentType'], tasks['returnType'], tasks['sqlQueries']), ('Query', '[[TaskType]]', 2))
+        self.assertIn(['tasks', 0, 0, 'current'], [r['path'] for r in resolvers])
+
+    @override_settings(GRAPHQL_SLOW_OPERATION_SECONDS=0)
+    def test_slow_operations_are_logged(self):
+        with self.assertLogs('users.metrics', 'WARNING') as logs:
+            self.post('query Page { tasks { name } }', self.users[0], operationName='Page')
+        self.assertIn('slow operation=Page type=query', logs.output[0])
+        self.assertIn('Query.tasks', logs.output[0])
+
+
+
+'''----------------------------REPLICA----------------------------'''
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(GraphQLTestCase):
+    def test_router_follows_the_read_alias(self):
+        from .routers import ReplicaRouter, reading_from
+        router = ReplicaRouter()
+
+        with reading_from('replica'):
+            self.assertEqual(router.db_for_read(Task), 'replica')
+            self.assertEqual(router.db_for_write(Task), 'default')
+        self.assertIsNone(router.db_for_read(Task))
+
+    def test_household_reads_its_writes_from_the_primary(self):
+        from .routers import read_alias
+        _, users = seed_household(2)
+        cache.clear()
+
+        self.assertEqual(read_alias(users[0], 'query'), 'replica')
+        self.assertIsNone(read_alias(users[0], 'mutation'))
+
+        self.post('mutation { updateTask(taskData: {taskId: %d, complete: true}) { task { id } } }'
+                  % Task.objects.filter(household=users[0].household).first().id, users[0])
+        self.assertIsNone(read_alias(users[0], 'query'))
+        self.assertIsNone(read_alias(users[1], 'query'))
+
+
+
+'''----------------------------INDEXES----------------------------'''
+
+class ExplainQueriesTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('explain_queries', size=3, stdout=out)
+        self.assertIn('All hot queries use an index', out.getvalue())
+
+
+
+'''----------------------------BENCHMARK----------------------------'''
+
+class BenchmarkTests(TestCase):
+    def benchmark(self, *scenarios, **options):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('benchmark', *scenarios, roommates=3, tasks=2, bills=3, history=10, iterations=4,
+                     warmup=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_runs_scenarios_and_checks_baseline(self):
+        import os
+        import tempfile
+        from django.core.management import CommandError
+        from .benchmark.report import load_baseline
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            out = self.benchmark('tasks', 'payBillCycle', baseline=path, save_baseline=True)
+            self.assertIn('payBillCycle', out)
+            results = load_baseline(path)['client']['results']
+            self.assertEqual(results['tasks']['errors'], 0)
+            self.assertEqual(results['payBillCycle']['errors'], 0)
+            self.assertGreater(results['tasks']['queries'], 0)
+
+            self.assertIn('No regressions', self.benchmark('tasks', baseline=path, check=True, tolerance=100))
+            # a query count above the baseline is a regression wherever it runs
+            baseline = load_baseline(path)
+            baseline['client']['results']['tasks']['queries'] -= 1
+            with open(path, 'w') as f:
+                json.dump(baseline, f)
+            with self.assertRaises(CommandError):
+                self.benchmark('tasks', baseline=path, check=True, tolerance=100)
+
+
+
+'''----------------------------AUTHENTICATION----------------------------'''
+
+class TokenCacheTests(GraphQLTestCase):
+    def setUp(self):
+        from .auth import get_token_cache
+        get_token_cache().clear()
+        self.household, self.users = seed_household(2)
+        for user in self.users:
+            user.set_password('password')
+            user.save()
+
+    def authenticate(self, token, queries):
+        from .auth import get_user_by_token
+        with self.assertNumQueries(queries):
+            return get_user_by_token(token)
+
+    def test_snapshot_until_user_changes(self):
+        from graphql_jwt.shortcuts import get_token
+        user = self.users[0]
+        token = get_token(user)
+        self.assertEqual(self.authenticate(token, 1), user)
+        self.assertEqual(self.authenticate(token, 0).first_name, user.first_name)
+
+        self.execute('mutation { updateUser(userData: {status: "away"}) { user { id } } }',
+                     self.authenticate(token, 0))
+        self.assertEqual(self.authenticate(token, 1).status, 'away')
+
+        self.execute('mutation ($email: String!) { deleteUser(email: $email) { ok } }',
+                     self.authenticate(token, 0), {'email': user.email})
+        self.assertIsNone(self.authenticate(token, 1))
+
+    def test_update_keeps_last_login(self):
+        from .models import User
+        user = self.users[0]
+        User.objects.filter(id=user.id).update(last_login='2019-01-01T00:00:00Z')
+        user.refresh_from_db()
+        self.execute('mutation { updateUser(userData: {status: "home"}) { user { id } } }', user)
+        user.refresh_from_db()
+        self.assertEqual((user.status, user.last_login.year), ('home', 2019))
+
+    @override_settings(JWT_HOUSEHOLD_CLAIM=True)
+    def test_household_claim(self):
+        from .auth import get_token_cache
+        from graphql_jwt.utils import get_payload
+        user = self.users[0]
+        data = self.execute('mutation ($email: String!) { tokenAuth(email: $email, password: "password") { token } }',
+                            user, {'email': user.email})
+        token = data['tokenAuth']['token']
+        self.assertEqual(get_payload(token)['household_id'], self.household.id)
+
+        # a process that has not seen the token yet
+        get_token_cache().clear()
+        claimed = self.authenticate(token, 0)
+        self.assertEqual((claimed.id, claimed.household_id), (user.id, self.household.id))
+
+        self.execute('mutation { createHousehold(name: "Elsewhere") { household { id } } }', user)
+        get_token_cache().clear()
+        moved = self.authenticate(token, 1)
+        self.assertNotEqual(moved.household_id, self.household.id)
+        self.assertEqual(moved.household_id, user.household_id)
+
+    @override_settings(JWT_HOUSEHOLD_CLAIM=True)
+    def test_household_claim_loads_no_fields_of_me(self):
+        from .auth import get_user_by_token, get_token_cache
+        user = self.users[0]
+        data = self.execute('mutation ($email: String!) { tokenAuth(email: $email, password: "password") { token } }',
+                            user, {'email': user.email})
+        token = data['tokenAuth']['token']
+
+        get_token_cache().clear()
+        with self.assertNumQueries(0):
+            claimed = get_user_by_token(token)
+            me = self.execute('{ me { firstName lastName status } }', claimed)['me']
+        self.assertEqual(me, {'firstName': user.first_name, 'lastName': user.last_name, 'status': user.status})
+        # and the token is now in this process's cache
+        self.assertIsNotNone(get_token_cache().get(token))
+
+
+
+'''----------------------------EXECUTOR----------------------------'''
+
+class RootFieldExecutorTests(TransactionTestCase):
+    def test_root_fields_resolve_in_pool(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .executor import RootFieldExecutor
+        from .metrics import measure_operation
+        from .management.commands.benchmark_executor import combined_query
+
+        household, users = seed_household(3)
+        request = RequestFactory().post('/graphql/')
+        request.user = users[0]
+        query = combined_query(['me', 'homepage', 'tasks', 'bills'])
+        pool = ThreadPoolExecutor(1, thread_name_prefix='graphql-test')
+        threads = set()
+        try:
+            runs = {}
+            # twice each: the first runs open the connections and load the user's household
+            for name, options in 2 * [('serial', {}), ('pool', {'executor': RootFieldExecutor(pool)})]:
+                with measure_operation('query', name) as operation:
+                    result = schema.execute(query, context_value=request, middleware=[ThreadRecorder(threads)],
+                                            **options)
+                self.assertIsNone(result.errors, result.errors)
+                runs[name] = (result.data, operation.queries)
+            self.assertEqual(runs['serial'], runs['pool'])
+            self.assertTrue(any(name.startswith('graphql-test') for name in threads))
+        finally:
+            pool.shutdown()
+
+    def test_serial_unless_threads_are_configured(self):
+        from .executor import get_executor
+        self.assertIsNone(get_executor())
+
+
+class ThreadRecorder(object):
+    def __init__(self, threads):
+        self.threads = threads
+
+    def resolve(self, next, root, info, **args):
+        if len(info.path) == 1:
+            self.threads.add(threading.current_thread().name)
+        return next(root, info, **args)
+
+
+
+'''----------------------------EVENTS----------------------------'''
+
+class EventsTests(TransactionTestCase):
+    def setUp(self):
+        from .auth import get_token_cache
+        from .events import get_broker, QueueSubscriber
+        # flushing the database between tests leaves the snapshots of deleted users behind
+        get_token_cache().clear()
+        self.household, self.users = seed_household(2)
+        self.task = Task.objects.filter(household=self.household).first()
+        self.broker, self.subscriber = get_broker(), QueueSubscriber()
+        self.broker.subscribe(self.household.id, self.subscriber)
+        self.addCleanup(self.broker.unsubscribe, self.household.id, self.subscriber)
+
+    def message(self, frame):
+        return json.loads(frame.decode().split('data: ', 1)[1])
+
+    def test_commit_publishes_one_compact_message(self):
+        request = RequestFactory().post('/graphql/')
+        request.user = self.users[0]
+        query = 'mutation ($id: Int!) { updateTask(taskData: {taskId: $id, complete: true}) { task { dueDate } } }'
+        result = schema.execute(query, context_value=request, variables={'id': self.task.id})
+        self.assertIsNone(result.errors, result.errors)
+
+        changes = self.message(self.subscriber.get(1))['changes']
+        self.assertIsNone(self.subscriber.get(0))
+        task = next(c for c in changes if c['type'] == 'task')
+        self.assertEqual(task['op'], 'update')
+        self.assertEqual(task['fields']['dueDate'], str(next_due_date(self.task.due_date, self.task.frequency)))
+        self.assertEqual([c['op'] for c in changes if c['type'] == 'completeTask'], ['create'])
+        self.assertEqual(len([c for c in changes if c['type'] == 'task']), 1)
+
+    def test_rollback_publishes_nothing(self):
+        from django.db import transaction
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.task.name = 'Renamed'
+            self.task.save()
+            raise ValueError
+        self.assertIsNone(self.subscriber.get(0))
+
+    def test_resume_replays_missed_messages(self):
+        from .events import LocalBroker, QueueSubscriber, RESET
+        broker = LocalBroker(history_size=2)
+        for i in range(3):
+            broker.publish(1, json.dumps({'changes': [i]}))
+        subscriber = QueueSubscriber()
+        broker.subscribe(1, subscriber, last_id=1)
+        self.assertEqual([self.message(subscriber.get(0))['changes'] for _ in range(2)], [[1], [2]])
+
+        broker.subscribe(1, subscriber, last_id=0)  # message 1 is gone
+        self.assertEqual(subscriber.get(0), RESET)
+
+    def test_archiving_publishes_nothing(self):
+        from datetime import date
+        from .archive import archive_history
+        seed_history(self.household, self.users, 10)
+        while self.subscriber.get(0) is not None:
+            pass  # the history's bill
+
+        moved = archive_history(date(2019, 3, 1))
+        self.assertTrue(moved['complete tasks'] and moved['paid cycles'])
+        self.assertIsNone(self.subscriber.get(0))
+
+    def test_wsgi_view_is_off_by_default(self):
+        from graphql_jwt.shortcuts import get_token
+        response = self.client.get('/events/', HTTP_AUTHORIZATION='JWT ' + get_token(self.users[0]))
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(self.broker.subscribers[self.household.id] - {self.subscriber})
+
+    @override_settings(EVENTS_WSGI_STREAMS=True)
+    def test_view_streams_changes(self):
+        from graphql_jwt.shortcuts import get_token
+        response = self.client.get('/events/', HTTP_AUTHORIZATION='JWT ' + get_token(self.users[0]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = iter(response.streaming_content)
+        self.assertEqual(next(frames), b'retry: 5000\n\n')
+
+        Task.objects.get(id=self.task.id).delete()
+        changes = self.message(next(frames))['changes']
+        self.assertIn({'type': 'task', 'op': 'delete', 'id': self.task.id}, changes)
+        response.close()
+        self.assertEqual(len(self.broker.subscribers[self.household.id]), 1)
+
+        self.assertEqual(self.client.get('/events/').status_code, 401)
+
+    def test_asgi_feed_ends_on_disconnect(self):
+        import asyncio
+        from graphql_jwt.shortcuts import get_token
+        from .events import events_application
+
+        loop, sent, disconnect = asyncio.new_event_loop(), [], threading.Event()
+        self.addCleanup(loop.close)
+        token = get_token(self.users[0]).encode()
+
+        async def receive():
+            await loop.run_in_executor(None, disconnect.wait)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message.get('body', b'').startswith(b'id: '):
+                disconnect.set()
+            elif message.get('body') == b'retry: 5000\n\n':
+                # published from another thread, like a request served by WsgiToAsgi
+                await loop.run_in_executor(None, self.rename_task)
+
+        app = events_application(None)
+        scope = {'type': 'http', 'path': '/events/', 'headers': [(b'authorization', b'JWT ' + token)]}
+        loop.run_until_complete(asyncio.wait_for(app(scope, receive, send), 5))
+
+        self.assertEqual(sent[0]['status'], 200)
+        changes = self.message(sent[-1]['body'])['changes']
+        self.assertEqual(changes[0]['fields']['name'], 'Renamed')
+        self.assertEqual(len(self.broker.subscribers[self.household.id]), 1)
+
+    def test_fanout_benchmark(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('benchmark_events', subscribers=5, messages=3, stdout=out)
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()[1:]], ['async', 'threads'])
+
+    def rename_task(self):
+        from django.db import connection
+        self.task.name = 'Renamed'
+        self.task.save()
+        connection.close()
+
+
+
+'''----------------------------PROJECTION----------------------------'''
+
+PROJECTED_QUERIES = [
+    HOUSEHOLD_GRAPH,
+    TASKS_PAGE,
+    BALANCES,
+    '{ usersConnection(first: 2) { edges { cursor node { firstName household { name } } } } }',
+    '''{ completeTasksConnection(first: 5) { edges { cursor node { ...Done } } } }
+       fragment Done on CompleteTaskType { name roommate { firstName } }''',
+    '{ completeBillsConnection(first: 5) { edges { cursor node { amount bill { name cycles { isPaid } } } } } }',
+    '{ completeBills { datePaid bill { name } recipient { ... on UserType { firstName } } } }',
+]
+
+
+class ProjectionTests(GraphQLTestCase):
+    def capture(self, query, user):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.execute(query, user)
+        return data, [q['sql'] for q in ctx.captured_queries]
+
+    def test_results_match_unprojected_queries(self):
+        _, users = seed_household(3)
+        for query in PROJECTED_QUERIES:
+            data, queries = self.capture(query, users[0])
+            with override_settings(GRAPHQL_FIELD_PROJECTION=False):
+                expected, expected_queries = self.capture(query, users[0])
+            self.assertEqual(data, expected, query)
+            self.assertLessEqual(len(queries), len(expected_queries), query)
+
+    def test_lists_load_only_selected_columns(self):
+        _, users = seed_household(2)
+        _, queries = self.capture('{ users { firstName } }', users[0])
+        self.assertIn('"first_name"', queries[0])
+        self.assertNotIn('"password"', queries[0])
+
+        # BalanceType.net reads columns that are not selected
+        _, queries = self.capture('{ balances { net } }', users[0])
+        self.assertIn('"owed"', queries[0])
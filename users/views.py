@@ -1,3 +1,230 @@
-from django.shortcuts import render
+import json
+import logging
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBadRequest
+from django.views.decorators.http import require_GET
+from graphene_django.views import GraphQLView, HttpError
+from graphql.language import ast
+
+from .cache import HOUSEHOLD_FIELDS, response_key, get_response, set_response
+from .cost import operation_cost
+from .documents import get_document_cache
+from .events import event_stream, parse_last_id
+from .executor import get_executor
+from .export import HISTORY, FORMATS, export_history
+from .persisted import PersistedQueryBackend, get_registry, query_hash
+from .routers import read_alias, reading_from
+from .metrics import measure_operation, render_metrics, tracing
+
+logger = logging.getLogger('users.cost')
+
+
+class RoomGraphQLView(GraphQLView):
+    '''GraphQL endpoint serving household-scoped reads from a versioned cache.
+
+    Query operations that only select household-scoped root fields (see
+    users.cache.HOUSEHOLD_FIELDS) are cached per household, user and
+    query. Any write to a household bumps its version, which orphans
+    every cached response of that household.
+
+    Clients may also send the sha256 of a persisted query instead of its
+    text, following the automatic persisted query protocol:
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": ...}}}.
+    Other queries are parsed and validated once and then served from an
+    LRU document cache (see users.documents).
+
+    Queries over the cost or depth limits are rejected before execution.
+    The estimated cost of each executed operation is set on the request as
+    `graphql_cost` and logged to the `users.cost` logger.
+
+    Query operations read from the replica database when one is configured,
+    unless their household was written to moments ago (see users.routers).
+
+    Each operation is measured by users.metrics: with GRAPHQL_TRACING on, the
+    response carries its resolver timings in `extensions.tracing`.
+
+    The root fields of a query resolve concurrently in a thread pool (see
+    users.executor) when GRAPHQL_ROOT_FIELD_THREADS is set.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(RoomGraphQLView, self).__init__(*args, **kwargs)
+        if kwargs.get('executor') is None:
+            self.executor = get_executor()
+        if kwargs.get('backend') is None:
+            self.backend = PersistedQueryBackend(
+                get_registry(self.schema),
+                strict=getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_STRICT', False),
+                backend=get_document_cache(),
+            )
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super(RoomGraphQLView, self).get_graphql_params(request, data)
+        sha = self.get_persisted_hash(request, data)
+        if sha is None:
+            return query, variables, operation_name, id
+
+        registry = get_registry(self.schema)
+        if query:
+            if query_hash(query) != sha:
+                raise HttpError(HttpResponseBadRequest('provided sha does not match query'))
+            if not getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_STRICT', False):
+                registry.register_automatic(query)
+        else:
+            document = registry.get(sha)
+            if document is None:
+                # tells the client to retry with the full query text
+                raise HttpError(HttpResponse(), 'PersistedQueryNotFound')
+            query = document.document_string
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def get_persisted_hash(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        if not isinstance(extensions, dict):
+            return None
+        persisted = extensions.get('persistedQuery') or {}
+        return persisted.get('sha256Hash')
+
+    def get_response(self, request, data, show_graphiql=False):
+        key = self.get_cache_key(request, data, show_graphiql)
+        if key is None:
+            return super(RoomGraphQLView, self).get_response(request, data, show_graphiql)
+
+        cached = get_response(key)
+        if cached is not None:
+            return cached, 200
+
+        result, status_code = super(RoomGraphQLView, self).get_response(request, data, show_graphiql)
+        failed = request.__dict__.pop('graphql_failed', True)
+        tracing_on = getattr(settings, 'GRAPHQL_TRACING', False)
+        if status_code == 200 and result is not None and not failed and not tracing_on:
+            set_response(key, result)
+        return result, status_code
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        document = self.get_document(request, query) if query and not show_graphiql else None
+        if document is None:
+            result = super(RoomGraphQLView, self).execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql)
+        else:
+            self.record_cost(request, document, operation_name)
+            operation_type = document.get_operation_type(operation_name)
+            with reading_from(read_alias(getattr(request, 'user', None), operation_type)):
+                with measure_operation(operation_type, operation_name) as operation:
+                    result = super(RoomGraphQLView, self).execute_graphql_request(
+                        request, data, query, variables, operation_name, show_graphiql)
+            if getattr(settings, 'GRAPHQL_TRACING', False):
+                request.graphql_tracing = tracing(operation)
+        # responses with errors are not cached (see get_response)
+        request.graphql_failed = result is None or bool(result.errors)
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        trace = request.__dict__.pop('graphql_tracing', None)
+        if trace is not None:
+            d = dict(d, extensions={'tracing': trace})
+        return super(RoomGraphQLView, self).json_encode(request, d, pretty)
+
+    def get_document(self, request, query):
+        try:
+            return self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None  # let the normal path report the error
+
+    def record_cost(self, request, document, operation_name):
+        cost = operation_cost(document, operation_name)
+        if cost is None:
+            return
+        request.graphql_cost = cost
+        logger.info('operation=%s cost=%s depth=%s', operation_name or '-', cost.cost, cost.depth)
+
+    def get_cache_key(self, request, data, show_graphiql):
+        user = getattr(request, 'user', None)
+        if show_graphiql or self.batch or user is None or user.is_anonymous or user.household_id is None:
+            return None
+
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        if not query:
+            return None
+        document = self.get_document(request, query)
+        if document is None or not self.is_household_query(document.document_ast, operation_name):
+            return None
+        return response_key(user.household_id, user.id, query, variables, operation_name)
+
+    @staticmethod
+    def is_household_query(document_ast, operation_name):
+        operations = [
+            d for d in document_ast.definitions
+            if isinstance(d, ast.OperationDefinition)
+            and (operation_name is None or (d.name and d.name.value == operation_name))
+        ]
+        if len(operations) != 1 or operations[0].operation != 'query':
+            return False
+        selections = operations[0].selection_set.selections
+        return all(isinstance(s, ast.Field) and s.name.value in HOUSEHOLD_FIELDS for s in selections)
+
+
+
+@require_GET
+def export_view(request, kind):
+    '''Streams the completed task (`tasks`) or paid cycle (`bills`) history of the user's household.
+
+    Authenticated like /graphql/: the JWT middleware sets the user from the
+    `Authorization: JWT <token>` header. `?format=` is `csv` (default) or `ndjson`.
+    '''
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous:
+        return JsonResponse({'errors': [{'message': 'You do not have permission to perform this action'}]}, status=401)
+    if user.household_id is None:
+        return JsonResponse({'errors': [{'message': 'User is not in a household'}]}, status=404)
+    format = request.GET.get('format', 'csv')
+    if kind not in HISTORY or format not in FORMATS:
+        return HttpResponseBadRequest('Unknown export {}.{}'.format(kind, format))
+
+    response = StreamingHttpResponse(export_history(user.household_id, kind, format), content_type=FORMATS[format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(kind, format)
+    return response
+
+
+@require_GET
+def events_view(request):
+    '''Streams the changes of the user's household as server-sent events.
+
+    Each `changes` event lists the rows created, updated or deleted by one
+    committed transaction (see users.events); a `reset` event means changes
+    were missed and the client should refetch. Clients resume with the
+    Last-Event-ID header.
+
+    Feeds are meant to be served by room_graphql_api.asgi, from the event
+    loop. Here every open feed holds a WSGI worker until the client leaves,
+    so this view answers 501 unless EVENTS_WSGI_STREAMS is on.
+    '''
+    if not getattr(settings, 'EVENTS_WSGI_STREAMS', False):
+        return JsonResponse({'errors': [{'message': 'Change feeds are served by the ASGI application'}]},
+                            status=501)
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous:
+        return JsonResponse({'errors': [{'message': 'You do not have permission to perform this action'}]}, status=401)
+    if user.household_id is None:
+        return JsonResponse({'errors': [{'message': 'User is not in a household'}]}, status=404)
+
+    response = StreamingHttpResponse(
+        event_stream(user.household_id, parse_last_id(request.META.get('HTTP_LAST_EVENT_ID'))),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise hold events back in its buffers
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    '''Resolver and operation histograms and cache counters of this process, for Prometheus to scrape.'''
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')